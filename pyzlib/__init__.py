@@ -29,6 +29,24 @@ class z_stream(ctypes.Structure):
     ]
 
 
+class gz_header(ctypes.Structure):
+    _fields_ = [
+        ("text", ctypes.c_int),
+        ("time", ctypes.c_ulong),
+        ("xflags", ctypes.c_int),
+        ("os", ctypes.c_int),
+        ("extra", ctypes.c_char_p),
+        ("extra_len", ctypes.c_uint),
+        ("extra_max", ctypes.c_uint),
+        ("name", ctypes.c_char_p),
+        ("name_max", ctypes.c_uint),
+        ("comment", ctypes.c_char_p),
+        ("comm_max", ctypes.c_uint),
+        ("hcrc", ctypes.c_int),
+        ("done", ctypes.c_int),
+    ]
+
+
 Z_NO_FLUSH = 0
 Z_PARTIAL_FLUSH = 1
 Z_SYNC_FLUSH = 2
@@ -67,6 +85,10 @@ Z_DEFLATED = 8
 
 Z_NULL = None
 
+MAX_MEM_LEVEL = 9
+MAX_WBITS = 15
+DEF_MEM_LEVEL = 8
+
 _zlib_name = ctypes.util.find_library("z")
 if _zlib_name is None:
     raise Exception("Could not find zlib")
@@ -316,6 +338,17 @@ def deflatePrime(strm, bits, value):
     return _zlib.deflatePrime(ctypes.addressof(strm), bits, value)
 
 
+_zlib.deflateSetHeader.restype = ctypes.c_int
+_zlib.deflateSetHeader.argtypes = [
+    ctypes.c_void_p,  # strm
+    ctypes.c_void_p,  # head
+]
+
+
+def deflateSetHeader(strm, head):
+    return _zlib.deflateSetHeader(ctypes.addressof(strm), ctypes.addressof(head))
+
+
 _zlib.inflateInit2_.restype = ctypes.c_int
 _zlib.inflateInit2_.argtypes = [
     ctypes.c_void_p,  # strm
@@ -346,6 +379,22 @@ def inflateSetDictionary(strm, dictionary, dictLength):
     return _zlib.inflateSetDictionary(ctypes.addressof(strm), dictionary, dictLength)
 
 
+_zlib.inflateGetDictionary.restype = ctypes.c_int
+_zlib.inflateGetDictionary.argtypes = [
+    ctypes.c_void_p,  # strm
+    ctypes.c_void_p,  # dictionary
+    ctypes.c_void_p,  # dictLength
+]
+
+
+def inflateGetDictionary(strm, dictionary):
+    dict_length = _c_uint_wrapper()
+    ret = _zlib.inflateGetDictionary(
+        ctypes.addressof(strm), dictionary, ctypes.addressof(dict_length)
+    )
+    return ret, dict_length.v
+
+
 _zlib.inflateSync.restype = ctypes.c_int
 _zlib.inflateSync.argtypes = [
     ctypes.c_void_p,
@@ -410,6 +459,38 @@ def inflateMark(strm):
     return _zlib.inflateMark(ctypes.addressof(strm))
 
 
+_zlib.inflateValidate.restype = ctypes.c_int
+_zlib.inflateValidate.argtypes = [
+    ctypes.c_void_p,  # strm
+    ctypes.c_int,  # check
+]
+
+
+def inflateValidate(strm, check):
+    return _zlib.inflateValidate(ctypes.addressof(strm), check)
+
+
+_zlib.inflateCodesUsed.restype = ctypes.c_ulong
+_zlib.inflateCodesUsed.argtypes = [
+    ctypes.c_void_p,  # strm
+]
+
+
+def inflateCodesUsed(strm):
+    return _zlib.inflateCodesUsed(ctypes.addressof(strm))
+
+
+_zlib.inflateGetHeader.restype = ctypes.c_int
+_zlib.inflateGetHeader.argtypes = [
+    ctypes.c_void_p,  # strm
+    ctypes.c_void_p,  # head
+]
+
+
+def inflateGetHeader(strm, head):
+    return _zlib.inflateGetHeader(ctypes.addressof(strm), ctypes.addressof(head))
+
+
 _zlib.zlibCompileFlags.restype = ctypes.c_ulong
 _zlib.zlibCompileFlags.argtypes = []
 
@@ -507,3 +588,51 @@ _zlib.inflateSyncPoint.argtypes = [
 
 def inflateSyncPoint(strm):
     return _zlib.inflateSyncPoint(ctypes.addressof(strm))
+
+
+_zlib.adler32.restype = ctypes.c_ulong
+_zlib.adler32.argtypes = [
+    ctypes.c_ulong,  # adler
+    ctypes.c_void_p,  # buf
+    ctypes.c_uint,  # len
+]
+
+
+def adler32(adler, buf, len):
+    return _zlib.adler32(adler, buf, len)
+
+
+_zlib.crc32.restype = ctypes.c_ulong
+_zlib.crc32.argtypes = [
+    ctypes.c_ulong,  # crc
+    ctypes.c_void_p,  # buf
+    ctypes.c_uint,  # len
+]
+
+
+def crc32(crc, buf, len):
+    return _zlib.crc32(crc, buf, len)
+
+
+_zlib.adler32_combine.restype = ctypes.c_ulong
+_zlib.adler32_combine.argtypes = [
+    ctypes.c_ulong,  # adler1
+    ctypes.c_ulong,  # adler2
+    ctypes.c_long,  # len2
+]
+
+
+def adler32_combine(adler1, adler2, len2):
+    return _zlib.adler32_combine(adler1, adler2, len2)
+
+
+_zlib.crc32_combine.restype = ctypes.c_ulong
+_zlib.crc32_combine.argtypes = [
+    ctypes.c_ulong,  # crc1
+    ctypes.c_ulong,  # crc2
+    ctypes.c_long,  # len2
+]
+
+
+def crc32_combine(crc1, crc2, len2):
+    return _zlib.crc32_combine(crc1, crc2, len2)
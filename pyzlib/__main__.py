@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+import argparse
+import collections
+import concurrent.futures
+import mmap
+import os
+import stat
+import sys
+import time
+
+import pyzlib
+from pyzlib import _buffer, corpus, framing, gzmember, stream
+
+FORMATS = ("gzip", "zlib", "raw")
+STRATEGIES = {
+    "default": pyzlib.Z_DEFAULT_STRATEGY,
+    "filtered": pyzlib.Z_FILTERED,
+    "huffman": pyzlib.Z_HUFFMAN_ONLY,
+    "rle": pyzlib.Z_RLE,
+    "fixed": pyzlib.Z_FIXED,
+}
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+# Parallel compression ends every block with Z_SYNC_FLUSH and the stream
+# with an empty final fixed block
+_SYNC_FLUSH_SLACK = 16
+_FINAL_BLOCK = b"\x03\x00"
+# avail_in and avail_out are unsigned ints
+_MAX_AVAIL = 1 << 30
+
+
+def _window_bits(format, bits):
+    if format == "raw":
+        return -bits
+    if format == "gzip":
+        return bits + 16
+    if format == "zlib":
+        return bits
+    # Either zlib or gzip, detected from the header
+    return bits + 32
+
+
+class _Input(object):
+    # A regular file is mapped and inflated or deflated in place. Anything
+    # else, e.g. a pipe, is read into reused buffers.
+    def __init__(self, source):
+        self.fp = None
+        self.mm = None
+        self.data = None
+        # Bytes yielded by blocks()
+        self.size = 0
+        if not isinstance(source, str):
+            self.data = memoryview(source).cast("B")
+            return
+        if source == "-":
+            self.fp = open(sys.stdin.fileno(), "rb", buffering=0, closefd=False)
+        else:
+            self.fp = open(source, "rb", buffering=0)
+        try:
+            st = os.fstat(self.fp.fileno())
+            if stat.S_ISREG(st.st_mode):
+                if st.st_size == 0:
+                    self.data = memoryview(b"")
+                else:
+                    self.mm = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+                    self.data = memoryview(self.mm)
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.data is not None:
+            self.data.release()
+            self.data = None
+        if self.mm is not None:
+            try:
+                self.mm.close()
+            except BufferError:
+                # Blocks referenced by an exception that is being raised;
+                # the mapping goes away with them
+                pass
+            self.mm = None
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+    def _readinto(self, view):
+        # Fills view unless the input ends; pipes return short reads
+        pos = 0
+        while pos < len(view):
+            n = self.fp.readinto(view[pos:])
+            if not n:
+                break
+            pos += n
+        return pos
+
+    def blocks(self, size, nbuffers=1):
+        # Yields memoryviews of at most size bytes. Views of a stream cycle
+        # through nbuffers buffers, so a view is overwritten nbuffers blocks
+        # later.
+        if self.data is not None:
+            for pos in range(0, len(self.data), size):
+                block = self.data[pos : pos + size]
+                self.size += len(block)
+                yield block
+            return
+        views = [memoryview(bytearray(size)) for _ in range(nbuffers)]
+        i = 0
+        while True:
+            n = self._readinto(views[i])
+            if n == 0:
+                return
+            self.size += n
+            yield views[i][:n]
+            i = (i + 1) % nbuffers
+
+
+class _Output(object):
+    # Output goes to write() straight from the buffer that zlib fills
+    def __init__(self, write, buffer_size):
+        self._write = write
+        self.buf = bytearray(buffer_size)
+        self.view = memoryview(self.buf)
+        self.addr = _buffer.addressof(self.buf)
+        self.size = 0
+
+    def write(self, data):
+        self.size += _buffer.nbytes(data)
+        self._write(data)
+
+
+def _fd_writer(fd):
+    def write(data):
+        view = memoryview(data).cast("B")
+        while view:
+            view = view[os.write(fd, view) :]
+
+    return write
+
+
+def _discard(data):
+    pass
+
+
+def _pump(func, strm, data, flush, out):
+    # Feeds data to deflate() or inflate(). Returns the size of the input
+    # left after the end of the stream, or None if the stream has not ended.
+    addr = _buffer.addressof(data)
+    size = _buffer.nbytes(data)
+    while True:
+        avail_in = min(size, _MAX_AVAIL)
+        strm.next_in = addr
+        strm.avail_in = avail_in
+        strm.next_out = out.addr
+        strm.avail_out = len(out.buf)
+        err = func(strm, flush if avail_in == size else pyzlib.Z_NO_FLUSH)
+        strm.next_in = None
+        strm.next_out = None
+        consumed = avail_in - strm.avail_in
+        addr += consumed
+        size -= consumed
+        n = len(out.buf) - strm.avail_out
+        if n != 0:
+            out.write(out.view[:n])
+        if err == pyzlib.Z_STREAM_END:
+            return size
+        if err not in (pyzlib.Z_OK, pyzlib.Z_BUF_ERROR):
+            raise Exception("{}() failed with error {}".format(func.__name__, err))
+        if size == 0 and strm.avail_out != 0:
+            return None
+
+
+def compress(inp, out, format, level, strategy, window_bits, mem_level):
+    with stream.Deflater(
+        level=level,
+        window_bits=_window_bits(format, window_bits),
+        mem_level=mem_level,
+        strategy=strategy,
+    ) as deflater:
+        for block in inp.blocks(len(out.buf)):
+            _pump(pyzlib.deflate, deflater.strm, block, pyzlib.Z_NO_FLUSH, out)
+        _pump(pyzlib.deflate, deflater.strm, b"", pyzlib.Z_FINISH, out)
+
+
+def _compress_block(
+    block, dictionary, checksum, level, strategy, window_bits, mem_level
+):
+    # Runs on the pool. The block is primed with the end of the previous one
+    # and ends on a byte boundary, so the outputs can be concatenated.
+    with stream.Deflater(
+        level=level,
+        window_bits=-window_bits,
+        mem_level=mem_level,
+        strategy=strategy,
+    ) as deflater:
+        if dictionary is not None:
+            deflater.set_dictionary(dictionary)
+        size = len(block)
+        out = bytearray(deflater.bound(size) + _SYNC_FLUSH_SLACK)
+        strm = deflater.strm
+        strm.next_in = _buffer.addressof(block)
+        strm.avail_in = size
+        strm.next_out = _buffer.addressof(out)
+        strm.avail_out = len(out)
+        err = pyzlib.deflate(strm, pyzlib.Z_SYNC_FLUSH)
+        strm.next_in = None
+        strm.next_out = None
+        if err != pyzlib.Z_OK or strm.avail_in != 0 or strm.avail_out == 0:
+            raise Exception("deflate() failed with error {}".format(err))
+        n = len(out) - strm.avail_out
+    check = None
+    if checksum is not None:
+        check = checksum(checksum(0, None, 0), _buffer.addressof(block), size)
+    return memoryview(out)[:n], check, size
+
+
+def compress_parallel(
+    inp,
+    out,
+    format,
+    level,
+    strategy,
+    window_bits,
+    mem_level,
+    jobs,
+    block_size=DEFAULT_BLOCK_SIZE,
+):
+    # Splits the input into blocks that are compressed concurrently into a
+    # single stream, like pigz. Each block costs a few bytes and the history
+    # that crosses its start.
+    block_size = min(block_size, _MAX_AVAIL)
+    if format == "gzip":
+        checksum, combine = pyzlib.crc32, pyzlib.crc32_combine
+    elif format == "zlib":
+        checksum, combine = pyzlib.adler32, pyzlib.adler32_combine
+    else:
+        checksum = combine = None
+    check = None if checksum is None else checksum(0, None, 0)
+    size = 0
+    out.write(framing.header(_window_bits(format, window_bits), level, strategy))
+    window = 2 * jobs
+    pending = collections.deque()
+
+    def drain():
+        nonlocal check
+        zblock, block_check, n = pending.popleft().result()
+        out.write(zblock)
+        if combine is not None:
+            check = combine(check, block_check, n)
+
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        previous = None
+        # A buffer is reused once the block that was read into it and the
+        # block that uses its end as a dictionary are both done
+        for block in inp.blocks(block_size, window + 2):
+            while len(pending) >= window:
+                drain()
+            dictionary = None if previous is None else previous[-(1 << window_bits) :]
+            pending.append(
+                executor.submit(
+                    _compress_block,
+                    block,
+                    dictionary,
+                    checksum,
+                    level,
+                    strategy,
+                    window_bits,
+                    mem_level,
+                )
+            )
+            previous = block
+            size += len(block)
+        while pending:
+            drain()
+    out.write(_FINAL_BLOCK)
+    if format == "gzip":
+        out.write(framing.GZIP_TRAILER.pack(check, size & 0xFFFFFFFF))
+    elif format == "zlib":
+        out.write(framing.ZLIB_TRAILER.pack(check))
+
+
+def decompress(inp, out, format, window_bits, buffer_size):
+    # Concatenated gzip members are decompressed as one file
+    window_bits = _window_bits(format, window_bits)
+    with stream.Inflater(window_bits=window_bits) as inflater:
+        ended = False
+        for block in inp.blocks(buffer_size):
+            while len(block) != 0:
+                if ended:
+                    if window_bits <= 15:
+                        raise Exception("trailing garbage after stream")
+                    inflater.reset()
+                    ended = False
+                left = _pump(
+                    pyzlib.inflate, inflater.strm, block, pyzlib.Z_NO_FLUSH, out
+                )
+                if left is None:
+                    break
+                ended = True
+                block = block[len(block) - left :]
+        if not ended:
+            raise Exception("incomplete or truncated stream")
+
+
+def _bgzf_members(data):
+    # Members can be inflated concurrently only if they can be found without
+    # inflating them, i.e. if their headers carry their sizes
+    try:
+        fields, _ = gzmember.parse_header(data)
+    except Exception:
+        return None
+    if gzmember._member_size(fields) is None:
+        return None
+    return gzmember.walk(data)
+
+
+def _inflate_member(data, member):
+    start = member.offset + member.header_size
+    end = member.offset + member.size - gzmember.MEMBER_TRAILER.size
+    result = bytearray(member.isize)
+    if stream.decompress_into(data[start:end], result, stream.WB_RAW) != 0:
+        raise Exception("trailing garbage in member at offset {}".format(member.offset))
+    if pyzlib.crc32(0, _buffer.addressof(result), len(result)) != member.crc:
+        raise Exception("crc mismatch in member at offset {}".format(member.offset))
+    return result
+
+
+def decompress_parallel(inp, out, format, window_bits, buffer_size, jobs):
+    # Only BGZF files can be split; everything else is inflated serially
+    members = None
+    if inp.data is not None and format in ("gzip", None):
+        members = _bgzf_members(inp.data)
+    if members is None:
+        return decompress(inp, out, format, window_bits, buffer_size)
+    pending = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        for member in members:
+            if len(pending) >= 2 * jobs:
+                out.write(pending.popleft().result())
+            pending.append(executor.submit(_inflate_member, inp.data, member))
+        while pending:
+            out.write(pending.popleft().result())
+
+
+def _open_output(path):
+    if path == "-":
+        return sys.stdout.fileno(), False
+    return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666), True
+
+
+def _compress_command(args):
+    fd, own = _open_output(args.output)
+    try:
+        with _Input(args.input) as inp:
+            out = _Output(_fd_writer(fd), args.buffer_size)
+            _run_compress(inp, out, args)
+    finally:
+        if own:
+            os.close(fd)
+
+
+def _run_compress(inp, out, args):
+    options = (
+        args.format or "gzip",
+        args.level,
+        STRATEGIES[args.strategy],
+        args.window_bits,
+        args.mem_level,
+    )
+    if args.jobs > 1:
+        compress_parallel(inp, out, *options, args.jobs, args.block_size)
+    else:
+        compress(inp, out, *options)
+
+
+def _run_decompress(inp, out, args):
+    if args.jobs > 1:
+        decompress_parallel(
+            inp, out, args.format, args.window_bits, args.buffer_size, args.jobs
+        )
+    else:
+        decompress(inp, out, args.format, args.window_bits, args.buffer_size)
+
+
+def _decompress_command(args):
+    fd, own = _open_output(args.output)
+    try:
+        with _Input(args.input) as inp:
+            _run_decompress(inp, _Output(_fd_writer(fd), args.buffer_size), args)
+    finally:
+        if own:
+            os.close(fd)
+
+
+def _test_command(args):
+    status = 0
+    for path in args.inputs:
+        try:
+            with _Input(path) as inp:
+                _run_decompress(inp, _Output(_discard, args.buffer_size), args)
+        except Exception as e:
+            print("{}: {}".format(path, e), file=sys.stderr)
+            status = 1
+    return status
+
+
+def _list_command(args):
+    print(
+        "{:>14} {:>14} {:>7}  {}".format("compressed", "uncompressed", "ratio", "name")
+    )
+    for path in args.inputs:
+        with _Input(path) as inp:
+            out = _Output(_discard, args.buffer_size)
+            _run_decompress(inp, out, args)
+            # Parallel decompression does not go through blocks()
+            size = inp.size if inp.data is None else len(inp.data)
+        print(
+            "{:>14} {:>14} {:>7.4f}  {}".format(
+                size, out.size, size / out.size if out.size else 0, path
+            )
+        )
+
+
+def _bench_command(args):
+    if args.input is None:
+        data = corpus.generate(args.kind, args.size)
+    else:
+        with open(args.input, "rb") as fp:
+            data = fp.read()
+    args.format = args.format or "gzip"
+    chunks = []
+    with _Input(data) as inp:
+        out = _Output(lambda view: chunks.append(bytes(view)), args.buffer_size)
+        t0 = time.perf_counter()
+        _run_compress(inp, out, args)
+        t1 = time.perf_counter()
+    zdata = b"".join(chunks)
+    with _Input(zdata) as inp:
+        out = _Output(_discard, args.buffer_size)
+        t2 = time.perf_counter()
+        _run_decompress(inp, out, args)
+        t3 = time.perf_counter()
+    if out.size != len(data):
+        raise Exception("benchmark data does not round-trip")
+    print(
+        "compress   {:8.1f} MB/s, ratio {:.4f}".format(
+            len(data) / (t1 - t0) / 1e6, len(zdata) / max(len(data), 1)
+        )
+    )
+    print("decompress {:8.1f} MB/s".format(len(data) / (t3 - t2) / 1e6))
+
+
+def _add_compression_options(parser):
+    parser.add_argument("-l", "--level", type=int, default=pyzlib.Z_DEFAULT_COMPRESSION)
+    parser.add_argument(
+        "-s", "--strategy", choices=sorted(STRATEGIES), default="default"
+    )
+    parser.add_argument("-m", "--mem-level", type=int, default=pyzlib.DEF_MEM_LEVEL)
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE)
+
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "-f",
+        "--format",
+        choices=FORMATS,
+        help="zlib or gzip is detected when decompressing",
+    )
+    common.add_argument("-w", "--window-bits", type=int, default=pyzlib.MAX_WBITS)
+    common.add_argument(
+        "-b", "--buffer-size", type=int, default=stream.DEFAULT_BUFFER_SIZE
+    )
+    common.add_argument("-p", "--jobs", type=int, default=1)
+    parser = argparse.ArgumentParser(
+        prog="python -m pyzlib",
+        description="Compress and decompress zlib, gzip and raw deflate data",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    parser_compress = commands.add_parser("compress", parents=[common])
+    parser_compress.add_argument("input", nargs="?", default="-")
+    parser_compress.add_argument("-o", "--output", default="-")
+    _add_compression_options(parser_compress)
+    parser_compress.set_defaults(func=_compress_command)
+    parser_decompress = commands.add_parser("decompress", parents=[common])
+    parser_decompress.add_argument("input", nargs="?", default="-")
+    parser_decompress.add_argument("-o", "--output", default="-")
+    parser_decompress.set_defaults(func=_decompress_command)
+    parser_test = commands.add_parser("test", parents=[common])
+    parser_test.add_argument("inputs", nargs="+")
+    parser_test.set_defaults(func=_test_command)
+    parser_list = commands.add_parser("list", parents=[common])
+    parser_list.add_argument("inputs", nargs="+")
+    parser_list.set_defaults(func=_list_command)
+    parser_bench = commands.add_parser("bench", parents=[common])
+    parser_bench.add_argument("input", nargs="?")
+    parser_bench.add_argument(
+        "-k", "--kind", choices=sorted(corpus.KINDS), default="log"
+    )
+    parser_bench.add_argument("--size", type=int, default=64 * 1024 * 1024)
+    _add_compression_options(parser_bench)
+    parser_bench.set_defaults(func=_bench_command)
+    args = parser.parse_args()
+    if args.buffer_size <= 0 or args.jobs <= 0:
+        parser.error("buffer size and jobs must be positive")
+    try:
+        return args.func(args)
+    except Exception as e:
+        print("pyzlib: {}".format(e), file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+import ctypes
+
+
+class _Py_buffer(ctypes.Structure):
+    _fields_ = [
+        ("buf", ctypes.c_void_p),
+        ("obj", ctypes.py_object),
+        ("len", ctypes.c_ssize_t),
+        ("itemsize", ctypes.c_ssize_t),
+        ("readonly", ctypes.c_int),
+        ("ndim", ctypes.c_int),
+        ("format", ctypes.c_char_p),
+        ("shape", ctypes.POINTER(ctypes.c_ssize_t)),
+        ("strides", ctypes.POINTER(ctypes.c_ssize_t)),
+        ("suboffsets", ctypes.POINTER(ctypes.c_ssize_t)),
+        ("internal", ctypes.c_void_p),
+    ]
+
+
+_PyBUF_SIMPLE = 0
+
+_PyObject_GetBuffer = ctypes.pythonapi.PyObject_GetBuffer
+_PyObject_GetBuffer.restype = ctypes.c_int
+_PyObject_GetBuffer.argtypes = [
+    ctypes.py_object,
+    ctypes.POINTER(_Py_buffer),
+    ctypes.c_int,
+]
+_PyBuffer_Release = ctypes.pythonapi.PyBuffer_Release
+_PyBuffer_Release.restype = None
+_PyBuffer_Release.argtypes = [ctypes.POINTER(_Py_buffer)]
+
+
+def addressof(buf, offset=0):
+    if isinstance(buf, bytes):
+        return ctypes.cast(ctypes.c_char_p(buf), ctypes.c_void_p).value + offset
+    if isinstance(buf, ctypes.Array):
+        return ctypes.addressof(buf) + offset
+    # Unlike c_char.from_buffer(), this works with read-only buffers, such
+    # as memoryviews of bytes and mmaps opened with ACCESS_READ. The address
+    # stays valid for as long as the caller keeps buf alive and unresized.
+    view = _Py_buffer()
+    _PyObject_GetBuffer(buf, ctypes.byref(view), _PyBUF_SIMPLE)
+    try:
+        return (view.buf or 0) + offset
+    finally:
+        _PyBuffer_Release(ctypes.byref(view))
+
+
+def nbytes(buf):
+    if isinstance(buf, (bytes, bytearray)):
+        return len(buf)
+    return memoryview(buf).nbytes
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+import argparse
+import collections
+import math
+import sys
+import time
+
+import pyzlib
+from pyzlib import corpus, stream
+
+DEFAULT_CHUNK_SIZE = 16 * 1024
+# The sample is made of this many slices spread over the chunk and is
+# 1/SAMPLE_FRACTION of it, but not smaller than MIN_SAMPLE_SIZE
+SAMPLE_SLICES = 4
+SAMPLE_FRACTION = 16
+MIN_SAMPLE_SIZE = 1024
+
+STORED = "stored"
+HUFFMAN_ONLY = "huffman_only"
+RLE = "rle"
+FILTERED = "filtered"
+DEFAULT = "default"
+CHOICES = (STORED, HUFFMAN_ONLY, RLE, FILTERED, DEFAULT)
+
+_STRATEGIES = {
+    HUFFMAN_ONLY: pyzlib.Z_HUFFMAN_ONLY,
+    RLE: pyzlib.Z_RLE,
+    FILTERED: pyzlib.Z_FILTERED,
+}
+
+
+def entropy(sample):
+    # Order-0 entropy in bits per byte
+    n = len(sample)
+    if n == 0:
+        return 0.0
+    log2 = math.log2
+    return -sum(c / n * log2(c / n) for c in collections.Counter(sample).values())
+
+
+def run_fraction(sample):
+    # Fraction of bytes equal to their predecessor. XOR-ing the sample with
+    # itself shifted by one byte turns every such pair into a zero byte.
+    n = len(sample)
+    if n < 2:
+        return 0.0
+    x = int.from_bytes(sample[:-1], "little") ^ int.from_bytes(sample[1:], "little")
+    return x.to_bytes(n - 1, "little").count(0) / (n - 1)
+
+
+def classify(sample, lz_ratio):
+    # lz_ratio is the ratio of the sample compressed at level 1, i.e. what
+    # cheap matching achieves. Comparing it with the order-0 entropy, which
+    # is roughly what Huffman coding alone achieves, tells whether looking
+    # for matches is worth the CPU.
+    if not sample:
+        return DEFAULT
+    huffman_ratio = entropy(sample) / 8
+    if lz_ratio >= 0.97:
+        # Incompressible, e.g. already compressed or encrypted
+        return STORED
+    if run_fraction(sample) >= 0.9:
+        return RLE
+    if lz_ratio > huffman_ratio + 0.02:
+        # Matches do not help
+        return HUFFMAN_ONLY
+    if 0.6 <= huffman_ratio <= 0.8 and lz_ratio < 0.7 * huffman_ratio:
+        # Many long matches between noisy literals, e.g. logs: skipping
+        # short matches is both faster and denser
+        return FILTERED
+    return DEFAULT
+
+
+class AdaptiveDeflater(stream.Deflater):
+    # Picks the level and the strategy for each chunk of input based on a
+    # sample and switches to them with deflateParams() before compressing
+    # the chunk. Every switch ends the current deflate block.
+    def __init__(
+        self,
+        level=pyzlib.Z_DEFAULT_COMPRESSION,
+        window_bits=stream.WB_ZLIB,
+        mem_level=pyzlib.DEF_MEM_LEVEL,
+        dictionary=None,
+        buffer_size=stream.DEFAULT_BUFFER_SIZE,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+    ):
+        super().__init__(
+            level=level,
+            window_bits=window_bits,
+            mem_level=mem_level,
+            dictionary=dictionary,
+            buffer_size=buffer_size,
+        )
+        self.base_level = level
+        self.chunk_size = chunk_size
+        self.sample_size = max(MIN_SAMPLE_SIZE, chunk_size // SAMPLE_FRACTION)
+        # Raw deflate has no header and trailer to skew small sample ratios
+        self.sampler = stream.Deflater(
+            level=1,
+            window_bits=stream.WB_RAW,
+            buffer_size=self.sample_size * 2,
+        )
+        # {choice: [chunks, bytes]}
+        self.choices = {choice: [0, 0] for choice in CHOICES}
+        self.switches = 0
+
+    def close(self):
+        super().close()
+        sampler = getattr(self, "sampler", None)
+        if sampler is not None:
+            sampler.close()
+
+    def _sample(self, chunk):
+        n = len(chunk)
+        if n <= self.sample_size:
+            return bytes(chunk)
+        step = n // SAMPLE_SLICES
+        size = self.sample_size // SAMPLE_SLICES
+        return b"".join(chunk[i * step : i * step + size] for i in range(SAMPLE_SLICES))
+
+    def choose(self, chunk):
+        sample = self._sample(chunk)
+        if not sample:
+            return DEFAULT
+        self.sampler.reset()
+        lz_ratio = len(self.sampler.compress(sample, pyzlib.Z_FINISH)) / len(sample)
+        return classify(sample, lz_ratio)
+
+    @stream.exclusive
+    def compress_to(self, write, data, flush=pyzlib.Z_NO_FLUSH):
+        view = memoryview(data).cast("B")
+        size = len(view)
+        if size == 0:
+            super().compress_to(write, data, flush)
+            return
+        for start in range(0, size, self.chunk_size):
+            chunk = view[start : start + self.chunk_size]
+            choice = self.choose(chunk)
+            if choice == STORED:
+                level, strategy = 0, pyzlib.Z_DEFAULT_STRATEGY
+            else:
+                level = self.base_level
+                strategy = _STRATEGIES.get(choice, pyzlib.Z_DEFAULT_STRATEGY)
+            if (level, strategy) != (self.level, self.strategy):
+                self.switches += 1
+                out = self.params(level, strategy)
+                if out:
+                    write(out)
+            stats = self.choices[choice]
+            stats[0] += 1
+            stats[1] += len(chunk)
+            last = start + self.chunk_size >= size
+            super().compress_to(write, chunk, flush if last else pyzlib.Z_NO_FLUSH)
+
+    def report(self):
+        return {
+            "chunks": {choice: stats[0] for choice, stats in self.choices.items()},
+            "bytes": {choice: stats[1] for choice, stats in self.choices.items()},
+            "switches": self.switches,
+        }
+
+
+def _measure(deflater, data):
+    chunks = []
+    t0 = time.perf_counter()
+    deflater.compress_to(chunks.append, data, pyzlib.Z_FINISH)
+    elapsed = time.perf_counter() - t0
+    return sum(len(chunk) for chunk in chunks), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare adaptive and fixed strategy compression"
+    )
+    parser.add_argument("-k", "--kind", choices=sorted(corpus.KINDS), default="mix")
+    parser.add_argument("-s", "--size", type=int, default=16 * 1024 * 1024)
+    parser.add_argument("-l", "--level", type=int, default=-1)
+    parser.add_argument("-c", "--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+    data = corpus.generate(args.kind, args.size)
+    with stream.Deflater(level=args.level) as deflater:
+        fixed = _measure(deflater, data)
+    with AdaptiveDeflater(level=args.level, chunk_size=args.chunk_size) as deflater:
+        adaptive = _measure(deflater, data)
+        report = deflater.report()
+    for name, (zsize, elapsed) in (("fixed", fixed), ("adaptive", adaptive)):
+        print(
+            "{:<9}ratio {:.4f} {:8.1f} MB/s".format(
+                name, zsize / len(data), len(data) / elapsed / 1e6
+            )
+        )
+    for choice in CHOICES:
+        print(
+            "{:<13}{:>8} chunks {:>12} bytes".format(
+                choice, report["chunks"][choice], report["bytes"][choice]
+            )
+        )
+    print("switches: {}".format(report["switches"]))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import sys
+import time
+
+import pyzlib
+from pyzlib import _buffer, corpus, stream
+
+# Chunks up to this size are compressed or decompressed on the event loop;
+# larger ones go to the executor, which costs a thread handoff but keeps
+# the loop responsive
+DEFAULT_INLINE_SIZE = 64 * 1024
+# The most output a single decompression step produces
+DEFAULT_CHUNK_SIZE = 256 * 1024
+# A read returns what the transport has buffered, up to this size, so
+# reads are small and inline while the peer is slow, and large and
+# offloaded while it is fast
+DEFAULT_READ_SIZE = 256 * 1024
+
+
+async def _offload(owner, func, *args):
+    # Runs func on owner's executor. If the caller is cancelled, func keeps
+    # running, and owner.offloaded tells _close_later() to wait for it.
+    owner.offloaded = asyncio.get_running_loop().run_in_executor(
+        owner.executor, func, *args
+    )
+    return await asyncio.shield(owner.offloaded)
+
+
+def _close_later(owner, zstream):
+    # Frees zstream once the executor is done with it
+    if owner.offloaded is None or owner.offloaded.done():
+        zstream.close()
+    else:
+        owner.offloaded.add_done_callback(lambda _: zstream.close())
+
+
+class CompressingWriter(object):
+    # Compresses data written to an asyncio.StreamWriter.
+    #
+    # Writes are compressed in the order in which they are made, even if
+    # some of them run on the executor. drain() ends the data written so
+    # far with Z_SYNC_FLUSH, so the peer can decompress all of it, and
+    # waits for the transport. close() finishes the stream. After a write is
+    # cancelled, the output is incomplete, and the writer can only be
+    # aborted.
+    def __init__(
+        self,
+        writer,
+        level=pyzlib.Z_DEFAULT_COMPRESSION,
+        window_bits=stream.WB_ZLIB,
+        mem_level=pyzlib.DEF_MEM_LEVEL,
+        strategy=pyzlib.Z_DEFAULT_STRATEGY,
+        inline_size=DEFAULT_INLINE_SIZE,
+        executor=None,
+    ):
+        self.writer = writer
+        self.inline_size = inline_size
+        self.executor = executor
+        self.deflater = stream.Deflater(
+            level=level,
+            window_bits=window_bits,
+            mem_level=mem_level,
+            strategy=strategy,
+        )
+        self.lock = asyncio.Lock()
+        self.offloaded = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            await self.close()
+        else:
+            self.abort()
+
+    async def _compress(self, data, flush):
+        if _buffer.nbytes(data) <= self.inline_size:
+            self.deflater.compress_to(self.writer.write, data, flush)
+            return
+        # StreamWriter is not thread-safe, so the output is written here
+        chunks = []
+        await _offload(self, self.deflater.compress_to, chunks.append, data, flush)
+        self.writer.writelines(chunks)
+
+    async def write(self, data):
+        # data must not change until this returns
+        async with self.lock:
+            await self._compress(data, pyzlib.Z_NO_FLUSH)
+
+    async def flush(self, flush=pyzlib.Z_SYNC_FLUSH):
+        async with self.lock:
+            await self._compress(b"", flush)
+
+    async def drain(self):
+        await self.flush()
+        await self.writer.drain()
+
+    async def close(self):
+        async with self.lock:
+            if self.deflater is None:
+                return
+            try:
+                await self._compress(b"", pyzlib.Z_FINISH)
+            finally:
+                self.deflater.close()
+                self.deflater = None
+            await self.writer.drain()
+            self.writer.close()
+            await self.writer.wait_closed()
+
+    def abort(self):
+        # Frees the stream without finishing it
+        if self.deflater is not None:
+            _close_later(self, self.deflater)
+            self.deflater = None
+        self.writer.close()
+
+
+class DecompressingReader(object):
+    # Decompresses data read from an asyncio.StreamReader.
+    #
+    # async for yields decompressed chunks of at most chunk_size bytes as
+    # they become available. Since the amount of output does not follow
+    # from the input, the first inline_size bytes of output of every read
+    # are produced on the event loop, and the rest on the executor.
+    # Concatenated gzip members are decompressed as one stream; anything
+    # that follows a zlib or raw stream is left in unused_data.
+    def __init__(
+        self,
+        reader,
+        window_bits=stream.WB_AUTO,
+        read_size=DEFAULT_READ_SIZE,
+        inline_size=DEFAULT_INLINE_SIZE,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        executor=None,
+    ):
+        self.reader = reader
+        self.window_bits = window_bits
+        self.read_size = read_size
+        self.inline_size = inline_size
+        self.chunk_size = chunk_size
+        self.executor = executor
+        self.inflater = stream.Inflater(window_bits=window_bits)
+        # Compressed data that has not been consumed starts at input_pos
+        self.input = b""
+        self.input_pos = 0
+        # The last step filled its output, so more might be pending
+        self.full = False
+        # Output that read() has not returned starts at pending_pos
+        self.pending = b""
+        self.pending_pos = 0
+        self.unused_data = b""
+        self.eof = False
+        self.offloaded = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.inflater is not None:
+            _close_later(self, self.inflater)
+            self.inflater = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await self.read_chunk()
+        if not chunk:
+            raise StopAsyncIteration
+        return chunk
+
+    def _inflate(self, size):
+        # Inflates the input into at most size bytes of output
+        inflater = self.inflater
+        strm = inflater.strm
+        out = bytearray(size)
+        avail_in = len(self.input) - self.input_pos
+        strm.next_in = _buffer.addressof(self.input, self.input_pos)
+        strm.avail_in = avail_in
+        strm.next_out = _buffer.addressof(out)
+        strm.avail_out = size
+        err = inflater._inflate(pyzlib.Z_NO_FLUSH)
+        strm.next_in = None
+        strm.next_out = None
+        self.input_pos += avail_in - strm.avail_in
+        self.full = strm.avail_out == 0
+        if err == pyzlib.Z_STREAM_END:
+            inflater.eof = True
+            self.full = False
+        elif err not in (pyzlib.Z_OK, pyzlib.Z_BUF_ERROR):
+            raise Exception("inflate() failed with error {}".format(err))
+        return bytes(memoryview(out)[: size - strm.avail_out])
+
+    async def read_chunk(self):
+        # Returns the next chunk of output, or b"" at the end
+        while not self.eof:
+            if self.full:
+                chunk = await _offload(self, self._inflate, self.chunk_size)
+            else:
+                if self.input_pos == len(self.input):
+                    data = await self.reader.read(self.read_size)
+                    if not data:
+                        raise Exception("incomplete or truncated stream")
+                    self.input, self.input_pos = data, 0
+                chunk = self._inflate(min(self.inline_size, self.chunk_size))
+            if self.inflater.eof:
+                if self.input_pos == len(self.input) or self.window_bits <= 15:
+                    self.unused_data = self.input[self.input_pos :]
+                    self.eof = True
+                else:
+                    # The next gzip member
+                    self.inflater.reset()
+            if chunk:
+                return chunk
+        return b""
+
+    async def read(self, n=-1):
+        # Returns up to n bytes, or everything up to the end if n < 0
+        if n < 0:
+            chunks = [self.pending[self.pending_pos :]]
+            self.pending, self.pending_pos = b"", 0
+            async for chunk in self:
+                chunks.append(chunk)
+            return b"".join(chunks)
+        if self.pending_pos == len(self.pending):
+            self.pending, self.pending_pos = await self.read_chunk(), 0
+        result = self.pending[self.pending_pos : self.pending_pos + n]
+        self.pending_pos += len(result)
+        return result
+
+
+class _NullWriter(object):
+    # A StreamWriter that discards what is written to it
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+    def writelines(self, data):
+        for chunk in data:
+            self.write(chunk)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+async def _lag(stop, interval=0.001):
+    # Returns the longest delay of a timer on the loop
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+    while not stop.is_set():
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        worst = max(worst, loop.time() - t0 - interval)
+    return worst
+
+
+async def _compress(data, chunk_size, level, inline_size, rate):
+    stop = asyncio.Event()
+    lag = asyncio.ensure_future(_lag(stop))
+    t0 = time.perf_counter()
+    async with CompressingWriter(
+        _NullWriter(), level, inline_size=inline_size
+    ) as writer:
+        view = memoryview(data)
+        for i in range(0, len(view), chunk_size):
+            await writer.write(view[i : i + chunk_size])
+            # Paces the producer at rate bytes per second
+            delay = t0 + (i + chunk_size) / rate - time.perf_counter()
+            await asyncio.sleep(max(delay, 0))
+        await writer.drain()
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    return len(data) / elapsed, await lag
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure event loop lag while compressing on it"
+    )
+    parser.add_argument("-k", "--kind", choices=sorted(corpus.KINDS), default="log")
+    parser.add_argument("-s", "--size", type=int, default=64 * 1024 * 1024)
+    parser.add_argument("-c", "--chunk-size", type=int, default=1024 * 1024)
+    parser.add_argument("-l", "--level", type=int, default=1)
+    parser.add_argument("-r", "--rate", type=float, default=100, help="MB/s")
+    args = parser.parse_args()
+    data = corpus.generate(args.kind, args.size)
+    for name, inline_size in (
+        ("inline", sys.maxsize),
+        ("offload", DEFAULT_INLINE_SIZE),
+    ):
+        rate, lag = asyncio.run(
+            _compress(data, args.chunk_size, args.level, inline_size, args.rate * 1e6)
+        )
+        print(
+            "{:<8}{:8.1f} MB/s, max loop lag {:8.3f} ms".format(
+                name, rate / 1e6, lag * 1e3
+            )
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import contextlib
+import ctypes
+import mmap
+import threading
+
+import pyzlib
+from pyzlib import _buffer
+
+CTYPES = "ctypes"
+BYTEARRAY = "bytearray"
+KINDS = (CTYPES, BYTEARRAY)
+
+# Sizes are rounded up to powers of two, starting with this one
+MIN_SIZE = 4096
+# How many free buffers of every kind and size class to keep
+DEFAULT_MAX_FREE = 8
+# ctypes buffers of at least this size are backed by anonymous mmaps, which
+# can be put on hugepages
+DEFAULT_MMAP_THRESHOLD = 2 * 1024 * 1024
+
+
+def size_class(size):
+    return max(MIN_SIZE, 1 << (size - 1).bit_length())
+
+
+class _FreeList(object):
+    __slots__ = ("lock", "buffers", "hits", "misses")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buffers = []
+        self.hits = 0
+        self.misses = 0
+
+
+class BufferPool(object):
+    # Recycles output buffers, so that they are neither zero-filled nor
+    # faulted in again on every operation. Buffers are at least as large as
+    # requested; callers must keep passing the requested size to zlib.
+    #
+    # Every kind and size class has its own lock, so that threads working
+    # with different sizes do not contend, with or without the GIL.
+    def __init__(
+        self,
+        max_free=DEFAULT_MAX_FREE,
+        mmap_threshold=DEFAULT_MMAP_THRESHOLD,
+        hugepages=True,
+    ):
+        self.max_free = max_free
+        self.mmap_threshold = mmap_threshold
+        self.hugepages = hugepages
+        # {(kind, size class): _FreeList}
+        self._free = {}
+        # Only taken to add a size class
+        self._lock = threading.Lock()
+
+    def _allocate(self, kind, size):
+        if kind == BYTEARRAY:
+            return bytearray(size)
+        if kind != CTYPES:
+            raise ValueError("unknown buffer kind {}".format(kind))
+        if self.mmap_threshold is None or size < self.mmap_threshold:
+            return (ctypes.c_char * size)()
+        mm = mmap.mmap(-1, size)
+        if self.hugepages and hasattr(mmap, "MADV_HUGEPAGE"):
+            try:
+                mm.madvise(mmap.MADV_HUGEPAGE)
+            except OSError:
+                # Transparent hugepages are disabled
+                pass
+        # The array keeps the mapping alive
+        return (ctypes.c_char * size).from_buffer(mm)
+
+    def _free_list(self, key):
+        free = self._free.get(key)
+        if free is None:
+            with self._lock:
+                free = self._free.setdefault(key, _FreeList())
+        return free
+
+    def get(self, size, kind=CTYPES):
+        if kind not in KINDS:
+            raise ValueError("unknown buffer kind {}".format(kind))
+        key = (kind, size_class(size))
+        free = self._free_list(key)
+        with free.lock:
+            if free.buffers:
+                free.hits += 1
+                return free.buffers.pop()
+            free.misses += 1
+        return self._allocate(kind, key[1])
+
+    def put(self, buf):
+        kind = BYTEARRAY if isinstance(buf, bytearray) else CTYPES
+        size = len(buf)
+        if size != size_class(size):
+            # Not ours, or a bytearray whose size has changed
+            return
+        free = self._free_list((kind, size))
+        with free.lock:
+            if len(free.buffers) < self.max_free:
+                free.buffers.append(buf)
+
+    @contextlib.contextmanager
+    def buffer(self, size, kind=CTYPES):
+        buf = self.get(size, kind)
+        try:
+            yield buf
+        finally:
+            self.put(buf)
+
+    def compress_buffer(self, source_len, kind=CTYPES):
+        # Large enough for compress() and compress2() output
+        return self.buffer(pyzlib.compressBound(source_len), kind)
+
+    def deflate_buffer(self, strm, source_len, kind=CTYPES):
+        # Large enough for the output of deflate(Z_FINISH) on a fresh strm
+        return self.buffer(pyzlib.deflateBound(strm, source_len), kind)
+
+    def _free_lists(self):
+        with self._lock:
+            return list(self._free.values())
+
+    def clear(self):
+        for free in self._free_lists():
+            with free.lock:
+                free.buffers.clear()
+
+    def stats(self):
+        result = {"hits": 0, "misses": 0, "free": 0}
+        for free in self._free_lists():
+            with free.lock:
+                result["hits"] += free.hits
+                result["misses"] += free.misses
+                result["free"] += len(free.buffers)
+        return result
+
+
+DEFAULT_POOL = BufferPool()
+
+
+def compress(data, level=pyzlib.Z_DEFAULT_COMPRESSION, pool=DEFAULT_POOL):
+    # compress2() into a pooled buffer
+    size = _buffer.nbytes(data)
+    with pool.compress_buffer(size) as dest:
+        err, dest_len = pyzlib.compress2(
+            dest, pyzlib.compressBound(size), _buffer.addressof(data), size, level
+        )
+        if err != pyzlib.Z_OK:
+            raise Exception("compress2() failed with error {}".format(err))
+        return dest[:dest_len]
+
+
+def uncompress(data, size, pool=DEFAULT_POOL):
+    # uncompress() into a pooled buffer; size is the uncompressed size
+    with pool.buffer(size) as dest:
+        err, dest_len = pyzlib.uncompress(
+            dest, size, _buffer.addressof(data), _buffer.nbytes(data)
+        )
+        if err != pyzlib.Z_OK:
+            raise Exception("uncompress() failed with error {}".format(err))
+        return dest[:dest_len]
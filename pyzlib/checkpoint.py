@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import struct
+import sys
+
+import pyzlib
+from pyzlib import _buffer, framing
+from pyzlib.stream import DEFAULT_BUFFER_SIZE, WB_GZIP, WB_RAW, WB_ZLIB, Deflater
+
+# The output is a single gzip, zlib or raw deflate stream. Internally it is
+# always produced by a raw deflater, and the header and the trailer are
+# written here, so that a resumed deflater does not emit a second header.
+#
+# Every checkpoint ends the data written so far with Z_FULL_FLUSH, syncs it
+# and then atomically replaces the checkpoint file, which records where
+# input and output stand, the running check value and the last window of
+# input. On resume, the output is truncated to the recorded offset, and the
+# window becomes the dictionary of the new raw deflater, so the data after
+# the checkpoint can still refer to the data before it.
+CHECKPOINT_MAGIC = b"PZCKPT01"
+# magic, input offset, output offset, check value, level, window bits,
+# mem level, strategy, window length
+CHECKPOINT_HEADER = struct.Struct("<8sQQIiiiiI")
+CHECKPOINT_TRAILER = struct.Struct("<I")
+DEFAULT_INTERVAL = 64 * 1024 * 1024
+
+
+def checkpoint_path(path):
+    return path + ".ckpt"
+
+
+def read_checkpoint(path):
+    # Returns None if there is no intact checkpoint
+    try:
+        with open(checkpoint_path(path), "rb") as fp:
+            data = fp.read()
+    except FileNotFoundError:
+        return None
+    if len(data) < CHECKPOINT_HEADER.size + CHECKPOINT_TRAILER.size:
+        return None
+    body = data[: -CHECKPOINT_TRAILER.size]
+    (crc,) = CHECKPOINT_TRAILER.unpack(data[-CHECKPOINT_TRAILER.size :])
+    if pyzlib.crc32(0, body, len(body)) != crc:
+        return None
+    fields = CHECKPOINT_HEADER.unpack(body[: CHECKPOINT_HEADER.size])
+    if fields[0] != CHECKPOINT_MAGIC:
+        return None
+    window = body[CHECKPOINT_HEADER.size :]
+    if len(window) != fields[8]:
+        return None
+    keys = (
+        "in_offset",
+        "out_offset",
+        "check",
+        "level",
+        "window_bits",
+        "mem_level",
+        "strategy",
+    )
+    checkpoint = dict(zip(keys, fields[1:8]))
+    checkpoint["window"] = window
+    return checkpoint
+
+
+class CheckpointDeflater(object):
+    # in_offset is how much input has been compressed. After resuming, the
+    # caller must continue feeding input from there.
+    def __init__(
+        self,
+        path,
+        level=pyzlib.Z_DEFAULT_COMPRESSION,
+        window_bits=WB_GZIP,
+        mem_level=pyzlib.DEF_MEM_LEVEL,
+        strategy=pyzlib.Z_DEFAULT_STRATEGY,
+        interval=DEFAULT_INTERVAL,
+        buffer_size=DEFAULT_BUFFER_SIZE,
+    ):
+        self.path = path
+        self.fp = None
+        self.deflater = None
+        self.level = level
+        self.window_bits = window_bits
+        self.mem_level = mem_level
+        self.strategy = strategy
+        self.interval = interval
+        if window_bits > 15:
+            self.format = WB_GZIP
+            raw_bits = window_bits - 16
+        elif window_bits > 0:
+            self.format = WB_ZLIB
+            raw_bits = window_bits
+        else:
+            self.format = WB_RAW
+            raw_bits = -window_bits
+        self.window_size = 1 << raw_bits
+        checkpoint = read_checkpoint(path)
+        if checkpoint is not None:
+            params = (level, window_bits, mem_level, strategy)
+            saved = tuple(
+                checkpoint[key]
+                for key in ("level", "window_bits", "mem_level", "strategy")
+            )
+            if params != saved:
+                raise Exception(
+                    "{} was checkpointed with different parameters {}".format(
+                        path, saved
+                    )
+                )
+            self.in_offset = checkpoint["in_offset"]
+            self.out_offset = checkpoint["out_offset"]
+            self.check = checkpoint["check"]
+            self.window = checkpoint["window"]
+            self.fp = open(path, "r+b")
+            self.fp.truncate(self.out_offset)
+            self.fp.seek(self.out_offset)
+            self.resumed = True
+        else:
+            self.in_offset = 0
+            self.check = pyzlib.crc32(0, None, 0)
+            if self.format == WB_ZLIB:
+                self.check = pyzlib.adler32(0, None, 0)
+            self.window = b""
+            self.fp = open(path, "wb")
+            self.fp.write(framing.header(window_bits, level, strategy))
+            self.out_offset = self.fp.tell()
+            self.resumed = False
+        self.deflater = Deflater(
+            level=level,
+            window_bits=-raw_bits,
+            mem_level=mem_level,
+            strategy=strategy,
+            dictionary=self.window or None,
+            buffer_size=buffer_size,
+        )
+        self.last_checkpoint = self.in_offset
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _update(self, data):
+        addr = _buffer.addressof(data)
+        size = _buffer.nbytes(data)
+        if self.format == WB_ZLIB:
+            self.check = pyzlib.adler32(self.check, addr, size)
+        else:
+            self.check = pyzlib.crc32(self.check, addr, size)
+        if size >= self.window_size:
+            self.window = bytes(memoryview(data).cast("B")[-self.window_size :])
+        else:
+            self.window = (self.window + bytes(data))[-self.window_size :]
+        self.in_offset += size
+
+    def write(self, data):
+        self.deflater.compress_to(self.fp.write, data)
+        self._update(data)
+        if self.in_offset - self.last_checkpoint >= self.interval:
+            self.checkpoint()
+
+    def checkpoint(self):
+        self.deflater.compress_to(self.fp.write, b"", pyzlib.Z_FULL_FLUSH)
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+        self.out_offset = self.fp.tell()
+        body = (
+            CHECKPOINT_HEADER.pack(
+                CHECKPOINT_MAGIC,
+                self.in_offset,
+                self.out_offset,
+                self.check,
+                self.level,
+                self.window_bits,
+                self.mem_level,
+                self.strategy,
+                len(self.window),
+            )
+            + self.window
+        )
+        tmp_path = checkpoint_path(self.path) + ".tmp"
+        with open(tmp_path, "wb") as fp:
+            fp.write(body)
+            fp.write(CHECKPOINT_TRAILER.pack(pyzlib.crc32(0, body, len(body))))
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, checkpoint_path(self.path))
+        self.last_checkpoint = self.in_offset
+
+    def finish(self):
+        self.deflater.compress_to(self.fp.write, b"", pyzlib.Z_FINISH)
+        if self.format == WB_GZIP:
+            self.fp.write(
+                framing.GZIP_TRAILER.pack(self.check, self.in_offset & 0xFFFFFFFF)
+            )
+        elif self.format == WB_ZLIB:
+            self.fp.write(framing.ZLIB_TRAILER.pack(self.check))
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+        self.close()
+        try:
+            os.unlink(checkpoint_path(self.path))
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        if self.deflater is not None:
+            self.deflater.close()
+            self.deflater = None
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+
+def compress_file(
+    src,
+    dst,
+    level=pyzlib.Z_DEFAULT_COMPRESSION,
+    window_bits=WB_GZIP,
+    interval=DEFAULT_INTERVAL,
+    buffer_size=DEFAULT_BUFFER_SIZE,
+):
+    # Compresses src to dst, resuming from the last checkpoint if there is
+    # one. Returns the input offset that compression started from.
+    with CheckpointDeflater(
+        dst, level=level, window_bits=window_bits, interval=interval
+    ) as deflater:
+        start = deflater.in_offset
+        with open(src, "rb") as fp:
+            fp.seek(start)
+            while True:
+                data = fp.read(buffer_size)
+                if not data:
+                    break
+                deflater.write(data)
+        deflater.finish()
+    return start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compress a file, resuming after a crash"
+    )
+    parser.add_argument("src")
+    parser.add_argument("dst")
+    parser.add_argument("-l", "--level", type=int, default=-1)
+    parser.add_argument(
+        "-f", "--format", choices=("gzip", "zlib", "raw"), default="gzip"
+    )
+    parser.add_argument(
+        "-i",
+        "--interval",
+        type=int,
+        default=DEFAULT_INTERVAL,
+        help="input bytes between checkpoints",
+    )
+    args = parser.parse_args()
+    window_bits = {"gzip": WB_GZIP, "zlib": WB_ZLIB, "raw": WB_RAW}[args.format]
+    start = compress_file(args.src, args.dst, args.level, window_bits, args.interval)
+    if start != 0:
+        print("resumed at input offset {}".format(start), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+import argparse
+import concurrent.futures
+import mmap
+import os
+import struct
+import sys
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import pyzlib
+from pyzlib import stream
+
+# An ndarray split along its first axis into chunks of chunk_rows rows,
+# each of which is a separate zlib stream:
+#
+#   header: magic, dtype, shape, chunk_rows
+#   chunks
+#   index: nchunks + 1 little-endian uint64 offsets of the chunks
+#   footer: offset of the index
+#
+# Rows are contiguous in C order, so a chunk that lies entirely within a
+# read is inflated straight into the destination array.
+MAGIC = b"PZCA\x01"
+HEADER = struct.Struct("<5sB")
+DIM = struct.Struct("<Q")
+FOOTER = struct.Struct("<Q")
+DEFAULT_CHUNK_BYTES = 1024 * 1024
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError("pyzlib.chunkarray requires numpy")
+
+
+def _row_bytes(dtype, shape):
+    n = dtype.itemsize
+    for dim in shape[1:]:
+        n *= dim
+    return n
+
+
+def _compress_chunk(chunk, level):
+    # Runs on the pool; deflate reads the rows in place
+    return stream.compress(chunk, level)
+
+
+def save(
+    path,
+    array,
+    chunk_rows=None,
+    level=pyzlib.Z_DEFAULT_COMPRESSION,
+    workers=None,
+):
+    _require_numpy()
+    if numpy.ndim(array) == 0:
+        raise ValueError("0-dimensional arrays cannot be chunked")
+    array = numpy.ascontiguousarray(array)
+    if array.dtype.hasobject:
+        raise ValueError("arrays of objects cannot be stored")
+    if chunk_rows is None:
+        row_bytes = _row_bytes(array.dtype, array.shape) or 1
+        chunk_rows = max(1, DEFAULT_CHUNK_BYTES // row_bytes)
+    dtype = array.dtype.str.encode()
+    rows = array.shape[0]
+    chunks = (array[start : start + chunk_rows] for start in range(0, rows, chunk_rows))
+    with open(path, "wb") as fp:
+        fp.write(HEADER.pack(MAGIC, len(dtype)))
+        fp.write(dtype)
+        fp.write(struct.pack("<B", array.ndim))
+        for dim in array.shape + (chunk_rows,):
+            fp.write(DIM.pack(dim))
+        offsets = [fp.tell()]
+        with concurrent.futures.ThreadPoolExecutor(
+            workers or os.cpu_count() or 1
+        ) as executor:
+            # map() keeps the order of the chunks
+            for zchunk in executor.map(
+                lambda chunk: _compress_chunk(chunk, level), chunks
+            ):
+                fp.write(zchunk)
+                offsets.append(offsets[-1] + len(zchunk))
+        index_offset = fp.tell()
+        fp.write(numpy.array(offsets, dtype="<u8").tobytes())
+        fp.write(FOOTER.pack(index_offset))
+
+
+class ChunkedArray(object):
+    def __init__(self, path, workers=None):
+        _require_numpy()
+        self.workers = workers or os.cpu_count() or 1
+        self.fp = open(path, "rb")
+        self.mm = None
+        try:
+            self.mm = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+            self._read_header()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.offsets = None
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+    def _read_header(self):
+        mm = self.mm
+        if len(mm) < HEADER.size + FOOTER.size:
+            raise Exception("not a chunked array")
+        magic, dtype_size = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC:
+            raise Exception("not a chunked array")
+        pos = HEADER.size
+        self.dtype = numpy.dtype(mm[pos : pos + dtype_size].decode())
+        pos += dtype_size
+        (ndim,) = struct.unpack_from("<B", mm, pos)
+        pos += 1
+        dims = struct.unpack_from("<{}Q".format(ndim + 1), mm, pos)
+        self.shape = dims[:-1]
+        self.chunk_rows = dims[-1]
+        self.nchunks = -(-self.shape[0] // self.chunk_rows)
+        (index_offset,) = FOOTER.unpack_from(mm, len(mm) - FOOTER.size)
+        if index_offset + 8 * (self.nchunks + 1) != len(mm) - FOOTER.size:
+            raise Exception("corrupt chunk index")
+        # A copy, so that the mmap can be closed while results are alive
+        self.offsets = numpy.frombuffer(
+            mm[index_offset : len(mm) - FOOTER.size], dtype="<u8"
+        )
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def chunk_size(self, i):
+        # Compressed size of chunk i
+        return int(self.offsets[i + 1] - self.offsets[i])
+
+    def _inflate_chunk(self, i, out):
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        src = memoryview(self.mm)[start:end]
+        try:
+            if stream.decompress_into(src, out) != 0:
+                raise Exception("trailing garbage in chunk {}".format(i))
+        finally:
+            src.release()
+
+    def _read_chunk(self, i, start, stop, out):
+        # Copies rows [start, stop) of the array, which all belong to chunk
+        # i, to the beginning of out
+        chunk_start = i * self.chunk_rows
+        chunk_stop = min(chunk_start + self.chunk_rows, self.shape[0])
+        if start == chunk_start and stop == chunk_stop:
+            self._inflate_chunk(i, out[: stop - start])
+            return
+        rows = numpy.empty((chunk_stop - chunk_start,) + self.shape[1:], self.dtype)
+        self._inflate_chunk(i, rows)
+        out[: stop - start] = rows[start - chunk_start : stop - chunk_start]
+
+    def read(self, start=0, stop=None, out=None):
+        # Returns rows [start, stop), inflating only the chunks they overlap,
+        # in parallel
+        if stop is None:
+            stop = self.shape[0]
+        start, stop, _ = slice(start, stop).indices(self.shape[0])
+        stop = max(start, stop)
+        shape = (stop - start,) + self.shape[1:]
+        if out is None:
+            out = numpy.empty(shape, self.dtype)
+        elif out.shape != shape or out.dtype != self.dtype:
+            raise ValueError(
+                "out must be a {} array of shape {}".format(self.dtype, shape)
+            )
+        elif not out.flags.c_contiguous:
+            raise ValueError("out must be C-contiguous")
+        if start == stop:
+            return out
+        jobs = []
+        for i in range(start // self.chunk_rows, (stop - 1) // self.chunk_rows + 1):
+            lo = max(start, i * self.chunk_rows)
+            hi = min(stop, (i + 1) * self.chunk_rows)
+            jobs.append((i, lo, hi, out[lo - start :]))
+        if len(jobs) == 1 or self.workers == 1:
+            for job in jobs:
+                self._read_chunk(*job)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(
+                min(self.workers, len(jobs))
+            ) as executor:
+                for _ in executor.map(lambda job: self._read_chunk(*job), jobs):
+                    pass
+        return out
+
+    def __getitem__(self, key):
+        # The first index selects the chunks; the rest applies to the rows
+        if not isinstance(key, tuple):
+            key = (key,)
+        first, rest = (key[0] if key else slice(None)), key[1:]
+        if isinstance(first, slice) and first.step in (None, 1):
+            start, stop, _ = first.indices(self.shape[0])
+            return self.read(start, stop)[(slice(None),) + rest]
+        if isinstance(first, (int, numpy.integer)):
+            i = int(first)
+            if i < 0:
+                i += self.shape[0]
+            if not 0 <= i < self.shape[0]:
+                raise IndexError("index {} is out of bounds".format(first))
+            return self.read(i, i + 1)[(0,) + rest]
+        return self.read()[key]
+
+
+def load(path, workers=None):
+    with ChunkedArray(path, workers) as array:
+        return array.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare full and partial reads of a chunked array"
+    )
+    parser.add_argument("-r", "--rows", type=int, default=4 * 1024 * 1024)
+    parser.add_argument("-c", "--chunk-rows", type=int, default=64 * 1024)
+    parser.add_argument("-l", "--level", type=int, default=1)
+    parser.add_argument("-j", "--jobs", type=int)
+    parser.add_argument("path")
+    args = parser.parse_args()
+    _require_numpy()
+    array = numpy.cumsum(
+        numpy.random.default_rng(0).integers(-8, 8, (args.rows, 4)), axis=0
+    ).astype("<f8")
+    t0 = time.perf_counter()
+    save(args.path, array, args.chunk_rows, args.level, args.jobs)
+    t1 = time.perf_counter()
+    print(
+        "save      {:8.1f} MB/s, ratio {:.4f}".format(
+            array.nbytes / (t1 - t0) / 1e6, os.path.getsize(args.path) / array.nbytes
+        )
+    )
+    with ChunkedArray(args.path, args.jobs) as chunked:
+        t0 = time.perf_counter()
+        full = chunked.read()
+        t1 = time.perf_counter()
+        rows = args.chunk_rows // 2
+        part = chunked[len(array) // 2 : len(array) // 2 + rows]
+        t2 = time.perf_counter()
+    if not (
+        numpy.array_equal(full, array)
+        and numpy.array_equal(part[-1], array[len(array) // 2 + rows - 1])
+    ):
+        raise Exception("chunked array does not round-trip")
+    print("read      {:8.1f} MB/s".format(array.nbytes / (t1 - t0) / 1e6))
+    print("{} rows  {:8.3f} ms".format(rows, (t2 - t1) * 1e3))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+import argparse
+import array
+import itertools
+import operator
+import os
+import random
+import sys
+import tempfile
+
+# Everything is generated with random.Random, which produces the same
+# sequence for the same seed on every platform and Python version.
+VERSION = 3
+
+_ZEROS_ONES = bytes(0x30 + (i & 1) for i in range(256))
+
+_WORDS = (
+    b"the of and to in is that for it as was with be by on not he this are or "
+    b"his from at which but have an they you were her she there been one all "
+    b"we their has would when if so no will can more other its about what up "
+    b"time out into only some could them than then now first also new very "
+    b"compression stream buffer window deflate inflate block header level "
+    b"dictionary checksum flush output input data zlib memory strategy"
+).split()
+_SYLLABLES = (
+    b"ka ta na ma ra sa la pa da ga ko to no mo ro so lo po do go "
+    b"ki ti ni mi ri si li pi di gi ku tu nu mu ru su lu pu du gu "
+    b"er an in on en ar or ir ul el"
+).split()
+
+
+def _vocabulary(n):
+    r = random.Random(0)
+    words = list(_WORDS)
+    while len(words) < n:
+        words.append(b"".join(r.choices(_SYLLABLES, k=r.randint(1, 4))))
+    return words
+
+
+def _zipf_table(words, size):
+    # Word i occurs about 1 / (i + 1) of the time, so 16-bit random numbers
+    # can be mapped to words without a bisection per word
+    total = sum(1.0 / (i + 1) for i in range(len(words)))
+    table = []
+    for i, word in enumerate(words):
+        table.extend([word] * max(1, round(size / total / (i + 1))))
+    # Rounding might leave some room
+    table.extend(itertools.islice(itertools.cycle(words), size - len(table)))
+    return table[:size]
+
+
+_WORD_TABLE = _zipf_table(_vocabulary(4096), 65536)
+
+_LOG_LEVELS = (b"DEBUG", b"INFO", b"INFO", b"INFO", b"WARN", b"ERROR")
+_LOG_COMPONENTS = (b"http", b"db", b"cache", b"auth", b"worker", b"scheduler")
+_LOG_MESSAGES = (
+    b"request completed",
+    b"connection opened",
+    b"connection closed",
+    b"cache miss",
+    b"retrying operation",
+    b"job finished",
+    b"slow query",
+)
+
+
+def random_bytes(r, size):
+    return r.randbytes(size)
+
+
+def zeros_ones(r, size):
+    return r.randbytes(size).translate(_ZEROS_ONES)
+
+
+def zero_runs(r, size):
+    chunks = []
+    n = 0
+    while n < size:
+        zeros = r.randint(1, 16384)
+        other = r.randint(1, 1024)
+        chunks.append(bytes(zeros))
+        chunks.append(r.randbytes(other))
+        n += zeros + other
+    return b"".join(chunks)[:size]
+
+
+def _ints(r, typecode, n):
+    # Random bytes are read as little-endian integers on every machine
+    ints = array.array(typecode, r.randbytes(n * array.array(typecode).itemsize))
+    if sys.byteorder != "little":
+        ints.byteswap()
+    return ints
+
+
+def text(r, size):
+    # Every word is chosen independently, so that, like in real text, long
+    # matches are rare
+    words = map(_WORD_TABLE.__getitem__, _ints(r, "H", size // 4 + 1))
+    result = b" ".join(words).replace(b" the ", b".\nThe ")
+    if len(result) < size:
+        result += text(r, size - len(result))
+    return result[:size]
+
+
+def log(r, size):
+    n = size // 64 + 1
+    levels = r.choices(_LOG_LEVELS, k=n)
+    components = r.choices(_LOG_COMPONENTS, k=n)
+    messages = r.choices(_LOG_MESSAGES, k=n)
+    t0 = 1600000000000 + r.randrange(1 << 30)
+    times = itertools.accumulate(
+        _ints(r, "H", n), lambda t, dt: t + dt % 2000, initial=t0
+    )
+    ids = _ints(r, "I", n)
+    latencies = _ints(r, "B", n)
+    result = b"".join(
+        b"%d.%03d %s [%s] %s id=%d latency_ms=%d\n"
+        % (t // 1000, t % 1000, level, component, message, i & 0xFFFFF, latency)
+        for t, level, component, message, i, latency in zip(
+            times, levels, components, messages, ids, latencies
+        )
+    )
+    if len(result) < size:
+        result += log(r, size - len(result))
+    return result[:size]
+
+
+def numeric(r, size):
+    # Little-endian float64 random walk, like telemetry
+    steps = _ints(r, "b", size // 8 + 1)
+    values = array.array(
+        "d", map(operator.mul, itertools.accumulate(steps), itertools.repeat(0.001))
+    )
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()[:size]
+
+
+def mix(r, size):
+    gens = (
+        lambda n: b"hello\n" * (n // 6 + 1),
+        lambda n: b"".join(b"%d\n" % i for i in range(n // 4 + 1)),
+        bytes,
+        lambda n: zeros_ones(r, n),
+        lambda n: random_bytes(r, n),
+        lambda n: text(r, n),
+        lambda n: log(r, n),
+        lambda n: numeric(r, n),
+    )
+    chunks = []
+    n = 0
+    while n < size:
+        chunk_size = r.randint(1, 65536)
+        chunks.append(r.choice(gens)(chunk_size)[:chunk_size])
+        n += chunk_size
+    return b"".join(chunks)[:size]
+
+
+KINDS = {
+    "random": random_bytes,
+    "zeros_ones": zeros_ones,
+    "zero_runs": zero_runs,
+    "text": text,
+    "log": log,
+    "numeric": numeric,
+    "mix": mix,
+}
+
+
+def generate(kind, size, seed=0):
+    return KINDS[kind](random.Random(seed), size)
+
+
+def default_cache_dir():
+    cache_dir = os.environ.get("PYZLIB_CORPUS_DIR")
+    if cache_dir is not None:
+        return cache_dir
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(cache_home, "pyzlib", "corpus")
+
+
+def load(kind, size, seed=0, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    path = os.path.join(cache_dir, "{}-{}-{}-v{}.bin".format(kind, seed, size, VERSION))
+    try:
+        with open(path, "rb") as fp:
+            data = fp.read()
+        if len(data) == size:
+            return data
+    except FileNotFoundError:
+        pass
+    data = generate(kind, size, seed)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Concurrent loaders must not see partially written files
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return data
+
+
+class Gen(object):
+    def __init__(self, kind, seed=0, chunk_size=1024 * 1024):
+        self.func = KINDS[kind]
+        self.r = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.pos = 0
+
+    def __call__(self, n):
+        if len(self.buffer) - self.pos < n:
+            del self.buffer[: self.pos]
+            self.pos = 0
+            while len(self.buffer) < n:
+                self.buffer += self.func(self.r, self.chunk_size)
+        result = self.buffer[self.pos : self.pos + n]
+        self.pos += n
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a benchmark corpus")
+    parser.add_argument("kind", choices=sorted(KINDS))
+    parser.add_argument("size", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+    if args.no_cache:
+        data = generate(args.kind, args.size, args.seed)
+    else:
+        data = load(args.kind, args.size, args.seed)
+    sys.stdout.buffer.write(data)
+
+
+if __name__ == "__main__":
+    main()
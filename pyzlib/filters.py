@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+import argparse
+import array
+import itertools
+import random
+import struct
+import sys
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import pyzlib
+from pyzlib import corpus, stream
+
+# Reversible transforms that make typed numeric data easier to deflate.
+# Each works on whole items of itemsize bytes; trailing bytes that do not
+# make up a whole item (or a whole block, for BitShuffle) pass through.
+#
+# compress() output is a header listing the filters and the original size,
+# followed by a zlib stream of the filtered data.
+MAGIC = b"PZF\x01"
+HEADER = struct.Struct("<4sB")
+FILTER = struct.Struct("<BB")
+SIZE = struct.Struct("<Q")
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError("pyzlib.filters requires numpy")
+
+
+def _as_uint8(data):
+    return numpy.frombuffer(data, dtype=numpy.uint8)
+
+
+class Shuffle(object):
+    # Groups the n-th bytes of all items together, like Blosc
+    id = 1
+
+    def __init__(self, itemsize):
+        _require_numpy()
+        self.itemsize = itemsize
+
+    def forward(self, a):
+        k = self.itemsize
+        n = len(a) // k * k
+        out = numpy.empty_like(a)
+        out[:n].reshape(k, -1)[...] = a[:n].reshape(-1, k).T
+        out[n:] = a[n:]
+        return out
+
+    def inverse(self, a):
+        k = self.itemsize
+        n = len(a) // k * k
+        out = numpy.empty_like(a)
+        out[:n].reshape(-1, k)[...] = a[:n].reshape(k, -1).T
+        out[n:] = a[n:]
+        return out
+
+
+class BitShuffle(object):
+    # Groups the n-th bits of the items of each block together
+    id = 2
+    block_items = 8192
+
+    def __init__(self, itemsize):
+        _require_numpy()
+        self.itemsize = itemsize
+
+    def _blocks(self, size):
+        # Yields (start, items) of blocks whose item counts are multiples of 8
+        k = self.itemsize
+        start = 0
+        while True:
+            items = min(self.block_items, (size - start) // k // 8 * 8)
+            if items == 0:
+                return
+            yield start, items
+            start += items * k
+
+    def forward(self, a):
+        k = self.itemsize
+        out = a.copy()
+        for start, items in self._blocks(len(a)):
+            end = start + items * k
+            bits = numpy.unpackbits(
+                a[start:end].reshape(items, k), axis=1, bitorder="little"
+            )
+            out[start:end] = numpy.packbits(bits.T, axis=1, bitorder="little").ravel()
+        return out
+
+    def inverse(self, a):
+        k = self.itemsize
+        for start, items in self._blocks(len(a)):
+            end = start + items * k
+            bits = numpy.unpackbits(
+                a[start:end].reshape(8 * k, items // 8), axis=1, bitorder="little"
+            )
+            a[start:end] = numpy.packbits(bits.T, axis=1, bitorder="little").ravel()
+        return a
+
+
+class Delta(object):
+    # Replaces little-endian unsigned items with their differences from the
+    # previous ones, modulo 2 ** (8 * itemsize)
+    id = 3
+
+    def __init__(self, itemsize):
+        _require_numpy()
+        if itemsize not in (1, 2, 4, 8):
+            raise ValueError("unsupported item size {}".format(itemsize))
+        self.itemsize = itemsize
+        self.dtype = numpy.dtype("<u{}".format(itemsize))
+
+    def forward(self, a):
+        n = len(a) // self.itemsize * self.itemsize
+        out = numpy.empty_like(a)
+        x = a[:n].view(self.dtype)
+        d = out[:n].view(self.dtype)
+        d[:1] = x[:1]
+        numpy.subtract(x[1:], x[:-1], out=d[1:])
+        out[n:] = a[n:]
+        return out
+
+    def inverse(self, a):
+        n = len(a) // self.itemsize * self.itemsize
+        x = a[:n].view(self.dtype)
+        numpy.add.accumulate(x, dtype=self.dtype, out=x)
+        return a
+
+
+FILTERS = {cls.id: cls for cls in (Shuffle, BitShuffle, Delta)}
+
+
+def _header(filters, size):
+    parts = [HEADER.pack(MAGIC, len(filters))]
+    for f in filters:
+        parts.append(FILTER.pack(f.id, f.itemsize))
+    parts.append(SIZE.pack(size))
+    return b"".join(parts)
+
+
+def _parse_header(view):
+    magic, count = HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise Exception("not a filtered stream")
+    pos = HEADER.size
+    filters = []
+    for _ in range(count):
+        filter_id, itemsize = FILTER.unpack_from(view, pos)
+        if filter_id not in FILTERS:
+            raise Exception("unknown filter {}".format(filter_id))
+        filters.append(FILTERS[filter_id](itemsize))
+        pos += FILTER.size
+    (size,) = SIZE.unpack_from(view, pos)
+    return filters, size, pos + SIZE.size
+
+
+def apply(data, filters):
+    # Returns a uint8 array; data is not modified
+    _require_numpy()
+    a = _as_uint8(data)
+    for f in filters:
+        a = f.forward(a)
+    return a
+
+
+def compress(
+    data,
+    filters,
+    level=pyzlib.Z_DEFAULT_COMPRESSION,
+    strategy=pyzlib.Z_DEFAULT_STRATEGY,
+):
+    # Deflate reads the filtered array in place
+    view = memoryview(data).cast("B")
+    filtered = apply(view, filters)
+    header = _header(filters, len(view))
+    with stream.Deflater(level=level, strategy=strategy) as deflater:
+        return header + deflater.compress(filtered, pyzlib.Z_FINISH)
+
+
+def decompress(data):
+    # Inflates straight into the array that the inverse filters then
+    # transform, mostly in place
+    _require_numpy()
+    view = memoryview(data).cast("B")
+    filters, size, start = _parse_header(view)
+    a = numpy.empty(size, dtype=numpy.uint8)
+    if stream.decompress_into(view[start:], a) != 0:
+        raise Exception("trailing garbage after filtered stream")
+    for f in reversed(filters):
+        a = f.inverse(a)
+    return a.tobytes()
+
+
+def _int32_counters(size, seed=0):
+    # Little-endian int32 counters with small random increments
+    r = random.Random(seed)
+    steps = r.randbytes(size // 4 + 1)
+    values = array.array("i", itertools.accumulate(b & 0xF for b in steps))
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()[:size]
+
+
+PIPELINES = {
+    "none": lambda k: [],
+    "shuffle": lambda k: [Shuffle(k)],
+    "bitshuffle": lambda k: [BitShuffle(k)],
+    "delta": lambda k: [Delta(k)],
+    "delta+shuffle": lambda k: [Delta(k), Shuffle(k)],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare filter pipelines on typed numeric data"
+    )
+    parser.add_argument("-s", "--size", type=int, default=16 * 1024 * 1024)
+    parser.add_argument("-l", "--level", type=int, default=1)
+    args = parser.parse_args()
+    datasets = (
+        ("float64", 8, corpus.generate("numeric", args.size)),
+        ("int32", 4, _int32_counters(args.size)),
+    )
+    for name, itemsize, data in datasets:
+        for pipeline, make in PIPELINES.items():
+            filters = make(itemsize)
+            t0 = time.perf_counter()
+            zdata = compress(data, filters, args.level)
+            t1 = time.perf_counter()
+            result = decompress(zdata)
+            t2 = time.perf_counter()
+            if result != data:
+                raise Exception("{} does not round-trip".format(pipeline))
+            print(
+                "{:<8}{:<14}ratio {:6.4f}  compress {:6.3f} GB/s  "
+                "decompress {:6.3f} GB/s".format(
+                    name,
+                    pipeline,
+                    len(zdata) / len(data),
+                    len(data) / (t1 - t0) / 1e9,
+                    len(data) / (t2 - t1) / 1e9,
+                )
+            )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
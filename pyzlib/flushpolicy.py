@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+import time
+
+import pyzlib
+from pyzlib import _buffer, corpus, stream
+
+FLUSH_MODES = (pyzlib.Z_PARTIAL_FLUSH, pyzlib.Z_SYNC_FLUSH, pyzlib.Z_BLOCK)
+DEFAULT_MAX_BYTES = 64 * 1024
+DEFAULT_MAX_DELAY = 0.005
+
+
+class FlushPolicy(object):
+    # Decides when requested flushes are done. A request is due once the
+    # oldest request that has not been served is max_delay seconds old, or
+    # once max_bytes have been written since the last flush; None disables
+    # either limit. With eager, a request that comes after max_delay
+    # seconds without flushes is served at once, like Nagle's algorithm
+    # sends the first segment on an idle connection.
+    def __init__(
+        self,
+        max_delay=None,
+        max_bytes=None,
+        eager=False,
+        mode=pyzlib.Z_SYNC_FLUSH,
+    ):
+        if mode not in FLUSH_MODES:
+            raise ValueError("unsupported flush mode {}".format(mode))
+        self.max_delay = max_delay
+        self.max_bytes = max_bytes
+        self.eager = eager
+        self.mode = mode
+
+    def due(self, now, requested, unflushed, last_flush):
+        # requested is the time of the oldest request, unflushed is the
+        # input size since the last flush at last_flush
+        if self.eager and self.max_delay is not None:
+            if now >= last_flush + self.max_delay:
+                return True
+        if self.max_bytes is not None and unflushed >= self.max_bytes:
+            return True
+        due = self.deadline(requested)
+        return due is not None and now >= due
+
+    def deadline(self, requested):
+        # Returns the time by which a request made at requested is due, or
+        # None
+        if self.max_delay is None:
+            return None
+        return requested + self.max_delay
+
+
+def latency_first(mode=pyzlib.Z_SYNC_FLUSH):
+    # Every request is served at once
+    return FlushPolicy(max_delay=0.0, mode=mode)
+
+
+def ratio_first(max_bytes=DEFAULT_MAX_BYTES, mode=pyzlib.Z_SYNC_FLUSH):
+    # Requests are served only once max_bytes have been written
+    return FlushPolicy(max_bytes=max_bytes, mode=mode)
+
+
+def deadline(
+    max_delay=DEFAULT_MAX_DELAY,
+    max_bytes=DEFAULT_MAX_BYTES,
+    mode=pyzlib.Z_SYNC_FLUSH,
+):
+    # Requests wait at most max_delay, which is the latency budget, and are
+    # served at once after a quiet period
+    return FlushPolicy(max_delay=max_delay, max_bytes=max_bytes, eager=True, mode=mode)
+
+
+POLICIES = {
+    "latency": latency_first,
+    "ratio": ratio_first,
+    "deadline": deadline,
+}
+
+
+class FlushStats(object):
+    def __init__(self):
+        self.requests = 0
+        self.flushes = 0
+        # Flushes that were not done because there was nothing to flush
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # From the oldest request to the flush that served it
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def mean_latency(self):
+        return self.total_latency / self.flushes if self.flushes else 0.0
+
+    @property
+    def requests_per_flush(self):
+        return self.requests / self.flushes if self.flushes else 0.0
+
+    def __repr__(self):
+        return (
+            "{} requests, {} flushes, {} skipped, {} -> {} bytes, "
+            "latency mean {:.6f}s max {:.6f}s".format(
+                self.requests,
+                self.flushes,
+                self.skipped,
+                self.bytes_in,
+                self.bytes_out,
+                self.mean_latency,
+                self.max_latency,
+            )
+        )
+
+
+class FlushingDeflater(object):
+    # A deflater for message streams whose flushes are coalesced by a
+    # policy. request_flush() marks the end of a message the peer should
+    # see; the flush happens when the policy says so. Callers that wait
+    # for input should call poll() no later than the time it returns, so
+    # that requests do not outlive their deadlines.
+    def __init__(
+        self,
+        write,
+        policy=None,
+        level=pyzlib.Z_DEFAULT_COMPRESSION,
+        window_bits=stream.WB_ZLIB,
+        mem_level=pyzlib.DEF_MEM_LEVEL,
+        strategy=pyzlib.Z_DEFAULT_STRATEGY,
+        clock=time.monotonic,
+    ):
+        self.policy = deadline() if policy is None else policy
+        self.clock = clock
+        self.stats = FlushStats()
+        self.deflater = stream.Deflater(
+            level=level,
+            window_bits=window_bits,
+            mem_level=mem_level,
+            strategy=strategy,
+        )
+        self._write = write
+        self.unflushed = 0
+        # Time of the oldest request that has not been served, or None
+        self.requested = None
+        self.last_flush = clock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.deflater is not None:
+            self.deflater.close()
+            self.deflater = None
+
+    def _output(self, chunk):
+        self.stats.bytes_out += len(chunk)
+        self._write(chunk)
+
+    def write(self, data, flush=False):
+        # With flush, the same as write() followed by request_flush()
+        self.deflater.compress_to(self._output, data)
+        size = _buffer.nbytes(data)
+        self.unflushed += size
+        self.stats.bytes_in += size
+        if flush:
+            return self.request_flush()
+        return self._check()
+
+    def request_flush(self):
+        # Returns True if the data written so far has been flushed
+        self.stats.requests += 1
+        if self.requested is None:
+            self.requested = self.clock()
+        return self._check()
+
+    def _check(self):
+        if self.requested is None:
+            return False
+        now = self.clock()
+        if not self.policy.due(now, self.requested, self.unflushed, self.last_flush):
+            return False
+        self._flush(now, self.policy.mode)
+        return True
+
+    def _flush(self, now, mode):
+        if (
+            mode != pyzlib.Z_FINISH
+            and self.unflushed == 0
+            and self.deflater.pending() == (0, 0)
+        ):
+            # Only an empty block would be emitted
+            self.requested = None
+            self.stats.skipped += 1
+            return
+        self.deflater.compress_to(self._output, b"", mode)
+        self.unflushed = 0
+        self.last_flush = now
+        if self.requested is not None:
+            latency = now - self.requested
+            self.requested = None
+            self.stats.flushes += 1
+            self.stats.total_latency += latency
+            self.stats.max_latency = max(self.stats.max_latency, latency)
+
+    def poll(self):
+        # Flushes if a request is due. Returns the clock time by which poll()
+        # must be called again, or None if nothing is waiting for it.
+        self._check()
+        if self.requested is None:
+            return None
+        return self.policy.deadline(self.requested)
+
+    def flush(self):
+        # Serves pending requests regardless of the policy
+        if self.requested is None:
+            self.requested = self.clock()
+        self._flush(self.clock(), self.policy.mode)
+
+    def finish(self):
+        # Z_FINISH serves pending requests
+        self._flush(self.clock(), pyzlib.Z_FINISH)
+        self.close()
+
+
+class _Clock(object):
+    # Simulated time, so that the benchmark does not sleep
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def simulate(policy, messages, rate, level=1):
+    # Writes messages arriving at rate messages per second, each followed by
+    # a flush request, and polls at deadlines between arrivals. Returns
+    # (stats, compressed size, seconds spent compressing).
+    clock = _Clock()
+    chunks = []
+    t0 = time.perf_counter()
+    with FlushingDeflater(chunks.append, policy, level, clock=clock) as deflater:
+        for i, message in enumerate(messages):
+            arrival = i / rate
+            while True:
+                due = deflater.poll()
+                if due is None or due > arrival:
+                    break
+                clock.now = max(clock.now, due)
+            clock.now = max(clock.now, arrival)
+            deflater.write(message, flush=True)
+        deflater.finish()
+    elapsed = time.perf_counter() - t0
+    return deflater.stats, sum(len(chunk) for chunk in chunks), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare flush policies on a simulated RPC stream"
+    )
+    parser.add_argument("-k", "--kind", choices=sorted(corpus.KINDS), default="log")
+    parser.add_argument("-s", "--size", type=int, default=16 * 1024 * 1024)
+    parser.add_argument("-r", "--rate", type=float, default=50000, help="messages/s")
+    parser.add_argument("-d", "--max-delay", type=float, default=DEFAULT_MAX_DELAY)
+    parser.add_argument("-l", "--level", type=int, default=1)
+    args = parser.parse_args()
+    messages = corpus.generate(args.kind, args.size).splitlines(keepends=True)
+    policies = (
+        ("latency", latency_first()),
+        ("ratio", ratio_first()),
+        ("deadline", deadline(args.max_delay)),
+    )
+    for name, policy in policies:
+        stats, size, elapsed = simulate(policy, messages, args.rate, args.level)
+        print(
+            "{:<9} ratio {:.4f}  {:8.1f} MB/s  {:7} flushes  "
+            "latency mean {:7.3f} ms max {:9.3f} ms".format(
+                name,
+                size / stats.bytes_in,
+                stats.bytes_in / elapsed / 1e6,
+                stats.flushes,
+                stats.mean_latency * 1e3,
+                stats.max_latency * 1e3,
+            )
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+import argparse
+import concurrent.futures
+import struct
+import sys
+import threading
+import time
+
+import pyzlib
+from pyzlib import corpus, stream
+
+# Header of a gzip member without a name and modification time, with the
+# OS byte that zlib uses on Unix
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\x03"
+_GZIP_XFL_OFFSET = 8
+GZIP_TRAILER = struct.Struct("<II")
+ZLIB_TRAILER = struct.Struct(">I")
+
+CRC32 = "crc32"
+ADLER32 = "adler32"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def checksum_executor():
+    # One worker processes the chunks of every checksum in submission order
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="pyzlib-checksum"
+            )
+        return _executor
+
+
+def _after(previous, func, *args):
+    # Runs on the executor. Waiting for the previous update keeps the updates
+    # of a checksum in order even if the executor has several workers. The
+    # executor has started the previous update already, so this does not
+    # deadlock.
+    if previous is not None:
+        previous.result()
+    func(*args)
+
+
+def zlib_header(level, window_bits=pyzlib.MAX_WBITS):
+    cmf = ((window_bits - 8) << 4) | pyzlib.Z_DEFLATED
+    if level == pyzlib.Z_DEFAULT_COMPRESSION:
+        level = 6
+    if level < 2:
+        flevel = 0
+    elif level < 6:
+        flevel = 1
+    elif level == 6:
+        flevel = 2
+    else:
+        flevel = 3
+    flg = flevel << 6
+    flg += 31 - (cmf * 256 + flg) % 31
+    return bytes((cmf, flg))
+
+
+def gzip_header(level, strategy=pyzlib.Z_DEFAULT_STRATEGY):
+    # Sets XFL the same way deflate() does
+    result = bytearray(GZIP_HEADER)
+    if level == 9:
+        result[_GZIP_XFL_OFFSET] = 2
+    elif strategy >= pyzlib.Z_HUFFMAN_ONLY or level in (0, 1):
+        result[_GZIP_XFL_OFFSET] = 4
+    return bytes(result)
+
+
+def header(window_bits, level, strategy=pyzlib.Z_DEFAULT_STRATEGY):
+    if window_bits > 15:
+        return gzip_header(level, strategy)
+    if window_bits > 0:
+        return zlib_header(level, window_bits)
+    return b""
+
+
+def _raw_window_bits(window_bits):
+    if window_bits > 15:
+        return window_bits - 16
+    return abs(window_bits)
+
+
+class Checksums(object):
+    # Computes CRC-32 and/or Adler-32 of a sequence of chunks on another
+    # thread. A single instance can serve several encodings of the same
+    # input.
+    def __init__(self, kinds=(CRC32, ADLER32), executor=None):
+        self.kinds = kinds
+        self.executor = checksum_executor() if executor is None else executor
+        self.crc32 = pyzlib.crc32(0, None, 0)
+        self.adler32 = pyzlib.adler32(0, None, 0)
+        self.size = 0
+        self.future = None
+
+    def _update(self, chunk):
+        # Runs on the executor
+        n = len(chunk)
+        if CRC32 in self.kinds:
+            self.crc32 = pyzlib.crc32(self.crc32, chunk, n)
+        if ADLER32 in self.kinds:
+            self.adler32 = pyzlib.adler32(self.adler32, chunk, n)
+        self.size += n
+
+    def update(self, data):
+        # The chunk is read later, so it must not change
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        self.future = self.executor.submit(_after, self.future, self._update, data)
+
+    def result(self):
+        if self.future is not None:
+            self.future.result()
+        return {CRC32: self.crc32, ADLER32: self.adler32, "size": self.size}
+
+
+class FramedWriter(object):
+    # Raw deflate on the calling thread, checksums on another one, and the
+    # gzip or zlib framing written here. If checksums are passed in, the
+    # caller feeds them, which lets several writers share them.
+    def __init__(
+        self,
+        write,
+        window_bits=stream.WB_GZIP,
+        level=pyzlib.Z_DEFAULT_COMPRESSION,
+        mem_level=pyzlib.DEF_MEM_LEVEL,
+        strategy=pyzlib.Z_DEFAULT_STRATEGY,
+        buffer_size=stream.DEFAULT_BUFFER_SIZE,
+        checksums=None,
+    ):
+        self._write = write
+        self.window_bits = window_bits
+        self.feed = checksums is None
+        if checksums is None:
+            kind = CRC32 if window_bits > 15 else ADLER32
+            checksums = Checksums((kind,))
+        self.checksums = checksums
+        self.deflater = stream.Deflater(
+            level=level,
+            window_bits=-_raw_window_bits(window_bits),
+            mem_level=mem_level,
+            strategy=strategy,
+            buffer_size=buffer_size,
+        )
+        prefix = header(window_bits, level, strategy)
+        if prefix:
+            write(prefix)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.deflater is not None:
+            self.deflater.close()
+            self.deflater = None
+
+    def write(self, data):
+        if self.feed:
+            self.checksums.update(data)
+        self.deflater.compress_to(self._write, data)
+
+    def flush(self, flush=pyzlib.Z_SYNC_FLUSH):
+        self.deflater.compress_to(self._write, b"", flush)
+
+    def finish(self):
+        self.deflater.compress_to(self._write, b"", pyzlib.Z_FINISH)
+        result = self.checksums.result()
+        if self.window_bits > 15:
+            self._write(GZIP_TRAILER.pack(result[CRC32], result["size"] & 0xFFFFFFFF))
+        elif self.window_bits > 0:
+            self._write(ZLIB_TRAILER.pack(result[ADLER32]))
+        self.close()
+
+
+def compress(
+    data,
+    level=pyzlib.Z_DEFAULT_COMPRESSION,
+    window_bits=stream.WB_GZIP,
+    chunk_size=stream.DEFAULT_BUFFER_SIZE,
+):
+    # Splits data into chunks, so that checksums overlap with deflate
+    chunks = []
+    view = memoryview(data).cast("B")
+    with FramedWriter(chunks.append, window_bits, level) as writer:
+        for i in range(0, len(view), chunk_size):
+            writer.write(view[i : i + chunk_size])
+        writer.finish()
+    return b"".join(chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare inline and out-of-band checksums"
+    )
+    parser.add_argument("-k", "--kind", choices=sorted(corpus.KINDS), default="log")
+    parser.add_argument("-s", "--size", type=int, default=64 * 1024 * 1024)
+    parser.add_argument("-l", "--level", type=int, default=1)
+    parser.add_argument("-f", "--format", choices=("zlib", "gzip"), default="gzip")
+    args = parser.parse_args()
+    window_bits = stream.WB_GZIP if args.format == "gzip" else stream.WB_ZLIB
+    data = corpus.generate(args.kind, args.size)
+    t0 = time.perf_counter()
+    stream.compress(data, args.level, window_bits)
+    t1 = time.perf_counter()
+    framed = compress(data, args.level, window_bits)
+    t2 = time.perf_counter()
+    if stream.decompress(framed, window_bits) != data:
+        raise Exception("framed output does not decompress")
+    for name, elapsed in (("inline", t1 - t0), ("framed", t2 - t1)):
+        print("{:<8}{:8.1f} MB/s".format(name, len(data) / elapsed / 1e6))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
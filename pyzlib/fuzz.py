@@ -0,0 +1,569 @@
+#!/usr/bin/env python3
+import argparse
+import concurrent.futures
+import ctypes
+import json
+import math
+import os
+import random
+import sys
+import time
+import traceback
+import zlib
+
+import pyzlib
+from pyzlib import _buffer, corpus
+
+# A case is a JSON-serializable dict, so that failures can be replayed with
+# --replay. Its input data is corpus.generate(kind, total data size, seed).
+DEFAULT_MAX_SIZE = 256 * 1024
+DEFAULT_BATCH_SIZE = 16
+_FLUSHES = (
+    pyzlib.Z_NO_FLUSH,
+    pyzlib.Z_PARTIAL_FLUSH,
+    pyzlib.Z_SYNC_FLUSH,
+    pyzlib.Z_FULL_FLUSH,
+    pyzlib.Z_BLOCK,
+)
+_SILENT_FLUSHES = (pyzlib.Z_NO_FLUSH, pyzlib.Z_BLOCK)
+_MARKER_FLUSHES = (pyzlib.Z_PARTIAL_FLUSH, pyzlib.Z_SYNC_FLUSH, pyzlib.Z_FULL_FLUSH)
+_MIN_MARKER_AVAIL_OUT = 7
+_STRATEGIES = (
+    pyzlib.Z_DEFAULT_STRATEGY,
+    pyzlib.Z_FILTERED,
+    pyzlib.Z_HUFFMAN_ONLY,
+    pyzlib.Z_RLE,
+    pyzlib.Z_FIXED,
+)
+_FUNCTIONS = (
+    "zlibVersion",
+    "deflateInit2_",
+    "deflate",
+    "deflateEnd",
+    "deflateParams",
+    "deflateSetDictionary",
+    "inflateInit2_",
+    "inflate",
+    "inflateEnd",
+    "inflateSetDictionary",
+)
+
+
+class Library(object):
+    # pyzlib-style functions on top of a separately loaded zlib, e.g.
+    # zlib-ng in compat mode
+    def __init__(self, path):
+        self.path = path
+        self._lib = ctypes.CDLL(path)
+        for name in _FUNCTIONS:
+            func = getattr(self._lib, name)
+            func.restype = getattr(pyzlib._zlib, name).restype
+            func.argtypes = getattr(pyzlib._zlib, name).argtypes
+
+    def zlibVersion(self):
+        return self._lib.zlibVersion()
+
+    def deflateInit2(self, strm, level, method, windowBits, memLevel, strategy):
+        return self._lib.deflateInit2_(
+            ctypes.addressof(strm),
+            level,
+            method,
+            windowBits,
+            memLevel,
+            strategy,
+            ctypes.c_char_p(pyzlib.ZLIB_VERSION),
+            ctypes.sizeof(pyzlib.z_stream),
+        )
+
+    def deflate(self, strm, flush):
+        return self._lib.deflate(ctypes.addressof(strm), flush)
+
+    def deflateEnd(self, strm):
+        return self._lib.deflateEnd(ctypes.addressof(strm))
+
+    def deflateParams(self, strm, level, strategy):
+        return self._lib.deflateParams(ctypes.addressof(strm), level, strategy)
+
+    def deflateSetDictionary(self, strm, dictionary, dictLength):
+        return self._lib.deflateSetDictionary(
+            ctypes.addressof(strm), dictionary, dictLength
+        )
+
+    def inflateInit2(self, strm, windowBits):
+        return self._lib.inflateInit2_(
+            ctypes.addressof(strm),
+            windowBits,
+            ctypes.c_char_p(pyzlib.ZLIB_VERSION),
+            ctypes.sizeof(pyzlib.z_stream),
+        )
+
+    def inflate(self, strm, flush):
+        return self._lib.inflate(ctypes.addressof(strm), flush)
+
+    def inflateEnd(self, strm):
+        return self._lib.inflateEnd(ctypes.addressof(strm))
+
+    def inflateSetDictionary(self, strm, dictionary, dictLength):
+        return self._lib.inflateSetDictionary(
+            ctypes.addressof(strm), dictionary, dictLength
+        )
+
+
+class Failure(Exception):
+    pass
+
+
+def _check(func_name, err, *expected):
+    if err not in expected:
+        raise Failure("{}() failed with error {}".format(func_name, err))
+
+
+def _size(r, max_size):
+    # Log-uniform, so that tiny buffers are as likely as huge ones
+    return min(int(2 ** r.uniform(0, math.log2(max_size + 1))), max_size)
+
+
+def make_case(seed, max_size=DEFAULT_MAX_SIZE):
+    r = random.Random(seed)
+    fmt = r.choice(("raw", "zlib", "gzip"))
+    bits = r.randint(9, 15)
+    window_bits = {"raw": -bits, "zlib": bits, "gzip": bits + 16}[fmt]
+    if fmt == "gzip":
+        # Dictionaries are not supported by the gzip format
+        dictionary = 0
+    else:
+        dictionary = r.choice((0, 0, _size(r, 1 << bits)))
+    inflate_bits = r.randint(bits, 15)
+    inflate_window_bits = {
+        "raw": -inflate_bits,
+        "zlib": r.choice((0, inflate_bits, inflate_bits + 32)),
+        "gzip": r.choice((inflate_bits + 16, inflate_bits + 32)),
+    }[fmt]
+    # Some cases are kept comparable with the stdlib byte by byte
+    flushes = r.choice((_FLUSHES, _FLUSHES, _SILENT_FLUSHES))
+    params_rate = r.choice((0, 0.1))
+    ops = []
+    size = 0
+    for _ in range(r.randint(1, 64)):
+        if r.random() < params_rate:
+            ops.append(["params", r.randint(-1, 9), r.choice(_STRATEGIES)])
+        else:
+            isize = _size(r, max(1, max_size - size))
+            ops.append(["data", isize, r.choice(flushes)])
+            size += isize
+        if size >= max_size:
+            break
+    return {
+        "seed": seed,
+        "kind": r.choice(sorted(corpus.KINDS)),
+        "level": r.randint(-1, 9),
+        "window_bits": window_bits,
+        "mem_level": r.randint(1, pyzlib.MAX_MEM_LEVEL),
+        "strategy": r.choice(_STRATEGIES),
+        "dictionary": dictionary,
+        "ops": ops,
+        "deflate_out": [_size(r, 65536) for _ in range(r.randint(1, 8))],
+        "inflate_window_bits": inflate_window_bits,
+        "inflate_chunks": [
+            [_size(r, 65536), _size(r, 65536)] for _ in range(r.randint(1, 8))
+        ],
+    }
+
+
+def case_data(case):
+    size = sum(op[1] for op in case["ops"] if op[0] == "data")
+    data = corpus.generate(case["kind"], size, case["seed"])
+    dictionary = None
+    if case["dictionary"] != 0:
+        dictionary = corpus.generate(case["kind"], case["dictionary"], ~case["seed"])
+    return data, dictionary
+
+
+def deflate(lib, case, data, dictionary):
+    strm = pyzlib.z_stream(
+        zalloc=pyzlib.Z_NULL, free=pyzlib.Z_NULL, opaque=pyzlib.Z_NULL
+    )
+    err = lib.deflateInit2(
+        strm,
+        case["level"],
+        pyzlib.Z_DEFLATED,
+        case["window_bits"],
+        case["mem_level"],
+        case["strategy"],
+    )
+    _check("deflateInit2", err, pyzlib.Z_OK)
+    try:
+        if dictionary is not None:
+            err = lib.deflateSetDictionary(
+                strm, _buffer.addressof(dictionary), len(dictionary)
+            )
+            _check("deflateSetDictionary", err, pyzlib.Z_OK)
+        osizes = case["deflate_out"]
+        obuf = ctypes.create_string_buffer(max(osizes + [_MIN_MARKER_AVAIL_OUT]))
+        chunks = []
+        pos = 0
+        i = 0
+        # deflateSetDictionary() counts the dictionary as input
+        total_in = strm.total_in
+        for op in case["ops"] + [["data", 0, pyzlib.Z_FINISH]]:
+            strm.next_in = _buffer.addressof(data, pos)
+            if op[0] == "params":
+                strm.avail_in = 0
+                _, level, strategy = op
+            else:
+                _, isize, flush = op
+                strm.avail_in = isize
+                pos += isize
+            while True:
+                osize = osizes[i % len(osizes)]
+                i += 1
+                if op[0] == "data" and flush in _MARKER_FLUSHES:
+                    # Otherwise deflate() may emit flush markers forever
+                    osize = max(osize, _MIN_MARKER_AVAIL_OUT)
+                strm.next_out = ctypes.addressof(obuf)
+                strm.avail_out = osize
+                if op[0] == "params":
+                    err = lib.deflateParams(strm, level, strategy)
+                    chunks.append(obuf[: osize - strm.avail_out])
+                    # Z_BUF_ERROR means that there was not enough room to
+                    # flush the data compressed with the old parameters
+                    _check("deflateParams", err, pyzlib.Z_OK, pyzlib.Z_BUF_ERROR)
+                    if err == pyzlib.Z_OK:
+                        break
+                    continue
+                err = lib.deflate(strm, flush)
+                chunks.append(obuf[: osize - strm.avail_out])
+                if err == pyzlib.Z_STREAM_END:
+                    if flush != pyzlib.Z_FINISH or strm.avail_in != 0:
+                        raise Failure("deflate() ended the stream prematurely")
+                    break
+                _check("deflate", err, pyzlib.Z_OK, pyzlib.Z_BUF_ERROR)
+                if strm.avail_in == 0 and strm.avail_out != 0:
+                    if flush == pyzlib.Z_FINISH:
+                        raise Failure("deflate() did not finish the stream")
+                    break
+            if strm.total_in - total_in != pos:
+                raise Failure(
+                    "deflate() consumed {} of {}".format(strm.total_in - total_in, pos)
+                )
+        return b"".join(chunks)
+    finally:
+        lib.deflateEnd(strm)
+
+
+def inflate(lib, case, zdata, dictionary):
+    strm = pyzlib.z_stream(
+        next_in=pyzlib.Z_NULL,
+        avail_in=0,
+        zalloc=pyzlib.Z_NULL,
+        free=pyzlib.Z_NULL,
+        opaque=pyzlib.Z_NULL,
+    )
+    window_bits = case["inflate_window_bits"]
+    err = lib.inflateInit2(strm, window_bits)
+    _check("inflateInit2", err, pyzlib.Z_OK)
+    try:
+        if dictionary is not None and window_bits < 0:
+            err = lib.inflateSetDictionary(
+                strm, _buffer.addressof(dictionary), len(dictionary)
+            )
+            _check("inflateSetDictionary", err, pyzlib.Z_OK)
+        sizes = case["inflate_chunks"]
+        obuf = ctypes.create_string_buffer(max(osize for _, osize in sizes))
+        chunks = []
+        pos = 0
+        i = 0
+        stalls = 0
+        while True:
+            isize, osize = sizes[i % len(sizes)]
+            i += 1
+            avail_in = min(isize, len(zdata) - pos)
+            strm.next_in = _buffer.addressof(zdata, pos)
+            strm.avail_in = avail_in
+            strm.next_out = ctypes.addressof(obuf)
+            strm.avail_out = osize
+            err = lib.inflate(strm, pyzlib.Z_NO_FLUSH)
+            if err == pyzlib.Z_NEED_DICT and dictionary is not None:
+                err = lib.inflateSetDictionary(
+                    strm, _buffer.addressof(dictionary), len(dictionary)
+                )
+                _check("inflateSetDictionary", err, pyzlib.Z_OK)
+                err = lib.inflate(strm, pyzlib.Z_NO_FLUSH)
+            pos += avail_in - strm.avail_in
+            chunks.append(obuf[: osize - strm.avail_out])
+            if err == pyzlib.Z_STREAM_END:
+                break
+            _check("inflate", err, pyzlib.Z_OK, pyzlib.Z_BUF_ERROR)
+            if avail_in == strm.avail_in and osize == strm.avail_out:
+                stalls += 1
+                if stalls > len(sizes):
+                    raise Failure("inflate() made no progress at {}".format(pos))
+            else:
+                stalls = 0
+        if pos != len(zdata):
+            raise Failure(
+                "inflate() ended the stream at {} of {}".format(pos, len(zdata))
+            )
+        return b"".join(chunks)
+    finally:
+        lib.inflateEnd(strm)
+
+
+def _stdlib_compress(case, data, dictionary):
+    kwargs = {}
+    if dictionary is not None:
+        kwargs["zdict"] = dictionary
+    c = zlib.compressobj(
+        case["level"],
+        zlib.DEFLATED,
+        case["window_bits"],
+        case["mem_level"],
+        case["strategy"],
+        **kwargs
+    )
+    chunks = []
+    pos = 0
+    for op in case["ops"]:
+        if op[0] == "data":
+            _, isize, flush = op
+            chunks.append(c.compress(data[pos : pos + isize]))
+            pos += isize
+            if flush != pyzlib.Z_NO_FLUSH:
+                chunks.append(c.flush(flush))
+    chunks.append(c.flush(zlib.Z_FINISH))
+    return b"".join(chunks)
+
+
+def _stdlib_decompress(case, zdata, dictionary):
+    kwargs = {}
+    if dictionary is not None:
+        kwargs["zdict"] = dictionary
+    d = zlib.decompressobj(case["inflate_window_bits"], **kwargs)
+    data = d.decompress(zdata) + d.flush()
+    if not d.eof or d.unused_data:
+        raise Failure("zlib.decompressobj() did not end the stream properly")
+    return data
+
+
+def _compare(what, expected, actual):
+    if expected == actual:
+        return
+    n = 0
+    while n < min(len(expected), len(actual)) and expected[n] == actual[n]:
+        n += 1
+    raise Failure(
+        "{}: {} bytes instead of {}, first difference at {}".format(
+            what, len(actual), len(expected), n
+        )
+    )
+
+
+def _byte_exact(case):
+    # Level 0 output depends on avail_out, a flush that fills avail_out
+    # exactly is repeated by the next deflate() call, and the stdlib cannot
+    # change parameters in the middle of a stream
+    if zlib.ZLIB_RUNTIME_VERSION.encode() != pyzlib.zlibVersion():
+        return False
+    if case["level"] == 0:
+        return False
+    return all(op[0] == "data" and op[2] in _SILENT_FLUSHES for op in case["ops"])
+
+
+def run_case(case, backend=None):
+    # Returns None on success or the description of the failure
+    try:
+        data, dictionary = case_data(case)
+        zdata = deflate(pyzlib, case, data, dictionary)
+        _compare("pyzlib inflate", data, inflate(pyzlib, case, zdata, dictionary))
+        _compare("stdlib inflate", data, _stdlib_decompress(case, zdata, dictionary))
+        ref = _stdlib_compress(case, data, dictionary)
+        _compare(
+            "pyzlib inflate of stdlib", data, inflate(pyzlib, case, ref, dictionary)
+        )
+        if _byte_exact(case):
+            _compare("stdlib deflate", ref, zdata)
+        if backend is not None:
+            name = os.path.basename(backend.path)
+            zdata2 = deflate(backend, case, data, dictionary)
+            _compare(
+                "pyzlib inflate of " + name,
+                data,
+                inflate(pyzlib, case, zdata2, dictionary),
+            )
+            _compare(name + " inflate", data, inflate(backend, case, zdata, dictionary))
+    except Failure as e:
+        return str(e)
+    except Exception:
+        return traceback.format_exc(limit=1)
+    return None
+
+
+def _shrink_candidates(case):
+    ops = case["ops"]
+    n = len(ops) // 2
+    while n >= 1:
+        for i in range(0, len(ops), n):
+            if len(ops) > n:
+                yield dict(case, ops=ops[:i] + ops[i + n :])
+        n //= 2
+    for i, op in enumerate(ops):
+        if op[0] == "data":
+            if op[1] > 1:
+                yield dict(
+                    case, ops=ops[:i] + [["data", op[1] // 2, op[2]]] + ops[i + 1 :]
+                )
+            if op[2] != pyzlib.Z_NO_FLUSH:
+                yield dict(
+                    case,
+                    ops=ops[:i] + [["data", op[1], pyzlib.Z_NO_FLUSH]] + ops[i + 1 :],
+                )
+    for key, simple in (
+        ("dictionary", 0),
+        ("level", pyzlib.Z_DEFAULT_COMPRESSION),
+        ("strategy", pyzlib.Z_DEFAULT_STRATEGY),
+        ("mem_level", pyzlib.DEF_MEM_LEVEL),
+        ("deflate_out", [65536]),
+        ("inflate_chunks", [[65536, 65536]]),
+    ):
+        if case[key] != simple:
+            yield dict(case, **{key: simple})
+    if case["dictionary"] > 1:
+        yield dict(case, dictionary=case["dictionary"] // 2)
+
+
+def minimize(case, check=run_case, max_steps=10000):
+    # Greedily applies simplifications for as long as the case keeps failing
+    steps = 0
+    progress = True
+    while progress and steps < max_steps:
+        progress = False
+        for candidate in _shrink_candidates(case):
+            steps += 1
+            if check(candidate) is not None:
+                case = candidate
+                progress = True
+                break
+            if steps >= max_steps:
+                break
+    return case
+
+
+_backend = None
+
+
+def _init_worker(backend_path):
+    global _backend
+    if backend_path is not None:
+        _backend = Library(backend_path)
+
+
+def _run_batch(seeds, max_size):
+    failures = []
+    for seed in seeds:
+        case = make_case(seed, max_size)
+        error = run_case(case, _backend)
+        if error is not None:
+            failures.append((case, error))
+    return failures
+
+
+def fuzz(
+    cases=None,
+    duration=None,
+    seed=None,
+    workers=None,
+    max_size=DEFAULT_MAX_SIZE,
+    backend_path=None,
+    batch_size=DEFAULT_BATCH_SIZE,
+    minimize_failures=True,
+):
+    # Runs cases seed, seed + 1, ... until there are enough of them or the
+    # time runs out. Returns the number of cases and [(case, error), ...].
+    if cases is None and duration is None:
+        raise Exception("either cases or duration must be specified")
+    if seed is None:
+        seed = random.getrandbits(32)
+    if workers is None:
+        workers = os.cpu_count()
+    deadline = None if duration is None else time.monotonic() + duration
+    failures = []
+    done = 0
+    with concurrent.futures.ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(backend_path,)
+    ) as executor:
+        futures = {}
+        next_seed = seed
+        while True:
+            more = cases is None or next_seed < seed + cases
+            if deadline is not None and time.monotonic() >= deadline:
+                more = False
+            # Keep every worker busy, but do not queue too much past the
+            # deadline
+            while more and len(futures) < 2 * workers:
+                n = batch_size
+                if cases is not None:
+                    n = min(n, seed + cases - next_seed)
+                seeds = range(next_seed, next_seed + n)
+                futures[executor.submit(_run_batch, seeds, max_size)] = n
+                next_seed += n
+                more = cases is None or next_seed < seed + cases
+            if not futures:
+                break
+            finished, _ = concurrent.futures.wait(
+                futures, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in finished:
+                failures.extend(future.result())
+                done += futures.pop(future)
+    if minimize_failures:
+        backend = None if backend_path is None else Library(backend_path)
+        minimized = []
+        for case, error in failures:
+            case = minimize(case, lambda c: run_case(c, backend))
+            # Report what the minimized case does, not what the original did
+            minimized.append((case, run_case(case, backend)))
+        failures = minimized
+    return done, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Differential fuzzing of zlib streaming against stdlib zlib"
+    )
+    parser.add_argument("-n", "--cases", type=int)
+    parser.add_argument("-t", "--duration", type=float)
+    parser.add_argument("-s", "--seed", type=int)
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--max-size", type=int, default=DEFAULT_MAX_SIZE)
+    parser.add_argument(
+        "--backend", help="path to a second zlib-compatible shared library"
+    )
+    parser.add_argument("--replay", help="JSON case printed by a previous run")
+    args = parser.parse_args()
+    if args.replay is not None:
+        backend = None if args.backend is None else Library(args.backend)
+        error = run_case(json.loads(args.replay), backend)
+        print("ok" if error is None else error)
+        sys.exit(0 if error is None else 1)
+    if args.cases is None and args.duration is None:
+        args.duration = 60
+    if args.seed is None:
+        args.seed = random.getrandbits(32)
+    print("seed {}".format(args.seed), file=sys.stderr)
+    done, failures = fuzz(
+        cases=args.cases,
+        duration=args.duration,
+        seed=args.seed,
+        workers=args.jobs,
+        max_size=args.max_size,
+        backend_path=args.backend,
+    )
+    for case, error in failures:
+        print("case {}: {}".format(case["seed"], error.strip()))
+        print(json.dumps(case, separators=(",", ":")))
+    print("{} cases, {} failures".format(done, len(failures)), file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+import argparse
+import collections
+import ctypes
+import mmap
+import struct
+import sys
+
+import pyzlib
+from pyzlib import _buffer, stream
+
+FTEXT = 1
+FHCRC = 2
+FEXTRA = 4
+FNAME = 8
+FCOMMENT = 16
+OS_UNKNOWN = 255
+
+MEMBER_HEADER = struct.Struct("<BBBBIBB")
+MEMBER_TRAILER = struct.Struct("<II")
+SUBFIELD_HEADER = struct.Struct("<2sH")
+# BGZF blocks carry their total size minus one in the "BC" subfield
+BGZF_ID = b"BC"
+BGZF_EXTRA = SUBFIELD_HEADER.pack(BGZF_ID, 2) + b"\x00\x00"
+# The BC subfield of compress_member() output starts after the fixed
+# header and XLEN
+_BGZF_BSIZE_OFFSET = MEMBER_HEADER.size + 2 + SUBFIELD_HEADER.size
+
+Member = collections.namedtuple(
+    "Member",
+    (
+        "offset",
+        "size",
+        "header_size",
+        "flags",
+        "mtime",
+        "xflags",
+        "os",
+        "extra",
+        "name",
+        "comment",
+        "crc",
+        "isize",
+        "indexed",
+    ),
+)
+
+
+def _terminated(buf):
+    # deflate() writes name and comment up to the first zero byte
+    if bytes(memoryview(buf).cast("B")[-1:]) != b"\x00":
+        raise ValueError("name and comment must be zero-terminated")
+    return buf
+
+
+class GzipHeader(pyzlib.gz_header):
+    # A gz_header that keeps the memory it points to alive. Nothing is
+    # copied: deflate() reads extra, name and comment from the caller's
+    # buffers, and inflate() fills them in place.
+    @classmethod
+    def for_deflate(
+        cls,
+        text=False,
+        mtime=0,
+        os=OS_UNKNOWN,
+        extra=None,
+        name=None,
+        comment=None,
+        hcrc=False,
+    ):
+        head = cls(text=int(text), time=mtime, os=os, hcrc=int(hcrc))
+        head.buffers = (extra, name, comment)
+        if extra is not None:
+            head.extra = _buffer.addressof(extra)
+            head.extra_len = _buffer.nbytes(extra)
+        if name is not None:
+            head.name = _buffer.addressof(_terminated(name))
+        if comment is not None:
+            head.comment = _buffer.addressof(_terminated(comment))
+        return head
+
+    @classmethod
+    def for_inflate(cls, extra=None, name=None, comment=None):
+        # The buffers must be writable; fields that do not fit are truncated
+        head = cls()
+        head.buffers = (extra, name, comment)
+        if extra is not None:
+            head.extra = _buffer.addressof(extra)
+            head.extra_max = _buffer.nbytes(extra)
+        if name is not None:
+            head.name = _buffer.addressof(name)
+            head.name_max = _buffer.nbytes(name)
+        if comment is not None:
+            head.comment = _buffer.addressof(comment)
+            head.comm_max = _buffer.nbytes(comment)
+        return head
+
+    def extra_view(self):
+        extra = self.buffers[0]
+        if extra is None:
+            return None
+        n = min(self.extra_len, _buffer.nbytes(extra))
+        return memoryview(extra).cast("B")[:n]
+
+
+def compress_member(
+    data,
+    level=pyzlib.Z_DEFAULT_COMPRESSION,
+    mtime=0,
+    name=None,
+    comment=None,
+    bgzf=False,
+):
+    # Returns a single gzip member. With bgzf, the header carries the member
+    # size, so walk() can skip it without inflating it.
+    extra = BGZF_EXTRA if bgzf else None
+    if name is not None:
+        name = bytes(name) + b"\x00"
+    if comment is not None:
+        comment = bytes(comment) + b"\x00"
+    head = GzipHeader.for_deflate(mtime=mtime, extra=extra, name=name, comment=comment)
+    with stream.Deflater(level=level, window_bits=stream.WB_GZIP) as deflater:
+        deflater.set_header(head)
+        member = bytearray(deflater.compress(data, pyzlib.Z_FINISH))
+    if bgzf:
+        if len(member) > 0x10000:
+            raise ValueError("BGZF members must not exceed 64 KiB")
+        struct.pack_into("<H", member, _BGZF_BSIZE_OFFSET, len(member) - 1)
+    return bytes(member)
+
+
+def _subfields(extra):
+    pos = 0
+    while pos + SUBFIELD_HEADER.size <= len(extra):
+        si, size = SUBFIELD_HEADER.unpack_from(extra, pos)
+        pos += SUBFIELD_HEADER.size
+        yield si, extra[pos : pos + size]
+        pos += size
+
+
+def _cstring(view, pos):
+    size = 256
+    while True:
+        end = bytes(view[pos : pos + size]).find(b"\x00")
+        if end != -1:
+            return bytes(view[pos : pos + end]), pos + end + 1
+        if pos + size >= len(view):
+            raise Exception("truncated gzip header")
+        size *= 4
+
+
+def parse_header(view, pos=0):
+    # Returns (fields, header size) of the member header at pos
+    if len(view) - pos < MEMBER_HEADER.size:
+        raise Exception("truncated gzip header")
+    id1, id2, cm, flags, mtime, xflags, os_ = MEMBER_HEADER.unpack_from(view, pos)
+    if (id1, id2, cm) != (0x1F, 0x8B, pyzlib.Z_DEFLATED):
+        raise Exception("not a gzip member at offset {}".format(pos))
+    end = pos + MEMBER_HEADER.size
+    extra = name = comment = None
+    if flags & FEXTRA:
+        if len(view) - end < 2:
+            raise Exception("truncated gzip header")
+        (xlen,) = struct.unpack_from("<H", view, end)
+        extra = bytes(view[end + 2 : end + 2 + xlen])
+        end += 2 + xlen
+    if flags & FNAME:
+        name, end = _cstring(view, end)
+    if flags & FCOMMENT:
+        comment, end = _cstring(view, end)
+    if flags & FHCRC:
+        end += 2
+    if end > len(view):
+        raise Exception("truncated gzip header")
+    fields = {
+        "flags": flags,
+        "mtime": mtime,
+        "xflags": xflags,
+        "os": os_,
+        "extra": extra,
+        "name": name,
+        "comment": comment,
+    }
+    return fields, end - pos
+
+
+def _member_size(fields):
+    if fields["extra"] is None:
+        return None
+    for si, data in _subfields(fields["extra"]):
+        if si == BGZF_ID and len(data) == 2:
+            return struct.unpack("<H", data)[0] + 1
+    return None
+
+
+def _inflated_size(view, start):
+    # Size of the deflate stream at start, found the slow way. The z_stream
+    # is driven directly, because Inflater would copy everything after the
+    # stream into unused_data.
+    with stream.Inflater(window_bits=stream.WB_RAW) as inflater:
+        strm = inflater.strm
+        pos = start
+        while pos < len(view):
+            avail_in = min(len(view) - pos, 1 << 30)
+            strm.next_in = _buffer.addressof(view, pos)
+            strm.avail_in = avail_in
+            strm.next_out = ctypes.addressof(inflater.obuf)
+            strm.avail_out = inflater.buffer_size
+            err = pyzlib.inflate(strm, pyzlib.Z_NO_FLUSH)
+            pos += avail_in - strm.avail_in
+            strm.next_in = None
+            if err == pyzlib.Z_STREAM_END:
+                return pos - start
+            if err not in (pyzlib.Z_OK, pyzlib.Z_BUF_ERROR):
+                raise Exception("inflate() failed with error {}".format(err))
+            if strm.avail_in == 0 and strm.avail_out != 0:
+                break
+    raise Exception("truncated gzip member")
+
+
+def walk(data):
+    # Yields the members of a gzip file. Members whose headers carry their
+    # size are skipped without inflating; the others are inflated and
+    # their output is discarded.
+    view = memoryview(data).cast("B")
+    pos = 0
+    while pos < len(view):
+        fields, header_size = parse_header(view, pos)
+        size = _member_size(fields)
+        indexed = size is not None
+        if not indexed:
+            deflate_size = _inflated_size(view, pos + header_size)
+            size = header_size + deflate_size + MEMBER_TRAILER.size
+        if pos + size > len(view):
+            raise Exception("truncated gzip member at offset {}".format(pos))
+        crc, isize = MEMBER_TRAILER.unpack_from(view, pos + size - 8)
+        yield Member(
+            offset=pos,
+            size=size,
+            header_size=header_size,
+            crc=crc,
+            isize=isize,
+            indexed=indexed,
+            **fields
+        )
+        pos += size
+
+
+def read_member(data, member):
+    # Inflates a single member returned by walk()
+    view = memoryview(data).cast("B")
+    start = member.offset + member.header_size
+    end = member.offset + member.size - MEMBER_TRAILER.size
+    result = stream.decompress(view[start:end], stream.WB_RAW)
+    if pyzlib.crc32(0, result, len(result)) != member.crc:
+        raise Exception("crc mismatch in member at offset {}".format(member.offset))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the members of a gzip file")
+    parser.add_argument("path")
+    args = parser.parse_args()
+    with open(args.path, "rb") as fp:
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for member in walk(mm):
+                print(
+                    "{}\t{}\t{}\t{}\t{}".format(
+                        member.offset,
+                        member.size,
+                        member.isize,
+                        "indexed" if member.indexed else "inflated",
+                        (member.name or b"").decode(errors="replace"),
+                    )
+                )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
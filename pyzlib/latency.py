@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+import argparse
+import ctypes
+import gc
+import json
+import platform
+import sys
+import time
+
+import pyzlib
+from pyzlib import _zlib, corpus
+
+DEFAULT_SIZES = (200, 1024, 4096)
+DEFAULT_ITERATIONS = 10000
+DEFAULT_TOLERANCE = 0.2
+PERCENTILES = (("p50", 0.5), ("p99", 0.99), ("p999", 0.999))
+
+# Every operation is measured in two variants:
+# - "pyzlib" goes through the public wrappers, which call addressof(),
+#   allocate _c_ulong_wrapper objects and convert arguments on every call.
+# - "direct" calls the foreign functions with precomputed addresses and
+#   preallocated length holders, which leaves only argtypes conversion.
+# Their difference is the cost of the wrappers. The "ctypes_call" baseline,
+# a foreign call that does no work, estimates the argtypes conversion and
+# call overhead, so direct minus ctypes_call times the number of foreign
+# calls approximates the time spent inside zlib.
+
+
+class _Ops(object):
+    def __init__(self, data, level):
+        self.data = data
+        self.level = level
+        self.size = len(data)
+        self.src = ctypes.create_string_buffer(data, self.size)
+        self.src_addr = ctypes.addressof(self.src)
+        self.bound = pyzlib.compressBound(self.size)
+        self.dest = ctypes.create_string_buffer(self.bound)
+        self.dest_addr = ctypes.addressof(self.dest)
+        self.dest_len = pyzlib._c_ulong_wrapper()
+        self.dest_len_addr = ctypes.addressof(self.dest_len)
+        err, zlen = pyzlib.compress2(
+            self.dest, self.bound, self.src, self.size, self.level
+        )
+        if err != pyzlib.Z_OK:
+            raise Exception("compress2() failed with error {}".format(err))
+        self.zsrc = ctypes.create_string_buffer(self.dest.raw[:zlen], zlen)
+        self.zsrc_addr = ctypes.addressof(self.zsrc)
+        self.zlen = zlen
+        self.out = ctypes.create_string_buffer(self.size)
+        self.out_addr = ctypes.addressof(self.out)
+        self.strm = pyzlib.z_stream(
+            zalloc=pyzlib.Z_NULL, free=pyzlib.Z_NULL, opaque=pyzlib.Z_NULL
+        )
+        self.strm_addr = ctypes.addressof(self.strm)
+        self.reuse = pyzlib.z_stream(
+            zalloc=pyzlib.Z_NULL, free=pyzlib.Z_NULL, opaque=pyzlib.Z_NULL
+        )
+        self.reuse_addr = ctypes.addressof(self.reuse)
+        self._deflate_init(self.reuse)
+
+    def close(self):
+        pyzlib.deflateEnd(self.reuse)
+
+    def _deflate_init(self, strm):
+        err = pyzlib.deflateInit2(
+            strm,
+            level=self.level,
+            method=pyzlib.Z_DEFLATED,
+            windowBits=pyzlib.MAX_WBITS,
+            memLevel=pyzlib.DEF_MEM_LEVEL,
+            strategy=pyzlib.Z_DEFAULT_STRATEGY,
+        )
+        if err != pyzlib.Z_OK:
+            raise Exception("deflateInit2() failed with error {}".format(err))
+
+    def _deflate_finish(self, strm, addr):
+        strm.next_in = self.src_addr
+        strm.avail_in = self.size
+        strm.next_out = self.dest_addr
+        strm.avail_out = self.bound
+        if addr is None:
+            err = pyzlib.deflate(strm, pyzlib.Z_FINISH)
+        else:
+            err = _zlib.deflate(addr, pyzlib.Z_FINISH)
+        if err != pyzlib.Z_STREAM_END:
+            raise Exception("deflate() failed with error {}".format(err))
+
+    def compress2_pyzlib(self):
+        pyzlib.compress2(self.dest, self.bound, self.src, self.size, self.level)
+
+    def compress2_direct(self):
+        self.dest_len.v = self.bound
+        _zlib.compress2(
+            self.dest_addr, self.dest_len_addr, self.src_addr, self.size, self.level
+        )
+
+    def uncompress_pyzlib(self):
+        pyzlib.uncompress(self.out, self.size, self.zsrc, self.zlen)
+
+    def uncompress_direct(self):
+        self.dest_len.v = self.size
+        _zlib.uncompress(self.out_addr, self.dest_len_addr, self.zsrc_addr, self.zlen)
+
+    def init_deflate_end_pyzlib(self):
+        self._deflate_init(self.strm)
+        self._deflate_finish(self.strm, None)
+        pyzlib.deflateEnd(self.strm)
+
+    def init_deflate_end_direct(self):
+        _zlib.deflateInit2_(
+            self.strm_addr,
+            self.level,
+            pyzlib.Z_DEFLATED,
+            pyzlib.MAX_WBITS,
+            pyzlib.DEF_MEM_LEVEL,
+            pyzlib.Z_DEFAULT_STRATEGY,
+            pyzlib.ZLIB_VERSION,
+            ctypes.sizeof(pyzlib.z_stream),
+        )
+        self._deflate_finish(self.strm, self.strm_addr)
+        _zlib.deflateEnd(self.strm_addr)
+
+    def reset_deflate_pyzlib(self):
+        pyzlib.deflateReset(self.reuse)
+        self._deflate_finish(self.reuse, None)
+
+    def reset_deflate_direct(self):
+        _zlib.deflateReset(self.reuse_addr)
+        self._deflate_finish(self.reuse, self.reuse_addr)
+
+
+OPERATIONS = ("compress2", "uncompress", "init_deflate_end", "reset_deflate")
+VARIANTS = ("pyzlib", "direct")
+# Number of foreign calls per operation in the direct variant
+FOREIGN_CALLS = {
+    "compress2": 1,
+    "uncompress": 1,
+    "init_deflate_end": 3,
+    "reset_deflate": 2,
+}
+
+
+def _ctypes_call():
+    _zlib.adler32(1, None, 0)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    n = len(samples)
+    result = {name: samples[min(n - 1, int(q * n))] for name, q in PERCENTILES}
+    result["mean"] = sum(samples) // n
+    result["n"] = n
+    return result
+
+
+def measure(func, iterations, warmup=None):
+    if warmup is None:
+        warmup = max(1, iterations // 10)
+    for _ in range(warmup):
+        func()
+    samples = [0] * iterations
+    clock = time.perf_counter_ns
+    # Collections would show up as outliers in the tail
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in range(iterations):
+            t0 = clock()
+            func()
+            samples[i] = clock() - t0
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return percentiles(samples)
+
+
+def run(
+    sizes=DEFAULT_SIZES,
+    iterations=DEFAULT_ITERATIONS,
+    level=pyzlib.Z_DEFAULT_COMPRESSION,
+    kind="log",
+    seed=0,
+):
+    # Returns a JSON-serializable report; times are in nanoseconds
+    report = {
+        "zlib_version": pyzlib.zlibVersion().decode(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "kind": kind,
+        "level": level,
+        "iterations": iterations,
+        "ctypes_call": measure(_ctypes_call, iterations),
+        "results": [],
+    }
+    call = report["ctypes_call"]["p50"]
+    for size in sizes:
+        ops = _Ops(corpus.generate(kind, size, seed), level)
+        try:
+            for op in OPERATIONS:
+                stats = {}
+                for variant in VARIANTS:
+                    stats[variant] = measure(
+                        getattr(ops, op + "_" + variant), iterations
+                    )
+                report["results"].append(
+                    {
+                        "op": op,
+                        "size": size,
+                        "pyzlib": stats["pyzlib"],
+                        "direct": stats["direct"],
+                        "wrapper_p50": stats["pyzlib"]["p50"] - stats["direct"]["p50"],
+                        "zlib_p50_estimate": max(
+                            0, stats["direct"]["p50"] - FOREIGN_CALLS[op] * call
+                        ),
+                    }
+                )
+        finally:
+            ops.close()
+    return report
+
+
+def _key(result):
+    return "{}/{}".format(result["op"], result["size"])
+
+
+def compare(baseline, report, tolerance=DEFAULT_TOLERANCE, metric="p99"):
+    # Returns the operations whose public wrapper latency regressed by more
+    # than tolerance, as [(op/size, baseline ns, current ns), ...]
+    old = {_key(result): result["pyzlib"][metric] for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        key = _key(result)
+        if key not in old:
+            continue
+        new = result["pyzlib"][metric]
+        if new > old[key] * (1 + tolerance):
+            regressions.append((key, old[key], new))
+    return regressions
+
+
+def _print_table(report, fp):
+    print(
+        "{:<18}{:>6}{:>10}{:>10}{:>10}{:>10}{:>10}".format(
+            "op", "size", "p50", "p99", "p999", "wrapper", "zlib~"
+        ),
+        file=fp,
+    )
+    for result in report["results"]:
+        print(
+            "{:<18}{:>6}{:>10}{:>10}{:>10}{:>10}{:>10}".format(
+                result["op"],
+                result["size"],
+                result["pyzlib"]["p50"],
+                result["pyzlib"]["p99"],
+                result["pyzlib"]["p999"],
+                result["wrapper_p50"],
+                result["zlib_p50_estimate"],
+            ),
+            file=fp,
+        )
+    print("ctypes call p50: {} ns".format(report["ctypes_call"]["p50"]), file=fp)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure small-message compression latency (ns)"
+    )
+    parser.add_argument(
+        "-s", "--sizes", default=",".join(str(size) for size in DEFAULT_SIZES)
+    )
+    parser.add_argument("-n", "--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("-l", "--level", type=int, default=-1)
+    parser.add_argument("-k", "--kind", choices=sorted(corpus.KINDS), default="log")
+    parser.add_argument("-o", "--output", help="write the JSON report here")
+    parser.add_argument(
+        "--baseline", help="fail if p99 regressed compared to this JSON report"
+    )
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+    report = run(
+        sizes=[int(size) for size in args.sizes.split(",")],
+        iterations=args.iterations,
+        level=args.level,
+        kind=args.kind,
+    )
+    _print_table(report, sys.stderr)
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+    else:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=1)
+    if args.baseline is not None:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        regressions = compare(baseline, report, args.tolerance)
+        for key, old, new in regressions:
+            print("{}: p99 {} ns -> {} ns".format(key, old, new), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+import argparse
+import io
+import queue
+import sys
+import threading
+import time
+
+import pyzlib
+from pyzlib import _buffer, corpus, stream
+
+DEFLATE = "deflate"
+INFLATE = "inflate"
+OPERATIONS = (DEFLATE, INFLATE)
+DEFAULT_DEPTH = 4
+# avail_in and avail_out are unsigned ints
+_MAX_AVAIL = 1 << 30
+
+
+class StageStats(object):
+    # busy is the time a stage spends working, idle is the time it waits
+    # for a buffer from the previous or the next stage
+    def __init__(self, name):
+        self.name = name
+        self.busy = 0.0
+        self.idle = 0.0
+        self.buffers = 0
+        self.bytes = 0
+
+    @property
+    def utilization(self):
+        total = self.busy + self.idle
+        return self.busy / total if total else 0.0
+
+    def __repr__(self):
+        return "{}: {} buffers, {} bytes, busy {:.3f}s, idle {:.3f}s".format(
+            self.name, self.buffers, self.bytes, self.busy, self.idle
+        )
+
+
+class Pipeline(object):
+    # Reads src, deflates or inflates and writes dst on three threads, so
+    # that I/O overlaps with zlib.
+    #
+    # The stages pass buffers through queues: readahead filled input
+    # buffers can wait for zlib, and write_behind filled output buffers can
+    # wait for the writer. Buffers are recycled, so memory use is fixed.
+    # src must have readinto(), and dst must have write().
+    def __init__(
+        self,
+        src,
+        dst,
+        operation=DEFLATE,
+        level=pyzlib.Z_DEFAULT_COMPRESSION,
+        window_bits=stream.WB_ZLIB,
+        mem_level=pyzlib.DEF_MEM_LEVEL,
+        strategy=pyzlib.Z_DEFAULT_STRATEGY,
+        buffer_size=stream.DEFAULT_BUFFER_SIZE,
+        readahead=DEFAULT_DEPTH,
+        write_behind=DEFAULT_DEPTH,
+    ):
+        if operation not in OPERATIONS:
+            raise ValueError("unknown operation {}".format(operation))
+        if readahead < 1 or write_behind < 1:
+            raise ValueError("readahead and write_behind must be positive")
+        self.src = src
+        self.dst = dst
+        self.operation = operation
+        self.window_bits = window_bits
+        if operation == DEFLATE:
+            self.zstream = stream.Deflater(
+                level=level,
+                window_bits=window_bits,
+                mem_level=mem_level,
+                strategy=strategy,
+            )
+            self.func = pyzlib.deflate
+        else:
+            self.zstream = stream.Inflater(window_bits=window_bits)
+            self.func = pyzlib.inflate
+        # One more buffer than the queue depth is in use by the consumer
+        self.in_free = queue.Queue()
+        self.in_full = queue.Queue()
+        self.out_free = queue.Queue()
+        self.out_full = queue.Queue()
+        for _ in range(readahead + 1):
+            self.in_free.put(bytearray(buffer_size))
+        for _ in range(write_behind + 1):
+            self.out_free.put(bytearray(buffer_size))
+        self.stats = {name: StageStats(name) for name in ("read", operation, "write")}
+        self.error = None
+        self.error_lock = threading.Lock()
+        # Output buffer being filled by zlib
+        self.obuf = None
+        self.opos = 0
+        self.ended = False
+
+    def _fail(self, e):
+        with self.error_lock:
+            if self.error is None:
+                self.error = e
+
+    def _get(self, q, stats):
+        t0 = time.perf_counter()
+        item = q.get()
+        stats.idle += time.perf_counter() - t0
+        return item
+
+    def _stage(self, name, body):
+        stats = self.stats[name]
+        t0 = time.perf_counter()
+        try:
+            body(stats)
+        finally:
+            stats.busy = time.perf_counter() - t0 - stats.idle
+
+    def _read(self, stats):
+        try:
+            while self.error is None:
+                buf = self._get(self.in_free, stats)
+                n = self.src.readinto(buf)
+                if not n:
+                    break
+                stats.buffers += 1
+                stats.bytes += n
+                self.in_full.put((buf, n))
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self.in_full.put(None)
+
+    def _emit(self):
+        self.out_full.put((self.obuf, self.opos))
+        self.obuf = None
+
+    def _feed(self, stats, addr, size, flush):
+        strm = self.zstream.strm
+        while True:
+            if self.ended and size != 0:
+                # Concatenated gzip members are inflated as one stream
+                if self.window_bits <= 15:
+                    raise Exception("trailing garbage after stream")
+                self.zstream.reset()
+                self.ended = False
+            if self.obuf is None:
+                self.obuf = self._get(self.out_free, stats)
+                self.opos = 0
+            avail_in = min(size, _MAX_AVAIL)
+            avail_out = min(len(self.obuf) - self.opos, _MAX_AVAIL)
+            strm.next_in = addr
+            strm.avail_in = avail_in
+            strm.next_out = _buffer.addressof(self.obuf, self.opos)
+            strm.avail_out = avail_out
+            err = self.func(strm, flush if avail_in == size else pyzlib.Z_NO_FLUSH)
+            strm.next_in = None
+            strm.next_out = None
+            consumed = avail_in - strm.avail_in
+            addr += consumed
+            size -= consumed
+            self.opos += avail_out - strm.avail_out
+            stats.bytes += avail_out - strm.avail_out
+            full = self.opos == len(self.obuf)
+            if full:
+                self._emit()
+            if err == pyzlib.Z_STREAM_END:
+                if self.operation == DEFLATE:
+                    return
+                self.ended = True
+                if size == 0:
+                    return
+            elif err not in (pyzlib.Z_OK, pyzlib.Z_BUF_ERROR):
+                raise Exception(
+                    "{}() failed with error {}".format(self.func.__name__, err)
+                )
+            elif size == 0 and not full:
+                return
+
+    def _process(self, stats):
+        while True:
+            item = self._get(self.in_full, stats)
+            if item is None:
+                break
+            buf, n = item
+            if self.error is None:
+                try:
+                    self._feed(stats, _buffer.addressof(buf), n, pyzlib.Z_NO_FLUSH)
+                    stats.buffers += 1
+                except BaseException as e:
+                    self._fail(e)
+            self.in_free.put(buf)
+        try:
+            if self.error is None:
+                if self.operation == DEFLATE:
+                    self._feed(stats, 0, 0, pyzlib.Z_FINISH)
+                elif not self.ended:
+                    raise Exception("incomplete or truncated stream")
+                if self.obuf is not None and self.opos != 0:
+                    self._emit()
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self.out_full.put(None)
+
+    def _write(self, stats):
+        while True:
+            item = self._get(self.out_full, stats)
+            if item is None:
+                break
+            buf, n = item
+            if self.error is None:
+                try:
+                    view = memoryview(buf)[:n]
+                    while view:
+                        written = self.dst.write(view)
+                        # Raw files may write less; None means that dst
+                        # does not report how much it wrote
+                        view = view[len(view) if written is None else written :]
+                    stats.buffers += 1
+                    stats.bytes += n
+                except BaseException as e:
+                    self._fail(e)
+            self.out_free.put(buf)
+
+    def run(self):
+        # Returns the stats of the read, deflate or inflate, and write
+        # stages
+        try:
+            threads = [
+                threading.Thread(
+                    target=self._stage,
+                    args=(name, body),
+                    name="pyzlib-pipeline-{}".format(name),
+                )
+                for name, body in (
+                    ("read", self._read),
+                    (self.operation, self._process),
+                    ("write", self._write),
+                )
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            self.zstream.close()
+        if self.error is not None:
+            raise self.error
+        return self.stats
+
+
+def compress(src, dst, level=pyzlib.Z_DEFAULT_COMPRESSION, **kwargs):
+    return Pipeline(src, dst, DEFLATE, level=level, **kwargs).run()
+
+
+def decompress(src, dst, window_bits=stream.WB_ZLIB, **kwargs):
+    return Pipeline(src, dst, INFLATE, window_bits=window_bits, **kwargs).run()
+
+
+class _Throttled(object):
+    # A file that reads at rate bytes per second, like a slow disk
+    def __init__(self, fp, rate):
+        self.fp = fp
+        self.rate = rate
+
+    def readinto(self, b):
+        n = self.fp.readinto(b)
+        time.sleep(n / self.rate)
+        return n
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare sequential and pipelined compression of a slow input"
+    )
+    parser.add_argument("-k", "--kind", choices=sorted(corpus.KINDS), default="log")
+    parser.add_argument("-s", "--size", type=int, default=64 * 1024 * 1024)
+    parser.add_argument("-l", "--level", type=int, default=1)
+    parser.add_argument("-r", "--rate", type=float, default=100, help="input MB/s")
+    parser.add_argument("-d", "--depth", type=int, default=DEFAULT_DEPTH)
+    args = parser.parse_args()
+    data = corpus.generate(args.kind, args.size)
+    rate = args.rate * 1e6
+    t0 = time.perf_counter()
+    src = _Throttled(io.BytesIO(data), rate)
+    buf = bytearray(stream.DEFAULT_BUFFER_SIZE)
+    with stream.Deflater(level=args.level) as deflater:
+        while True:
+            n = src.readinto(buf)
+            if n == 0:
+                break
+            deflater.compress_to(lambda chunk: None, memoryview(buf)[:n])
+        deflater.compress_to(lambda chunk: None, b"", pyzlib.Z_FINISH)
+    t1 = time.perf_counter()
+    stats = compress(
+        _Throttled(io.BytesIO(data), rate),
+        io.BytesIO(),
+        args.level,
+        readahead=args.depth,
+        write_behind=args.depth,
+    )
+    t2 = time.perf_counter()
+    print("sequential {:8.1f} MB/s".format(len(data) / (t1 - t0) / 1e6))
+    print("pipelined  {:8.1f} MB/s".format(len(data) / (t2 - t1) / 1e6))
+    for stage in stats.values():
+        print("  {:<8} {:4.0%} busy  {}".format(stage.name, stage.utilization, stage))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+
+import pyzlib
+from pyzlib import _buffer, corpus, stream
+
+DEFLATE = "deflate"
+INFLATE = "inflate"
+OPERATIONS = (DEFLATE, INFLATE)
+DEFAULT_SLOT_SIZE = 4 * 1024 * 1024
+DEFAULT_MAX_PENDING = 64
+# gzip framing is larger than what compressBound() accounts for
+_FRAMING_SLACK = 64
+# avail_in and avail_out are unsigned ints
+_MAX_AVAIL = 1 << 30
+
+# Every slot is a pair of shared memory segments: the parent copies the
+# input of a batch into the first one, and a worker writes the output into
+# the second one. Only descriptors of the form
+#
+#   (job id, slot, operation, [(offset, size), ...], level, window bits)
+#
+# go through the task queue, and results come back as
+#
+#   (job id, error or None, [(offset, size) or bytes, ...])
+#
+# A slot stays busy until the caller releases the Result that refers to
+# it, which is what bounds memory use. The output segment is sized for
+# deflate. Inflated data that does not fit into what is left of it comes
+# back as bytes through the result queue instead, which costs a copy.
+
+
+def _new_strm():
+    return pyzlib.z_stream(
+        next_in=pyzlib.Z_NULL,
+        avail_in=0,
+        zalloc=pyzlib.Z_NULL,
+        free=pyzlib.Z_NULL,
+        opaque=pyzlib.Z_NULL,
+    )
+
+
+def _deflate_into(src, src_size, dst, dst_size, level, window_bits):
+    # Compresses src_size bytes at src to dst; returns the output size, or
+    # None if it does not fit
+    strm = _new_strm()
+    err = pyzlib.deflateInit2(
+        strm,
+        level=level,
+        method=pyzlib.Z_DEFLATED,
+        windowBits=window_bits,
+        memLevel=pyzlib.DEF_MEM_LEVEL,
+        strategy=pyzlib.Z_DEFAULT_STRATEGY,
+    )
+    if err != pyzlib.Z_OK:
+        raise Exception("deflateInit2() failed with error {}".format(err))
+    try:
+        return _run(pyzlib.deflate, strm, src, src_size, dst, dst_size, True)
+    finally:
+        pyzlib.deflateEnd(strm)
+
+
+def _inflate_into(src, src_size, dst, dst_size, window_bits):
+    strm = _new_strm()
+    err = pyzlib.inflateInit2(strm, window_bits)
+    if err != pyzlib.Z_OK:
+        raise Exception("inflateInit2() failed with error {}".format(err))
+    try:
+        return _run(pyzlib.inflate, strm, src, src_size, dst, dst_size, False)
+    finally:
+        pyzlib.inflateEnd(strm)
+
+
+def _run(func, strm, src, src_size, dst, dst_size, deflate):
+    produced = 0
+    while True:
+        avail_in = min(src_size, _MAX_AVAIL)
+        avail_out = min(dst_size - produced, _MAX_AVAIL)
+        strm.next_in = src
+        strm.avail_in = avail_in
+        strm.next_out = dst + produced
+        strm.avail_out = avail_out
+        flush = pyzlib.Z_FINISH if deflate and avail_in == src_size else 0
+        err = func(strm, flush)
+        strm.next_in = None
+        strm.next_out = None
+        consumed = avail_in - strm.avail_in
+        src += consumed
+        src_size -= consumed
+        produced += avail_out - strm.avail_out
+        if err == pyzlib.Z_STREAM_END:
+            if src_size != 0:
+                raise Exception("trailing garbage after stream")
+            return produced
+        if err not in (pyzlib.Z_OK, pyzlib.Z_BUF_ERROR):
+            raise Exception("{}() failed with error {}".format(func.__name__, err))
+        if produced == dst_size:
+            return None
+        if consumed == 0 and src_size == 0 and not deflate:
+            raise Exception("incomplete or truncated stream")
+
+
+def _worker(input_names, output_names, tasks, results):
+    # Workers share the resource tracker of the parent, which owns the
+    # segments and unlinks them
+    inputs = [shared_memory.SharedMemory(name) for name in input_names]
+    outputs = [shared_memory.SharedMemory(name) for name in output_names]
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            job_id, slot, operation, extents, level, window_bits = task
+            src = _buffer.addressof(inputs[slot].buf)
+            dst = _buffer.addressof(outputs[slot].buf)
+            dst_size = len(outputs[slot].buf)
+            out = []
+            pos = 0
+            try:
+                for offset, size in extents:
+                    if operation == DEFLATE:
+                        n = _deflate_into(
+                            src + offset,
+                            size,
+                            dst + pos,
+                            dst_size - pos,
+                            level,
+                            window_bits,
+                        )
+                        if n is None:
+                            raise Exception("output does not fit into the slot")
+                    else:
+                        n = _inflate_into(
+                            src + offset, size, dst + pos, dst_size - pos, window_bits
+                        )
+                        if n is None:
+                            with inputs[slot].buf[offset : offset + size] as view:
+                                out.append(stream.decompress(view, window_bits))
+                            continue
+                    out.append((pos, n))
+                    pos += n
+            except Exception as e:
+                results.put((job_id, str(e), None))
+                continue
+            results.put((job_id, None, out))
+    finally:
+        for segment in inputs + outputs:
+            segment.close()
+
+
+class Result(object):
+    # Zero-copy views of a batch's output in shared memory. The slot is
+    # reused once the result is released, so the views must not be used
+    # afterwards.
+    def __init__(self, pool, slot, extents):
+        self.pool = pool
+        self.slot = slot
+        buf = pool.outputs[slot].buf
+        self.views = [
+            (
+                memoryview(extent)
+                if isinstance(extent, bytes)
+                else buf[extent[0] : extent[0] + extent[1]]
+            )
+            for extent in extents
+        ]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    @property
+    def view(self):
+        return self.views[0]
+
+    def tobytes(self):
+        # Copies and releases
+        try:
+            if len(self.views) == 1:
+                return self.views[0].tobytes()
+            return [view.tobytes() for view in self.views]
+        finally:
+            self.release()
+
+    def release(self):
+        if self.pool is None:
+            return
+        for view in self.views:
+            view.release()
+        self.views = []
+        self.pool._release(self.slot)
+        self.pool = None
+
+
+class CompressionPool(object):
+    # Worker processes deflate or inflate batches in shared memory.
+    #
+    # Submissions are queued per tenant, and a slot that becomes free goes
+    # to the next tenant in round-robin order, so a tenant with a long
+    # backlog cannot starve the others. submit() blocks while the tenant
+    # already has max_pending batches queued.
+    def __init__(
+        self,
+        workers=None,
+        slots=None,
+        slot_size=DEFAULT_SLOT_SIZE,
+        output_size=None,
+        max_pending=DEFAULT_MAX_PENDING,
+        context=None,
+    ):
+        workers = workers or os.cpu_count() or 1
+        slots = slots or 2 * workers
+        if output_size is None:
+            output_size = pyzlib.compressBound(slot_size) + _FRAMING_SLACK
+        self.slot_size = slot_size
+        self.output_size = output_size
+        self.max_pending = max_pending
+        self.inputs = []
+        self.outputs = []
+        self.processes = []
+        self.closed = False
+        try:
+            for _ in range(slots):
+                self.inputs.append(
+                    shared_memory.SharedMemory(create=True, size=slot_size)
+                )
+                self.outputs.append(
+                    shared_memory.SharedMemory(create=True, size=output_size)
+                )
+            # Threads are started after the workers, which is what fork needs
+            context = context or multiprocessing.get_context("spawn")
+            self.tasks = context.SimpleQueue()
+            self.results = context.SimpleQueue()
+            for _ in range(workers):
+                process = context.Process(
+                    target=_worker,
+                    args=(
+                        [segment.name for segment in self.inputs],
+                        [segment.name for segment in self.outputs],
+                        self.tasks,
+                        self.results,
+                    ),
+                    daemon=True,
+                )
+                process.start()
+                self.processes.append(process)
+        except BaseException:
+            self._free_segments()
+            raise
+        self.cond = threading.Condition()
+        self.free_slots = list(range(slots))
+        # {tenant: deque of (future, operation, items, level, window bits)}
+        self.pending = {}
+        # Tenants with pending batches, in round-robin order
+        self.ready = collections.deque()
+        # {job id: (future, slot)}
+        self.running = {}
+        self.job_ids = itertools.count()
+        self.dispatcher = threading.Thread(
+            target=self._dispatch, name="pyzlib-procpool-dispatch", daemon=True
+        )
+        self.collector = threading.Thread(
+            target=self._collect, name="pyzlib-procpool-collect", daemon=True
+        )
+        self.dispatcher.start()
+        self.collector.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def submit_batch(
+        self,
+        operation,
+        items,
+        tenant=None,
+        level=pyzlib.Z_DEFAULT_COMPRESSION,
+        window_bits=stream.WB_ZLIB,
+    ):
+        # Returns a future of a Result with one view per item. The items are
+        # processed by one worker and must fit into a slot together.
+        if operation not in OPERATIONS:
+            raise ValueError("unknown operation {}".format(operation))
+        items = list(items)
+        if sum(_buffer.nbytes(item) for item in items) > self.slot_size:
+            raise ValueError("batch does not fit into a slot")
+        future = concurrent.futures.Future()
+        with self.cond:
+            queue = self.pending.setdefault(tenant, collections.deque())
+            while len(queue) >= self.max_pending and not self.closed:
+                self.cond.wait()
+            if self.closed:
+                raise Exception("pool is closed")
+            if not queue:
+                self.ready.append(tenant)
+            queue.append((future, operation, items, level, window_bits))
+            self.cond.notify_all()
+        return future
+
+    def submit(self, operation, data, tenant=None, **kwargs):
+        return self.submit_batch(operation, (data,), tenant, **kwargs)
+
+    def compress(self, data, tenant=None, **kwargs):
+        with self.submit(DEFLATE, data, tenant, **kwargs).result() as result:
+            return result.view.tobytes()
+
+    def decompress(self, data, tenant=None, **kwargs):
+        with self.submit(INFLATE, data, tenant, **kwargs).result() as result:
+            return result.view.tobytes()
+
+    def _next_job(self):
+        # Called with cond held
+        tenant = self.ready.popleft()
+        queue = self.pending[tenant]
+        job = queue.popleft()
+        if queue:
+            self.ready.append(tenant)
+        else:
+            del self.pending[tenant]
+        return job
+
+    def _dispatch(self):
+        while True:
+            with self.cond:
+                while not self.closed and not (self.free_slots and self.ready):
+                    self.cond.wait()
+                if self.closed:
+                    return
+                slot = self.free_slots.pop()
+                future, operation, items, level, window_bits = self._next_job()
+                job_id = next(self.job_ids)
+                self.running[job_id] = (future, slot)
+                # Wakes up submitters blocked on max_pending
+                self.cond.notify_all()
+            buf = self.inputs[slot].buf
+            extents = []
+            pos = 0
+            for item in items:
+                size = _buffer.nbytes(item)
+                buf[pos : pos + size] = memoryview(item).cast("B")
+                extents.append((pos, size))
+                pos += size
+            self.tasks.put((job_id, slot, operation, extents, level, window_bits))
+
+    def _collect(self):
+        while True:
+            message = self.results.get()
+            if message is None:
+                return
+            job_id, error, extents = message
+            with self.cond:
+                future, slot = self.running.pop(job_id)
+                self.cond.notify_all()
+            if error is not None:
+                self._release(slot)
+                future.set_exception(Exception(error))
+            else:
+                future.set_result(Result(self, slot, extents))
+
+    def _release(self, slot):
+        with self.cond:
+            self.free_slots.append(slot)
+            self.cond.notify_all()
+
+    def _free_segments(self):
+        for segment in self.inputs + self.outputs:
+            try:
+                segment.close()
+            except BufferError:
+                # A Result that has not been released; the mapping goes away
+                # with the process
+                pass
+            segment.unlink()
+        self.inputs = []
+        self.outputs = []
+
+    def close(self):
+        # Waits for submitted batches. Results that have not been released
+        # become invalid.
+        with self.cond:
+            if self.closed:
+                return
+            while self.ready or self.running:
+                self.cond.wait()
+            self.closed = True
+            self.cond.notify_all()
+        self.dispatcher.join()
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join()
+        self.results.put(None)
+        self.collector.join()
+        self._free_segments()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare a compression pool with in-process compression"
+    )
+    parser.add_argument("-k", "--kind", choices=sorted(corpus.KINDS), default="log")
+    parser.add_argument("-s", "--size", type=int, default=64 * 1024)
+    parser.add_argument("-n", "--count", type=int, default=1024)
+    parser.add_argument("-b", "--batch", type=int, default=16)
+    parser.add_argument("-l", "--level", type=int, default=1)
+    parser.add_argument("-j", "--jobs", type=int)
+    args = parser.parse_args()
+    data = corpus.generate(args.kind, args.size)
+    total = args.size * args.count
+    t0 = time.perf_counter()
+    for _ in range(args.count):
+        stream.compress(data, args.level)
+    t1 = time.perf_counter()
+    print("in-process {:8.1f} MB/s".format(total / (t1 - t0) / 1e6))
+    with CompressionPool(
+        args.jobs, slot_size=max(DEFAULT_SLOT_SIZE, args.size * args.batch)
+    ) as pool:
+        t0 = time.perf_counter()
+        # Slots are only reused after release, so results are released while
+        # later batches are submitted
+        futures = collections.deque()
+        for i in range(0, args.count, args.batch):
+            batch = [data] * min(args.batch, args.count - i)
+            futures.append(pool.submit_batch(DEFLATE, batch, level=args.level))
+            if len(futures) > len(pool.inputs):
+                futures.popleft().result().release()
+        for future in futures:
+            future.result().release()
+        t1 = time.perf_counter()
+    print("pool       {:8.1f} MB/s".format(total / (t1 - t0) / 1e6))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
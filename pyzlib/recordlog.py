@@ -0,0 +1,325 @@
+import array
+import bisect
+import ctypes
+import mmap
+import os
+import struct
+import sys
+
+import pyzlib
+from pyzlib import _buffer
+from pyzlib.stream import DEFAULT_BUFFER_SIZE, WB_RAW, Deflater, Inflater
+
+# The log is a single raw deflate stream without a final block. Every batch
+# of records ends with Z_FULL_FLUSH, so decompression can start at any batch
+# boundary. Records are framed as (length, crc32, payload).
+#
+# The sidecar index consists of a header and batch start offsets. Batch i
+# contains records [i * batch_size, (i + 1) * batch_size).
+INDEX_MAGIC = b"PZRLIDX1"
+INDEX_HEADER = struct.Struct("<8sQ")
+RECORD_HEADER = struct.Struct("<II")
+DEFAULT_BATCH_SIZE = 1024
+# Garbage produced by damaged data tends to have huge record lengths
+DEFAULT_MAX_RECORD_SIZE = 16 * 1024 * 1024
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+def _crc32(data):
+    return pyzlib.crc32(0, _buffer.addressof(data), _buffer.nbytes(data))
+
+
+def _read_index(path):
+    with open(index_path(path), "rb") as fp:
+        magic, batch_size = INDEX_HEADER.unpack(fp.read(INDEX_HEADER.size))
+        if magic != INDEX_MAGIC:
+            raise Exception("{} is not a record log index".format(index_path(path)))
+        offsets = array.array("Q")
+        data = fp.read()
+        # Ignore a torn trailing entry
+        offsets.frombytes(data[: len(data) - len(data) % offsets.itemsize])
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    return batch_size, offsets
+
+
+class _RecordParser(object):
+    def __init__(self, max_record_size=None):
+        self.buf = bytearray()
+        self.corrupted = False
+        self.max_record_size = max_record_size
+
+    def feed(self, chunk, records):
+        buf = self.buf
+        buf += chunk
+        pos = 0
+        end = len(buf)
+        while end - pos >= RECORD_HEADER.size:
+            size, crc = RECORD_HEADER.unpack_from(buf, pos)
+            start = pos + RECORD_HEADER.size
+            if self.max_record_size is not None and size > self.max_record_size:
+                self.corrupted = True
+                break
+            if end - start < size:
+                break
+            record = bytes(buf[start : start + size])
+            if _crc32(record) != crc:
+                self.corrupted = True
+                break
+            records.append(record)
+            pos = start + size
+        del buf[:pos]
+
+    def reset(self):
+        del self.buf[:]
+        self.corrupted = False
+
+
+class RecordLogWriter(object):
+    def __init__(
+        self,
+        path,
+        batch_size=DEFAULT_BATCH_SIZE,
+        level=pyzlib.Z_DEFAULT_COMPRESSION,
+        buffer_size=DEFAULT_BUFFER_SIZE,
+    ):
+        self.path = path
+        if os.path.exists(index_path(path)):
+            # Drop whatever a crash left after the last intact flush point,
+            # so that the new deflate stream starts on a block boundary
+            with RecordLogReader(path) as reader:
+                self.batch_size = reader.batch_size
+                self.count = len(reader)
+                size = reader.end
+                batches = reader.batches
+            os.truncate(path, size)
+            os.truncate(index_path(path), INDEX_HEADER.size + 8 * batches)
+            self.index = open(index_path(path), "ab")
+        else:
+            self.batch_size = batch_size
+            self.count = 0
+            self.index = open(index_path(path), "wb")
+            self.index.write(INDEX_HEADER.pack(INDEX_MAGIC, batch_size))
+        self.fp = open(path, "ab")
+        self.deflater = Deflater(
+            level=level, window_bits=WB_RAW, buffer_size=buffer_size
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def append(self, record):
+        if self.count % self.batch_size == 0:
+            self.index.write(struct.pack("<Q", self.fp.tell()))
+        header = RECORD_HEADER.pack(_buffer.nbytes(record), _crc32(record))
+        self.deflater.compress_to(self.fp.write, header)
+        self.deflater.compress_to(self.fp.write, record)
+        self.count += 1
+        if self.count % self.batch_size == 0:
+            self.flush()
+
+    def flush(self):
+        self.deflater.compress_to(self.fp.write, b"", pyzlib.Z_FULL_FLUSH)
+        self.fp.flush()
+        self.index.flush()
+
+    def sync(self):
+        self.flush()
+        os.fsync(self.fp.fileno())
+        os.fsync(self.index.fileno())
+
+    def close(self):
+        if self.fp is None:
+            return
+        self.flush()
+        self.deflater.close()
+        self.fp.close()
+        self.index.close()
+        self.fp = None
+
+
+class RecordLogReader(object):
+    def __init__(self, path, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.batch_size, self.offsets = _read_index(path)
+        self.fd = os.open(path, os.O_RDONLY)
+        self.size = os.fstat(self.fd).st_size
+        # Drop batches whose data did not make it to disk
+        while len(self.offsets) > 0 and self.offsets[-1] >= self.size:
+            self.offsets.pop()
+        # End of the intact data; recover() looks at the whole file
+        self.end = 0
+        self._len = 0
+        if len(self.offsets) > 0:
+            # After a crash, the last batch may end with a torn block
+            start = self.offsets[-1]
+            data = os.pread(self.fd, self.size - start, start)
+            end, n = _intact_end(data, buffer_size)
+            self.end = start + end
+            if n == 0:
+                self.offsets.pop()
+                self.end = start
+            self._len = len(self.offsets) * self.batch_size
+            if n != 0:
+                self._len += n - self.batch_size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        batch, j = divmod(i, self.batch_size)
+        if i < 0 or batch >= len(self.offsets):
+            raise IndexError("record index out of range")
+        records = self.read_batch(batch)
+        if j >= len(records):
+            raise IndexError("record index out of range")
+        return records[j]
+
+    @property
+    def batches(self):
+        return len(self.offsets)
+
+    def batch_extent(self, batch):
+        start = self.offsets[batch]
+        if batch + 1 < len(self.offsets):
+            return start, self.offsets[batch + 1]
+        return start, self.end
+
+    def read_batch(self, batch):
+        # pread() does not share the file position, so batches can be read
+        # concurrently from multiple threads.
+        start, end = self.batch_extent(batch)
+        data = os.pread(self.fd, end - start, start)
+        parser = _RecordParser()
+        records = []
+        with Inflater(window_bits=WB_RAW, buffer_size=self.buffer_size) as inflater:
+            inflater.decompress_to(lambda chunk: parser.feed(chunk, records), data)
+        if parser.corrupted or len(parser.buf) != 0:
+            raise Exception("batch {} is corrupted".format(batch))
+        return records
+
+    def iter_batches(self, start=0, stop=None):
+        if stop is None:
+            stop = len(self.offsets)
+        for batch in range(start, stop):
+            yield self.read_batch(batch)
+
+    def __iter__(self):
+        for records in self.iter_batches():
+            for record in records:
+                yield record
+
+    def recover(self, max_record_size=DEFAULT_MAX_RECORD_SIZE):
+        if self.size == 0:
+            return
+        mm = mmap.mmap(self.fd, self.size, access=mmap.ACCESS_READ)
+        try:
+            for record in _recover(mm, self.offsets, self.buffer_size, max_record_size):
+                yield record
+        finally:
+            mm.close()
+
+
+def _intact_end(data, buffer_size):
+    # Returns the end of the last byte-aligned block boundary in a batch at
+    # which all records are complete, and the number of records before it
+    parser = _RecordParser()
+    records = []
+    end = 0
+    n = 0
+    base = _buffer.addressof(data)
+    size = len(data)
+    with Inflater(window_bits=WB_RAW, buffer_size=buffer_size) as inflater:
+        strm = inflater.strm
+        obuf = inflater.obuf
+        pos = 0
+        while pos < size:
+            avail_in = min(size - pos, 1 << 30)
+            strm.next_in = base + pos
+            strm.avail_in = avail_in
+            strm.next_out = ctypes.addressof(obuf)
+            strm.avail_out = buffer_size
+            err = pyzlib.inflate(strm, pyzlib.Z_BLOCK)
+            pos += avail_in - strm.avail_in
+            parser.feed(obuf[: buffer_size - strm.avail_out], records)
+            if err != pyzlib.Z_OK or parser.corrupted:
+                break
+            if strm.data_type & 128 and strm.data_type & 7 == 0:
+                if len(parser.buf) == 0:
+                    end = pos
+                    n = len(records)
+    return end, n
+
+
+def _recover(mm, offsets, buffer_size, max_record_size):
+    size = len(mm)
+    base = _buffer.addressof(mm)
+    parser = _RecordParser(max_record_size)
+    records = []
+    with Inflater(window_bits=WB_RAW, buffer_size=buffer_size) as inflater:
+        strm = inflater.strm
+        obuf = inflater.obuf
+        # Last block boundary at which all records were intact
+        good = 0
+        pos = 0
+        while pos < size:
+            avail_in = min(size - pos, 1 << 30)
+            strm.next_in = base + pos
+            strm.avail_in = avail_in
+            strm.next_out = ctypes.addressof(obuf)
+            strm.avail_out = buffer_size
+            err = pyzlib.inflate(strm, pyzlib.Z_BLOCK)
+            pos += avail_in - strm.avail_in
+            parser.feed(obuf[: buffer_size - strm.avail_out], records)
+            for record in records:
+                yield record
+            del records[:]
+            if err == pyzlib.Z_OK and not parser.corrupted:
+                if strm.data_type & 128 and len(parser.buf) == 0:
+                    good = pos
+                continue
+            if err == pyzlib.Z_BUF_ERROR and not parser.corrupted:
+                break
+            # The data is damaged: drop the partial record and skip to the
+            # next full flush point, which might be inside the same batch, or
+            # to the next batch boundary if there is none. Damage is detected
+            # late, so start looking right after the last good block
+            # boundary.
+            parser.reset()
+            inflater.reset()
+            pos = good + 1
+            if pos >= size:
+                break
+            avail_in = min(size - pos, 1 << 30)
+            strm.next_in = base + pos
+            strm.avail_in = avail_in
+            err = pyzlib.inflateSync(strm)
+            if err == pyzlib.Z_OK:
+                pos += avail_in - strm.avail_in
+            else:
+                inflater.reset()
+                i = bisect.bisect_left(offsets, pos)
+                if i == len(offsets):
+                    break
+                pos = offsets[i]
+            good = pos
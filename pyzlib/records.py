@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+import argparse
+import io
+import json
+import re
+import struct
+import sys
+import time
+
+import pyzlib
+from pyzlib import _buffer, corpus, stream
+
+DEFAULT_NBUFFERS = 4
+DEFAULT_READ_SIZE = 256 * 1024
+LENGTH_PREFIX = struct.Struct("<I")
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# avail_in and avail_out are unsigned ints
+_MAX_AVAIL = 1 << 30
+
+
+class RecordReader(object):
+    # Reads lines and length-prefixed records from a compressed stream.
+    #
+    # Output is inflated into a ring of nbuffers buffers. Records that lie
+    # within one buffer are returned as memoryviews of it, which stay valid
+    # until the buffer is reused nbuffers - 1 fills later. Only records that
+    # span two buffers are copied. source is either a binary file or a
+    # bytes-like object holding the whole stream.
+    def __init__(
+        self,
+        source,
+        window_bits=stream.WB_AUTO,
+        buffer_size=stream.DEFAULT_BUFFER_SIZE,
+        nbuffers=DEFAULT_NBUFFERS,
+        read_size=DEFAULT_READ_SIZE,
+        inflater=None,
+    ):
+        if inflater is None:
+            inflater = stream.Inflater(window_bits=window_bits)
+        self.inflater = inflater
+        if hasattr(source, "readinto"):
+            self.fp = source
+            self.ibuf = bytearray(read_size)
+            self.addr_in = 0
+            self.avail_in = 0
+        else:
+            self.fp = None
+            self.ibuf = source
+            self.addr_in = _buffer.addressof(source)
+            self.avail_in = _buffer.nbytes(source)
+        self.ring = [bytearray(buffer_size) for _ in range(nbuffers)]
+        self.views = [memoryview(buf) for buf in self.ring]
+        self.index = -1
+        self.buf = b""
+        self.view = memoryview(self.buf)
+        self.pos = 0
+        self.end = 0
+        self.eof = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.inflater is not None:
+            self.inflater.close()
+            self.inflater = None
+
+    def _inflate(self, addr, size):
+        # Inflates up to size bytes to addr, reading input as needed.
+        # Returns the number of bytes produced, which is less than size only
+        # at the end of the stream.
+        strm = self.inflater.strm
+        produced = 0
+        while produced < size and not self.eof:
+            if self.avail_in == 0 and self.fp is not None:
+                self.avail_in = self.fp.readinto(self.ibuf)
+                self.addr_in = _buffer.addressof(self.ibuf)
+            if self.avail_in == 0:
+                raise Exception("incomplete or truncated stream")
+            avail_out = min(size - produced, _MAX_AVAIL)
+            avail_in = min(self.avail_in, _MAX_AVAIL)
+            strm.next_in = self.addr_in
+            strm.avail_in = avail_in
+            strm.next_out = addr + produced
+            strm.avail_out = avail_out
+            err = pyzlib.inflate(strm, pyzlib.Z_NO_FLUSH)
+            strm.next_in = None
+            strm.next_out = None
+            consumed = avail_in - strm.avail_in
+            self.addr_in += consumed
+            self.avail_in -= consumed
+            produced += avail_out - strm.avail_out
+            if err == pyzlib.Z_STREAM_END:
+                self.eof = True
+            elif err not in (pyzlib.Z_OK, pyzlib.Z_BUF_ERROR):
+                raise Exception("inflate() failed with error {}".format(err))
+        return produced
+
+    def _fill(self):
+        # Moves on to the next buffer of the ring. Returns False at the end
+        # of the stream.
+        if self.eof:
+            return False
+        self.index = (self.index + 1) % len(self.ring)
+        self.buf = self.ring[self.index]
+        self.view = self.views[self.index]
+        self.pos = 0
+        self.end = self._inflate(_buffer.addressof(self.buf), len(self.buf))
+        return self.end != 0 or not self.eof
+
+    def readline(self):
+        # Returns the next line including its newline, or b"" at the end
+        pos = self.buf.find(b"\n", self.pos, self.end)
+        if pos != -1:
+            line = self.view[self.pos : pos + 1]
+            self.pos = pos + 1
+            return line
+        parts = [bytes(self.view[self.pos : self.end])]
+        self.pos = self.end
+        while self._fill():
+            pos = self.buf.find(b"\n", 0, self.end)
+            if pos != -1:
+                parts.append(self.view[: pos + 1])
+                self.pos = pos + 1
+                break
+            parts.append(bytes(self.view[: self.end]))
+            self.pos = self.end
+        return b"".join(parts)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def lines(self):
+        # Yields lines without their newlines; the last line need not end
+        # with one
+        for line in self:
+            if line[-1:] == b"\n":
+                line = line[:-1]
+            yield line
+
+    def readinto(self, b):
+        # Copies what is left in the current buffer, then inflates straight
+        # into b. Returns fewer than len(b) bytes only at the end.
+        size = _buffer.nbytes(b)
+        n = min(size, self.end - self.pos)
+        out = memoryview(b).cast("B")
+        out[:n] = self.view[self.pos : self.pos + n]
+        self.pos += n
+        if n < size:
+            n += self._inflate(_buffer.addressof(b, n), size - n)
+        return n
+
+    def read(self, size=-1):
+        if size < 0:
+            chunks = [bytes(self.view[self.pos : self.end])]
+            self.pos = self.end
+            while self._fill():
+                chunks.append(bytes(self.view[: self.end]))
+                self.pos = self.end
+            return b"".join(chunks)
+        result = bytearray(size)
+        return bytes(result[: self.readinto(result)])
+
+    def _take(self, size):
+        # Returns the next size bytes, which are copied only if they span
+        # buffers, or None at the end
+        if self.end - self.pos >= size:
+            data = self.view[self.pos : self.pos + size]
+            self.pos += size
+            return data
+        if self.pos == self.end and not self._fill():
+            return None
+        if self.end - self.pos >= size:
+            return self._take(size)
+        data = bytearray(size)
+        n = self.readinto(data)
+        if n != size:
+            raise Exception("truncated record")
+        return data
+
+    def read_record(self, prefix=LENGTH_PREFIX):
+        # Returns the payload of the next record framed as (length,
+        # payload), or None at the end
+        header = self._take(prefix.size)
+        if header is None:
+            return None
+        if len(header) != prefix.size:
+            raise Exception("truncated record")
+        (size,) = prefix.unpack(header)
+        if size == 0:
+            return b""
+        payload = self._take(size)
+        if payload is None:
+            raise Exception("truncated record")
+        return payload
+
+    def records(self, prefix=LENGTH_PREFIX):
+        while True:
+            record = self.read_record(prefix)
+            if record is None:
+                return
+            yield record
+
+    def ndjson(self, decoder=None):
+        # Yields the objects of a newline-delimited JSON stream. Whole lines
+        # of a buffer are decoded to str at once and parsed in place.
+        raw_decode = (decoder or json.JSONDecoder()).raw_decode
+        skip = _WHITESPACE.match
+        while True:
+            last = self.buf.rfind(b"\n", self.pos, self.end)
+            if last != -1:
+                text = str(self.view[self.pos : last + 1], "utf-8")
+                self.pos = last + 1
+                i = skip(text).end()
+                while i < len(text):
+                    obj, i = raw_decode(text, i)
+                    yield obj
+                    i = skip(text, i).end()
+            line = self.readline()
+            if not line:
+                return
+            if line.strip():
+                yield json.loads(bytes(line))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare NDJSON ingestion from a compressed stream"
+    )
+    parser.add_argument("-s", "--size", type=int, default=32 * 1024 * 1024)
+    args = parser.parse_args()
+    lines = corpus.generate("log", args.size).splitlines()
+    ndjson = b"".join(
+        b'{"n": %d, "line": "%s"}\n' % (i, line) for i, line in enumerate(lines)
+    )
+    zdata = stream.compress(ndjson, 1, stream.WB_GZIP)
+    t0 = time.perf_counter()
+    # Accumulating output in a bytearray and deleting consumed lines
+    count = 0
+    buf = bytearray()
+    with stream.Inflater(window_bits=stream.WB_GZIP) as inflater:
+
+        def write(chunk):
+            nonlocal count
+            buf.extend(chunk)
+            while True:
+                pos = buf.find(b"\n")
+                if pos == -1:
+                    break
+                json.loads(buf[:pos])
+                del buf[: pos + 1]
+                count += 1
+
+        inflater.decompress_to(write, zdata)
+    t1 = time.perf_counter()
+    with RecordReader(io.BytesIO(zdata)) as reader:
+        n = sum(1 for _ in reader.ndjson())
+    t2 = time.perf_counter()
+    if n != count:
+        raise Exception("{} != {}".format(n, count))
+    print("bytearray {:8.1f} MB/s".format(len(ndjson) / (t1 - t0) / 1e6))
+    print("ndjson    {:8.1f} MB/s".format(len(ndjson) / (t2 - t1) / 1e6))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+import argparse
+import collections
+import concurrent.futures
+import ctypes
+import mmap
+import os
+import sys
+import tempfile
+
+import pyzlib
+from pyzlib import _buffer, framing
+from pyzlib.stream import DEFAULT_BUFFER_SIZE, WB_AUTO, WB_RAW, Inflater
+
+# damaged means that the output failed the check value of its member
+Range = collections.namedtuple(
+    "Range",
+    ("in_start", "in_end", "out_start", "out_end", "damaged"),
+    defaults=(False,),
+)
+
+SYNC_MARKER = b"\x00\x00\xff\xff"
+GZIP_MAGIC = b"\x1f\x8b\x08"
+# A candidate block boundary must decode at least this much. Decoding from
+# a wrong position with an empty window fails much sooner than that.
+MIN_DECODED_SIZE = 4096
+# Brute force tries 8 bit offsets per byte
+DEFAULT_MAX_SCAN = 64 * 1024
+# Regions smaller than this are not worth splitting
+MIN_REGION_SIZE = 4 * 1024 * 1024
+# What inflate() reports when a member decodes, but its trailer does not
+# match
+_CHECK_ERRORS = (b"incorrect data check", b"incorrect length check")
+
+
+class _Salvager(object):
+    def __init__(
+        self, data, window_bits, brute_force, max_scan, buffer_size, format=None
+    ):
+        self.data = data
+        self.size = _buffer.nbytes(data)
+        self.base = _buffer.addressof(data)
+        self.window_bits = window_bits
+        self.brute_force = brute_force
+        self.max_scan = max_scan
+        # With format "gzip" or "zlib", run() computes the check value of
+        # the output of a region that starts in the middle of a member
+        self.checksum = _CHECKSUMS.get(format)
+        self.inflater = Inflater(window_bits=WB_RAW, buffer_size=buffer_size)
+        self.probe = Inflater(window_bits=WB_RAW, buffer_size=buffer_size)
+
+    def close(self):
+        self.inflater.close()
+        self.probe.close()
+
+    def _decode_blocks(self, pos, end, bits=0, value=0):
+        # A false positive tends to fail within one block, but might look
+        # like a single stored or final block, so ask for two.
+        probe = self.probe
+        probe.reset(WB_RAW)
+        strm = probe.strm
+        if bits != 0:
+            err = pyzlib.inflatePrime(strm, bits, value)
+            if err != pyzlib.Z_OK:
+                return False
+        strm.next_in = self.base + pos
+        strm.avail_in = min(end - pos, 1 << 30)
+        blocks = 0
+        while True:
+            strm.next_out = ctypes.addressof(probe.obuf)
+            strm.avail_out = probe.buffer_size
+            err = pyzlib.inflate(strm, pyzlib.Z_BLOCK)
+            if err == pyzlib.Z_OK and strm.data_type & 128:
+                blocks += 1
+                if blocks >= 2 and strm.total_out >= MIN_DECODED_SIZE:
+                    return True
+            if err != pyzlib.Z_OK or strm.avail_in == 0:
+                return False
+
+    def find_split(self, start, end):
+        # Find a full flush point at which decoding can start from scratch
+        while True:
+            pos = self.data.find(SYNC_MARKER, start, end)
+            if pos == -1:
+                return None
+            pos += len(SYNC_MARKER)
+            if self._decode_blocks(pos, self.size):
+                return pos
+            start = pos - len(SYNC_MARKER) + 1
+
+    def _find_member(self, pos, end):
+        # A candidate member must get past its header and decode a whole
+        # block, or be short enough to end right away
+        probe = self.probe
+        strm = probe.strm
+        while True:
+            pos = self.data.find(GZIP_MAGIC, pos, end)
+            if pos == -1:
+                return None
+            probe.reset(WB_AUTO)
+            strm.next_in = self.base + pos
+            strm.avail_in = min(end - pos, 1 << 30)
+            boundaries = 0
+            while True:
+                strm.next_out = ctypes.addressof(probe.obuf)
+                strm.avail_out = probe.buffer_size
+                err = pyzlib.inflate(strm, pyzlib.Z_BLOCK)
+                if err == pyzlib.Z_STREAM_END:
+                    return pos
+                if err != pyzlib.Z_OK or strm.avail_in == 0:
+                    break
+                if strm.data_type & 128:
+                    # The first boundary is the end of the header
+                    boundaries += 1
+                    if boundaries == 2:
+                        return pos
+            pos += 1
+
+    def _sync(self, pos, end, seen):
+        strm = self.inflater.strm
+        self.inflater.reset(WB_RAW)
+        while pos < end:
+            avail_in = min(end - pos, 1 << 30)
+            strm.next_in = self.base + pos
+            strm.avail_in = avail_in
+            err = pyzlib.inflateSync(strm)
+            pos += avail_in - strm.avail_in
+            if err == pyzlib.Z_OK:
+                if (pos, 0) not in seen:
+                    return pos
+                self.inflater.reset(WB_RAW)
+        return None
+
+    def _resync(self, pos, end, seen=()):
+        # Returns (position, window bits, prime bits, prime value) or None.
+        # Block boundaries in seen have already been decoded.
+        sync = self._sync(pos, end, seen)
+        member = self._find_member(pos, end if sync is None else sync)
+        if member is not None:
+            return member, WB_AUTO, 0, 0
+        if sync is not None:
+            return sync, WB_RAW, 0, 0
+        if not self.brute_force:
+            return None
+        data = self.data
+        for candidate in range(pos, min(end, pos + self.max_scan)):
+            byte = data[candidate]
+            window = int.from_bytes(data[candidate : candidate + 16], "little")
+            for shift in range(8):
+                # Bit offset 0 is the start of this byte, the others need the
+                # remaining bits of this byte to be primed
+                if shift == 0:
+                    key, bits, value = (candidate, 0), 0, 0
+                else:
+                    key = (candidate + 1, 8 - shift)
+                    bits, value = 8 - shift, byte >> shift
+                if key in seen or not _plausible_block(data, candidate, shift, window):
+                    continue
+                if self._decode_blocks(key[0], end, bits, value):
+                    return key[0], WB_RAW, bits, value
+        return None
+
+    def run(self, start, end, write):
+        # Besides the ranges, sets head and tail for _verify(). head describes
+        # the output from start up to the end of the member that start is in,
+        # as (check value, size, trailer position or None if the member goes
+        # on past end, index of the range). tail describes the output of a
+        # member that goes on past end, as (check value, size, index).
+        self.head = self.tail = None
+        ranges = []
+        out_pos = 0
+        pos = start
+        if start == 0:
+            window_bits = self.window_bits
+        else:
+            window_bits = WB_RAW
+        prime = None
+        inflater = self.inflater
+        strm = inflater.strm
+        obuf = inflater.obuf
+        resynced = False
+        pending = []
+        check = None
+
+        def emit(chunk):
+            nonlocal check
+            if check is not None:
+                check = self.checksum(check, chunk, len(chunk))
+            write(chunk)
+
+        while pos < end:
+            inflater.reset(window_bits)
+            if prime is not None:
+                pyzlib.inflatePrime(strm, *prime)
+            seg_in = pos
+            seg_out = out_pos
+            head = not resynced and start != 0 and self.checksum is not None
+            check = self.checksum(0, None, 0) if head else None
+            # Damage is detected late, so the decoder might have produced
+            # garbage and even passed a block boundary before failing, and
+            # after a resync the sync point might have been a false positive.
+            # Therefore the output of a block is held back until the next
+            # block decodes fine too. committed is where the written output
+            # ends, last is the last block boundary.
+            committed_in = last_in = pos
+            committed_out = last_out = out_pos
+            held = []
+            # The end of a header is reported as a block boundary
+            blocks = 0 if window_bits == WB_RAW else -1
+            # Block boundaries as (next_in position, unused bits)
+            seen = set()
+            while True:
+                avail_in = min(end - pos, 1 << 30)
+                strm.next_in = self.base + pos
+                strm.avail_in = avail_in
+                strm.next_out = ctypes.addressof(obuf)
+                strm.avail_out = inflater.buffer_size
+                err = pyzlib.inflate(strm, pyzlib.Z_BLOCK)
+                pos += avail_in - strm.avail_in
+                n = inflater.buffer_size - strm.avail_out
+                if n != 0:
+                    pending.append(obuf[:n])
+                    out_pos += n
+                if err == pyzlib.Z_OK and strm.data_type & 128:
+                    seen.add((pos, strm.data_type & 7))
+                    blocks += 1
+                    for chunk in held:
+                        emit(chunk)
+                    committed_in, committed_out = last_in, last_out
+                    held, pending = pending, []
+                    last_in, last_out = pos, out_pos
+                if err == pyzlib.Z_OK and pos < end:
+                    continue
+                if err == pyzlib.Z_OK and strm.avail_out == 0:
+                    continue
+                break
+            truncated = err in (pyzlib.Z_OK, pyzlib.Z_BUF_ERROR) and pos >= end
+            # The whole member decoded, but the output is wrong somewhere
+            damaged = err == pyzlib.Z_DATA_ERROR and strm.msg in _CHECK_ERRORS
+            # A whole member or stream has been decoded, or the input ends in
+            # the middle of a block that decoded fine
+            if (
+                err == pyzlib.Z_STREAM_END
+                or damaged
+                or (truncated and (not resynced or blocks > 0))
+            ):
+                for chunk in held + pending:
+                    emit(chunk)
+                committed_in = pos
+                committed_out = out_pos
+            held = []
+            del pending[:]
+            out_pos = committed_out
+            index = None
+            if out_pos != seg_out:
+                index = len(ranges)
+                ranges.append(Range(seg_in, committed_in, seg_out, out_pos, damaged))
+            passes = truncated and committed_in >= end
+            if head and (passes or err == pyzlib.Z_STREAM_END):
+                trailer = None if passes else pos
+                self.head = (check, out_pos - seg_out, trailer, index)
+            elif passes and window_bits != WB_RAW:
+                # inflate() has computed the check value of the member
+                self.tail = (strm.adler, out_pos - seg_out, index)
+            if truncated:
+                break
+            if err == pyzlib.Z_STREAM_END or damaged:
+                # Another member or trailing garbage
+                resync = self._resync(pos, end)
+            else:
+                # Look for a place to resume right after the recovered data
+                resync = self._resync(max(committed_in, seg_in + 1), end, seen)
+            if resync is None:
+                break
+            pos, window_bits, prime_bits, prime_value = resync
+            prime = (prime_bits, prime_value) if prime_bits != 0 else None
+            resynced = True
+        return ranges, out_pos
+
+
+_CHECKSUMS = {"gzip": pyzlib.crc32, "zlib": pyzlib.adler32}
+_COMBINES = {"gzip": pyzlib.crc32_combine, "zlib": pyzlib.adler32_combine}
+
+
+def _verify(data, format, regions):
+    # Members that span several regions are not checked by inflate(), so
+    # combine the check values of their parts and compare them with the
+    # trailers. regions are (ranges, head, tail) of each region.
+    combine = _COMBINES[format]
+    size = _buffer.nbytes(data)
+    chain = None
+    for i, (ranges, head, tail) in enumerate(regions):
+        if chain is not None and head is not None:
+            check, n, parts = chain
+            head_check, head_size, trailer, index = head
+            check = combine(check, head_check, head_size)
+            n += head_size
+            parts = parts + [(i, index)]
+            if trailer is None:
+                chain = check, n, parts
+                continue
+            if format == "gzip":
+                expected = (check, n & 0xFFFFFFFF)
+                trailer_struct = framing.GZIP_TRAILER
+            else:
+                expected = (check,)
+                trailer_struct = framing.ZLIB_TRAILER
+            if trailer + trailer_struct.size <= size:
+                if trailer_struct.unpack_from(data, trailer) != expected:
+                    for j, index in parts:
+                        if index is not None:
+                            regions[j][0][index] = regions[j][0][index]._replace(
+                                damaged=True
+                            )
+        chain = None if tail is None else (tail[0], tail[1], [(i, tail[2])])
+
+
+def _plausible_block(data, pos, shift, window):
+    # Cheap checks of the header of a non-final block starting at bit shift
+    # of data[pos]. window holds the following bytes, least significant
+    # first, like deflate bits.
+    v = window >> shift
+    if v & 1:
+        # _decode_blocks() needs two blocks
+        return False
+    block_type = (v >> 1) & 3
+    if block_type == 0:
+        # Stored: LEN and NLEN start at the next byte boundary
+        p = pos + (shift + 3 + 7) // 8
+        if p + 4 > len(data):
+            return False
+        return data[p] ^ data[p + 2] == 0xFF and data[p + 1] ^ data[p + 3] == 0xFF
+    if block_type == 1:
+        return True
+    if block_type == 3:
+        return False
+    # Dynamic: at most 286 literal/length and 30 distance codes, and the
+    # code length code must be complete
+    if (v >> 3) & 31 > 29 or (v >> 8) & 31 > 29:
+        return False
+    ncodes = ((v >> 13) & 15) + 4
+    v >>= 17
+    kraft = 0
+    for _ in range(ncodes):
+        length = v & 7
+        if length != 0:
+            kraft += 1 << (7 - length)
+        v >>= 3
+    return kraft == 128
+
+
+def _detect_format(data):
+    if data[:3] == GZIP_MAGIC:
+        return "gzip"
+    if len(data) >= 2 and data[0] & 0xF == pyzlib.Z_DEFLATED:
+        if (data[0] << 8 | data[1]) % 31 == 0:
+            return "zlib"
+    return None
+
+
+def _detect_window_bits(data):
+    return WB_RAW if _detect_format(data) is None else WB_AUTO
+
+
+def salvage(
+    data,
+    write,
+    window_bits=None,
+    brute_force=False,
+    max_scan=DEFAULT_MAX_SCAN,
+    workers=1,
+    buffer_size=DEFAULT_BUFFER_SIZE,
+):
+    if window_bits is None:
+        window_bits = _detect_window_bits(data)
+    size = _buffer.nbytes(data)
+    splitter = _Salvager(data, window_bits, brute_force, max_scan, buffer_size)
+    try:
+        bounds = [0]
+        if workers > 1 and size >= 2 * MIN_REGION_SIZE:
+            n = min(workers, size // MIN_REGION_SIZE)
+            for i in range(1, n):
+                split = splitter.find_split(max(i * size // n, bounds[-1] + 1), size)
+                if split is None:
+                    break
+                bounds.append(split)
+    finally:
+        splitter.close()
+    bounds.append(size)
+
+    format = None if window_bits == WB_RAW else _detect_format(data)
+
+    def run_region(i, region_write):
+        salvager = _Salvager(
+            data, window_bits, brute_force, max_scan, buffer_size, format
+        )
+        try:
+            ranges, region_size = salvager.run(bounds[i], bounds[i + 1], region_write)
+            return ranges, region_size, salvager.head, salvager.tail
+        finally:
+            salvager.close()
+
+    if len(bounds) == 2:
+        return run_region(0, write)[0]
+    regions = []
+    out_base = 0
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        tmps = [tempfile.TemporaryFile() for _ in range(len(bounds) - 1)]
+        try:
+            futures = [
+                executor.submit(run_region, i, tmp.write) for i, tmp in enumerate(tmps)
+            ]
+            for future, tmp in zip(futures, tmps):
+                region_ranges, region_size, head, tail = future.result()
+                region_ranges = [
+                    r._replace(
+                        out_start=out_base + r.out_start, out_end=out_base + r.out_end
+                    )
+                    for r in region_ranges
+                ]
+                regions.append((region_ranges, head, tail))
+                out_base += region_size
+                tmp.seek(0)
+                while True:
+                    chunk = tmp.read(DEFAULT_BUFFER_SIZE)
+                    if len(chunk) == 0:
+                        break
+                    write(chunk)
+        finally:
+            for tmp in tmps:
+                tmp.close()
+    if format is not None:
+        _verify(data, format, regions)
+    return _merge([r for region_ranges, _, _ in regions for r in region_ranges])
+
+
+def _merge(ranges):
+    merged = []
+    for r in ranges:
+        if (
+            merged
+            and merged[-1].in_end == r.in_start
+            and merged[-1].out_end == r.out_start
+            and merged[-1].damaged == r.damaged
+        ):
+            merged[-1] = merged[-1]._replace(in_end=r.in_end, out_end=r.out_end)
+            continue
+        merged.append(r)
+    return merged
+
+
+def salvage_file(ipath, opath, **kwargs):
+    with open(ipath, "rb") as ifp, open(opath, "wb") as ofp:
+        size = os.fstat(ifp.fileno()).st_size
+        if size == 0:
+            return []
+        mm = mmap.mmap(ifp.fileno(), size, access=mmap.ACCESS_READ)
+        try:
+            return salvage(mm, ofp.write, **kwargs)
+        finally:
+            mm.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Recover intact data from damaged gzip, zlib or raw streams"
+    )
+    parser.add_argument("input")
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--window-bits", type=int)
+    parser.add_argument(
+        "--brute-force",
+        action="store_true",
+        help="if there is no sync point, try every bit offset after the damage",
+    )
+    parser.add_argument(
+        "--max-scan",
+        type=int,
+        default=DEFAULT_MAX_SCAN,
+        help="bytes to try per damaged region with --brute-force; the cost "
+        "grows linearly, roughly 1 second per 64 KiB (default: %(default)s)",
+    )
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    ranges = salvage_file(
+        args.input,
+        args.output,
+        window_bits=args.window_bits,
+        brute_force=args.brute_force,
+        max_scan=args.max_scan,
+        workers=args.jobs,
+    )
+    total = 0
+    for r in ranges:
+        print(
+            "input [{}, {}) -> output [{}, {}){}".format(
+                r.in_start,
+                r.in_end,
+                r.out_start,
+                r.out_end,
+                " damaged" if r.damaged else "",
+            )
+        )
+        if not r.damaged:
+            total += r.out_end - r.out_start
+    print("recovered {} bytes in {} ranges".format(total, len(ranges)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import platform
+import sys
+import threading
+import time
+
+import pyzlib
+from pyzlib import corpus, stream
+
+DEFLATE = "deflate"
+INFLATE = "inflate"
+OPERATIONS = (DEFLATE, INFLATE)
+
+
+def gil_enabled():
+    # Free-threaded builds (3.13t and later) can run with the GIL disabled
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+
+def _deflate_worker(data, level, iterations):
+    # Independent streams: one per thread, reset between iterations
+    with stream.Deflater(level=level) as deflater:
+        for _ in range(iterations):
+            deflater.compress_to(_discard, data, pyzlib.Z_FINISH)
+            deflater.reset()
+
+
+def _inflate_worker(zdata, iterations):
+    with stream.Inflater() as inflater:
+        for _ in range(iterations):
+            inflater.decompress_to(_discard, zdata)
+            inflater.reset()
+
+
+def _discard(chunk):
+    pass
+
+
+def measure(threads, operation, data, level=1, iterations=4):
+    # Returns the aggregate throughput of threads threads in MB/s of
+    # uncompressed data
+    if operation == DEFLATE:
+        target, args = _deflate_worker, (data, level, iterations)
+    elif operation == INFLATE:
+        target, args = _inflate_worker, (stream.compress(data, level), iterations)
+    else:
+        raise ValueError("unknown operation {}".format(operation))
+    barrier = threading.Barrier(threads + 1)
+    errors = []
+
+    def run():
+        barrier.wait()
+        try:
+            target(*args)
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    t0 = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - t0
+    if errors:
+        raise errors[0]
+    return threads * iterations * len(data) / elapsed / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure how independent streams scale with threads"
+    )
+    parser.add_argument("-k", "--kind", choices=sorted(corpus.KINDS), default="log")
+    parser.add_argument("-s", "--size", type=int, default=4 * 1024 * 1024)
+    parser.add_argument("-l", "--level", type=int, default=1)
+    parser.add_argument("-i", "--iterations", type=int, default=4)
+    parser.add_argument("-n", "--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("-o", "--operation", choices=OPERATIONS, default=DEFLATE)
+    args = parser.parse_args()
+    data = corpus.generate(args.kind, args.size)
+    print(
+        "{} {}, GIL {}, {} CPUs".format(
+            platform.python_implementation(),
+            platform.python_version(),
+            "enabled" if gil_enabled() else "disabled",
+            os.cpu_count(),
+        )
+    )
+    base = None
+    threads = 1
+    while threads <= args.threads:
+        rate = measure(threads, args.operation, data, args.level, args.iterations)
+        if base is None:
+            base = rate
+        print(
+            "{:>3} threads {:8.1f} MB/s  speedup {:5.2f}  efficiency {:4.0%}".format(
+                threads, rate, rate / base, rate / base / threads
+            )
+        )
+        if threads == args.threads:
+            break
+        threads = min(threads * 2, args.threads)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,446 @@
+import ctypes
+import functools
+import threading
+
+import pyzlib
+from pyzlib import _buffer
+
+WB_RAW = -pyzlib.MAX_WBITS
+WB_ZLIB = pyzlib.MAX_WBITS
+WB_GZIP = pyzlib.MAX_WBITS + 16
+WB_AUTO = pyzlib.MAX_WBITS + 32
+
+DEFAULT_BUFFER_SIZE = 256 * 1024
+
+# avail_in and avail_out are unsigned ints
+_MAX_AVAIL = 1 << 30
+
+
+def exclusive(method):
+    # A z_stream must not be used by two threads at once. Without the GIL
+    # nothing else prevents that, so such use raises instead of corrupting
+    # the stream. The same thread may re-enter, e.g. from a subclass.
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        lock = self._owner
+        if not lock.acquire(blocking=False):
+            raise Exception(
+                "{} is in use by another thread".format(type(self).__name__)
+            )
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            lock.release()
+
+    return wrapper
+
+
+def _new_obuf(pool, buffer_size):
+    # Pooled buffers may be larger than buffer_size, which is what is passed
+    # to zlib
+    if pool is None:
+        return ctypes.create_string_buffer(buffer_size)
+    return pool.get(buffer_size)
+
+
+def _release_obuf(pool, obuf):
+    if pool is not None and obuf is not None:
+        pool.put(obuf)
+
+
+class Deflater(object):
+    def __init__(
+        self,
+        level=pyzlib.Z_DEFAULT_COMPRESSION,
+        window_bits=WB_ZLIB,
+        mem_level=pyzlib.DEF_MEM_LEVEL,
+        strategy=pyzlib.Z_DEFAULT_STRATEGY,
+        dictionary=None,
+        buffer_size=DEFAULT_BUFFER_SIZE,
+        strm=None,
+        pool=None,
+    ):
+        self._owner = threading.RLock()
+        self.strm = None
+        self.pool = pool
+        self.level = level
+        self.strategy = strategy
+        self.window_bits = window_bits
+        self.mem_level = mem_level
+        self.buffer_size = buffer_size
+        self.obuf = _new_obuf(pool, buffer_size)
+        self.finished = False
+        if strm is not None:
+            self.strm = strm
+            return
+        strm = pyzlib.z_stream(
+            zalloc=pyzlib.Z_NULL, free=pyzlib.Z_NULL, opaque=pyzlib.Z_NULL
+        )
+        err = pyzlib.deflateInit2(
+            strm,
+            level=level,
+            method=pyzlib.Z_DEFLATED,
+            windowBits=window_bits,
+            memLevel=mem_level,
+            strategy=strategy,
+        )
+        if err != pyzlib.Z_OK:
+            raise Exception("deflateInit2() failed with error {}".format(err))
+        self.strm = strm
+        if dictionary is not None:
+            self.set_dictionary(dictionary)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    @exclusive
+    def close(self):
+        if self.strm is None:
+            return
+        # Z_DATA_ERROR means that the stream was freed prematurely
+        err = pyzlib.deflateEnd(self.strm)
+        self.strm = None
+        self.obuf = _release_obuf(self.pool, self.obuf)
+        if err not in (pyzlib.Z_OK, pyzlib.Z_DATA_ERROR):
+            raise Exception("deflateEnd() failed with error {}".format(err))
+
+    @exclusive
+    def set_dictionary(self, dictionary):
+        err = pyzlib.deflateSetDictionary(
+            self.strm, _buffer.addressof(dictionary), _buffer.nbytes(dictionary)
+        )
+        if err != pyzlib.Z_OK:
+            raise Exception("deflateSetDictionary() failed with error {}".format(err))
+
+    @exclusive
+    def set_header(self, head):
+        err = pyzlib.deflateSetHeader(self.strm, head)
+        if err != pyzlib.Z_OK:
+            raise Exception("deflateSetHeader() failed with error {}".format(err))
+        # zlib uses head and the memory it points to until it writes the header
+        self.header = head
+
+    def bound(self, size):
+        return pyzlib.deflateBound(self.strm, size)
+
+    @exclusive
+    def pending(self):
+        err, pending, bits = pyzlib.deflatePending(self.strm)
+        if err != pyzlib.Z_OK:
+            raise Exception("deflatePending() failed with error {}".format(err))
+        return pending, bits
+
+    @exclusive
+    def reset(self):
+        err = pyzlib.deflateReset(self.strm)
+        if err != pyzlib.Z_OK:
+            raise Exception("deflateReset() failed with error {}".format(err))
+        self.finished = False
+
+    def copy(self):
+        # Only reads the stream, so that many threads can clone a template
+        # at once
+        strm = pyzlib.z_stream()
+        err = pyzlib.deflateCopy(strm, self.strm)
+        if err != pyzlib.Z_OK:
+            raise Exception("deflateCopy() failed with error {}".format(err))
+        copy = type(self).__new__(type(self))
+        copy.__dict__.update(self.__dict__)
+        copy._owner = threading.RLock()
+        copy.obuf = _new_obuf(self.pool, self.buffer_size)
+        copy.strm = strm
+        return copy
+
+    @exclusive
+    def params(self, level, strategy=None):
+        # The strategy is kept unless it is specified
+        if strategy is None:
+            strategy = self.strategy
+        if level == self.level and strategy == self.strategy:
+            return b""
+        strm = self.strm
+        strm.next_in = None
+        strm.avail_in = 0
+        chunks = []
+        while True:
+            strm.next_out = ctypes.addressof(self.obuf)
+            strm.avail_out = self.buffer_size
+            err = pyzlib.deflateParams(strm, level, strategy)
+            chunks.append(self.obuf[: self.buffer_size - strm.avail_out])
+            if err == pyzlib.Z_OK:
+                break
+            # Z_BUF_ERROR means that there was not enough room to flush
+            if err != pyzlib.Z_BUF_ERROR or strm.avail_out != 0:
+                raise Exception("deflateParams() failed with error {}".format(err))
+        self.level = level
+        self.strategy = strategy
+        return b"".join(chunks)
+
+    @exclusive
+    def compress_to(self, write, data, flush=pyzlib.Z_NO_FLUSH):
+        strm = self.strm
+        addr = _buffer.addressof(data)
+        size = _buffer.nbytes(data)
+        addr_obuf = ctypes.addressof(self.obuf)
+        while True:
+            avail_in = min(size, _MAX_AVAIL)
+            strm.next_in = addr
+            strm.avail_in = avail_in
+            chunk_flush = flush if avail_in == size else pyzlib.Z_NO_FLUSH
+            while True:
+                strm.next_out = addr_obuf
+                strm.avail_out = self.buffer_size
+                err = pyzlib.deflate(strm, chunk_flush)
+                n = self.buffer_size - strm.avail_out
+                if n != 0:
+                    write(self.obuf[:n])
+                if err == pyzlib.Z_STREAM_END:
+                    self.finished = True
+                    break
+                if err not in (pyzlib.Z_OK, pyzlib.Z_BUF_ERROR):
+                    raise Exception("deflate() failed with error {}".format(err))
+                if strm.avail_out != 0:
+                    break
+            addr += avail_in
+            size -= avail_in
+            if size == 0:
+                break
+        strm.next_in = None
+        strm.avail_in = 0
+
+    def compress(self, data, flush=pyzlib.Z_NO_FLUSH):
+        chunks = []
+        self.compress_to(chunks.append, data, flush)
+        return b"".join(chunks)
+
+    def flush(self, flush=pyzlib.Z_FINISH):
+        return self.compress(b"", flush)
+
+
+class Inflater(object):
+    def __init__(
+        self,
+        window_bits=WB_ZLIB,
+        dictionary=None,
+        buffer_size=DEFAULT_BUFFER_SIZE,
+        strm=None,
+        pool=None,
+        validate=True,
+    ):
+        self._owner = threading.RLock()
+        self.strm = None
+        self.pool = pool
+        self.validate = validate
+        self.window_bits = window_bits
+        self.dictionary = dictionary
+        self.buffer_size = buffer_size
+        self.obuf = _new_obuf(pool, buffer_size)
+        self.eof = False
+        self.unused_data = b""
+        if strm is not None:
+            self.strm = strm
+            return
+        strm = pyzlib.z_stream(
+            next_in=pyzlib.Z_NULL,
+            avail_in=0,
+            zalloc=pyzlib.Z_NULL,
+            free=pyzlib.Z_NULL,
+            opaque=pyzlib.Z_NULL,
+        )
+        err = pyzlib.inflateInit2(strm, window_bits)
+        if err != pyzlib.Z_OK:
+            raise Exception("inflateInit2() failed with error {}".format(err))
+        self.strm = strm
+        if not validate:
+            self.set_validate(False)
+        if dictionary is not None and window_bits < 0:
+            self.set_dictionary(dictionary)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    @exclusive
+    def close(self):
+        if self.strm is None:
+            return
+        err = pyzlib.inflateEnd(self.strm)
+        self.strm = None
+        self.obuf = _release_obuf(self.pool, self.obuf)
+        if err != pyzlib.Z_OK:
+            raise Exception("inflateEnd() failed with error {}".format(err))
+
+    @exclusive
+    def set_dictionary(self, dictionary):
+        err = pyzlib.inflateSetDictionary(
+            self.strm, _buffer.addressof(dictionary), _buffer.nbytes(dictionary)
+        )
+        if err != pyzlib.Z_OK:
+            raise Exception("inflateSetDictionary() failed with error {}".format(err))
+
+    @exclusive
+    def get_header(self, head):
+        err = pyzlib.inflateGetHeader(self.strm, head)
+        if err != pyzlib.Z_OK:
+            raise Exception("inflateGetHeader() failed with error {}".format(err))
+        # zlib fills head and the memory it points to as the header arrives
+        self.header = head
+
+    @exclusive
+    def reset(self, window_bits=None):
+        if window_bits is None:
+            window_bits = self.window_bits
+        err = pyzlib.inflateReset2(self.strm, window_bits)
+        if err != pyzlib.Z_OK:
+            raise Exception("inflateReset2() failed with error {}".format(err))
+        self.window_bits = window_bits
+        self.eof = False
+        self.unused_data = b""
+        # inflateReset2() turns the check value computation back on
+        if not self.validate:
+            self.set_validate(False)
+
+    @exclusive
+    def set_validate(self, validate):
+        # Without validation, zlib neither computes nor compares the
+        # Adler-32 or CRC-32 of the output
+        err = pyzlib.inflateValidate(self.strm, int(validate))
+        if err != pyzlib.Z_OK:
+            raise Exception("inflateValidate() failed with error {}".format(err))
+        self.validate = validate
+
+    def copy(self):
+        # Only reads the stream, so that many threads can clone a template
+        # at once
+        strm = pyzlib.z_stream()
+        err = pyzlib.inflateCopy(strm, self.strm)
+        if err != pyzlib.Z_OK:
+            raise Exception("inflateCopy() failed with error {}".format(err))
+        copy = type(self).__new__(type(self))
+        copy.__dict__.update(self.__dict__)
+        copy._owner = threading.RLock()
+        copy.obuf = _new_obuf(self.pool, self.buffer_size)
+        copy.strm = strm
+        return copy
+
+    def _inflate(self, flush):
+        err = pyzlib.inflate(self.strm, flush)
+        if err == pyzlib.Z_NEED_DICT and self.dictionary is not None:
+            self.set_dictionary(self.dictionary)
+            err = pyzlib.inflate(self.strm, flush)
+        return err
+
+    @exclusive
+    def decompress_to(self, write, data):
+        if self.eof:
+            self.unused_data += bytes(data)
+            return 0
+        strm = self.strm
+        addr = _buffer.addressof(data)
+        size = _buffer.nbytes(data)
+        addr_obuf = ctypes.addressof(self.obuf)
+        while True:
+            avail_in = min(size, _MAX_AVAIL)
+            strm.next_in = addr
+            strm.avail_in = avail_in
+            while True:
+                strm.next_out = addr_obuf
+                strm.avail_out = self.buffer_size
+                err = self._inflate(pyzlib.Z_NO_FLUSH)
+                n = self.buffer_size - strm.avail_out
+                if n != 0:
+                    write(self.obuf[:n])
+                if err == pyzlib.Z_STREAM_END:
+                    self.eof = True
+                    break
+                # Z_BUF_ERROR means that no progress was possible
+                if err == pyzlib.Z_BUF_ERROR:
+                    break
+                if err != pyzlib.Z_OK:
+                    raise Exception("inflate() failed with error {}".format(err))
+                if strm.avail_out != 0:
+                    break
+            consumed = avail_in - strm.avail_in
+            addr += consumed
+            size -= consumed
+            if self.eof or size == 0 or consumed == 0:
+                break
+        if self.eof and size != 0:
+            offset = _buffer.nbytes(data) - size
+            self.unused_data = bytes(memoryview(data).cast("B")[offset:])
+        strm.next_in = None
+        strm.avail_in = 0
+        return size
+
+    def decompress(self, data):
+        chunks = []
+        self.decompress_to(chunks.append, data)
+        return b"".join(chunks)
+
+
+def compress(data, level=pyzlib.Z_DEFAULT_COMPRESSION, window_bits=WB_ZLIB):
+    with Deflater(level=level, window_bits=window_bits) as deflater:
+        return deflater.compress(data, pyzlib.Z_FINISH)
+
+
+def decompress(data, window_bits=WB_ZLIB):
+    with Inflater(window_bits=window_bits) as inflater:
+        result = inflater.decompress(data)
+        if not inflater.eof:
+            raise Exception("incomplete or truncated stream")
+        return result
+
+
+def decompress_into(data, buf, window_bits=WB_ZLIB):
+    # Inflates data straight into buf, which must be exactly as large as the
+    # output. Returns the number of bytes of data that were not consumed.
+    strm = pyzlib.z_stream(
+        next_in=pyzlib.Z_NULL,
+        avail_in=0,
+        zalloc=pyzlib.Z_NULL,
+        free=pyzlib.Z_NULL,
+        opaque=pyzlib.Z_NULL,
+    )
+    err = pyzlib.inflateInit2(strm, window_bits)
+    if err != pyzlib.Z_OK:
+        raise Exception("inflateInit2() failed with error {}".format(err))
+    try:
+        addr_in, left_in = _buffer.addressof(data), _buffer.nbytes(data)
+        addr_out, left_out = _buffer.addressof(buf), _buffer.nbytes(buf)
+        err = pyzlib.Z_OK
+        while err == pyzlib.Z_OK:
+            avail_in = min(left_in, _MAX_AVAIL)
+            avail_out = min(left_out, _MAX_AVAIL)
+            strm.next_in = addr_in
+            strm.avail_in = avail_in
+            strm.next_out = addr_out
+            strm.avail_out = avail_out
+            err = pyzlib.inflate(strm, pyzlib.Z_NO_FLUSH)
+            consumed = avail_in - strm.avail_in
+            produced = avail_out - strm.avail_out
+            addr_in += consumed
+            left_in -= consumed
+            addr_out += produced
+            left_out -= produced
+            if err == pyzlib.Z_OK and consumed == 0 and produced == 0:
+                err = pyzlib.Z_BUF_ERROR
+        if err != pyzlib.Z_STREAM_END:
+            raise Exception("inflate() failed with error {}".format(err))
+        if left_out != 0:
+            raise Exception("output is shorter than the buffer")
+        return left_in
+    finally:
+        strm.next_in = None
+        strm.next_out = None
+        pyzlib.inflateEnd(strm)
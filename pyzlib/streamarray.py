@@ -0,0 +1,260 @@
+import array
+import ctypes
+import re
+
+import pyzlib
+from pyzlib import _buffer, _zlib
+
+MODE_FREE = 0
+MODE_DEFLATE = 1
+MODE_INFLATE = 2
+
+_NONZERO = re.compile(b"[^\\0]")
+
+
+class StreamArray(object):
+    __slots__ = (
+        "streams",
+        "base",
+        "stride",
+        "mode",
+        "level",
+        "strategy",
+        "dirty",
+        "ended",
+        "active",
+        "bytes_in",
+        "bytes_out",
+        "free",
+        "obuf",
+        "obuf_addr",
+    )
+
+    def __init__(self, n, buffer_size=16384):
+        self.streams = (pyzlib.z_stream * n)()
+        self.base = ctypes.addressof(self.streams)
+        self.stride = ctypes.sizeof(pyzlib.z_stream)
+        self.mode = bytearray(n)
+        self.level = array.array("b", bytes(n))
+        self.strategy = bytearray(n)
+        self.dirty = bytearray(n)
+        # Streams that returned Z_STREAM_END and can be reset
+        self.ended = bytearray(n)
+        self.active = bytearray(n)
+        self.bytes_in = array.array("Q", bytes(8 * n))
+        self.bytes_out = array.array("Q", bytes(8 * n))
+        self.free = list(range(n - 1, -1, -1))
+        self.obuf = ctypes.create_string_buffer(buffer_size)
+        self.obuf_addr = ctypes.addressof(self.obuf)
+
+    def __len__(self):
+        return len(self.mode) - len(self.free)
+
+    def __getitem__(self, h):
+        self._check(h)
+        return self.streams[h]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close_all()
+
+    def address(self, h):
+        return self.base + h * self.stride
+
+    def _check(self, h, mode=None):
+        if not 0 <= h < len(self.mode) or self.mode[h] == MODE_FREE:
+            raise Exception("invalid stream handle {}".format(h))
+        if mode is not None and self.mode[h] != mode:
+            raise Exception("stream {} has wrong mode {}".format(h, self.mode[h]))
+
+    def _alloc(self):
+        if not self.free:
+            raise Exception("no free streams")
+        return self.free.pop()
+
+    def _release(self, h):
+        ctypes.memset(self.address(h), 0, self.stride)
+        self.mode[h] = MODE_FREE
+        self.dirty[h] = 0
+        self.ended[h] = 0
+        self.active[h] = 0
+        self.free.append(h)
+
+    def open_deflate(
+        self,
+        level=pyzlib.Z_DEFAULT_COMPRESSION,
+        window_bits=pyzlib.MAX_WBITS,
+        mem_level=pyzlib.DEF_MEM_LEVEL,
+        strategy=pyzlib.Z_DEFAULT_STRATEGY,
+    ):
+        h = self._alloc()
+        err = _zlib.deflateInit2_(
+            self.address(h),
+            level,
+            pyzlib.Z_DEFLATED,
+            window_bits,
+            mem_level,
+            strategy,
+            pyzlib.ZLIB_VERSION,
+            self.stride,
+        )
+        if err != pyzlib.Z_OK:
+            self.free.append(h)
+            raise Exception("deflateInit2() failed with error {}".format(err))
+        self.mode[h] = MODE_DEFLATE
+        self.level[h] = level
+        self.strategy[h] = strategy
+        self.bytes_in[h] = 0
+        self.bytes_out[h] = 0
+        return h
+
+    def open_inflate(self, window_bits=pyzlib.MAX_WBITS):
+        h = self._alloc()
+        err = _zlib.inflateInit2_(
+            self.address(h), window_bits, pyzlib.ZLIB_VERSION, self.stride
+        )
+        if err != pyzlib.Z_OK:
+            self.free.append(h)
+            raise Exception("inflateInit2() failed with error {}".format(err))
+        self.mode[h] = MODE_INFLATE
+        self.level[h] = 0
+        self.strategy[h] = 0
+        self.bytes_in[h] = 0
+        self.bytes_out[h] = 0
+        return h
+
+    def close(self, h):
+        self._check(h)
+        addr = self.address(h)
+        if self.mode[h] == MODE_DEFLATE:
+            func_name = "deflateEnd"
+            err = _zlib.deflateEnd(addr)
+        else:
+            func_name = "inflateEnd"
+            err = _zlib.inflateEnd(addr)
+        self._release(h)
+        # Z_DATA_ERROR means that the stream was freed prematurely
+        if err not in (pyzlib.Z_OK, pyzlib.Z_DATA_ERROR):
+            raise Exception("{}() failed with error {}".format(func_name, err))
+
+    def close_all(self):
+        for h in self.handles():
+            self.close(h)
+
+    def handles(self, flags=None):
+        if flags is None:
+            flags = self.mode
+        return [m.start() for m in _NONZERO.finditer(flags)]
+
+    def reset(self, h):
+        self._check(h)
+        addr = self.address(h)
+        if self.mode[h] == MODE_DEFLATE:
+            func_name = "deflateReset"
+            err = _zlib.deflateReset(addr)
+        else:
+            func_name = "inflateReset"
+            err = _zlib.inflateReset(addr)
+        if err != pyzlib.Z_OK:
+            raise Exception("{}() failed with error {}".format(func_name, err))
+        self.dirty[h] = 0
+        self.ended[h] = 0
+
+    def set_level(self, h, level, strategy=None):
+        self._check(h, MODE_DEFLATE)
+        if strategy is None:
+            strategy = self.strategy[h]
+        strm = self.streams[h]
+        strm.next_in = None
+        strm.avail_in = 0
+        chunks = []
+        while True:
+            strm.next_out = self.obuf_addr
+            strm.avail_out = len(self.obuf)
+            err = _zlib.deflateParams(self.address(h), level, strategy)
+            chunks.append(self._take(h, strm))
+            if err == pyzlib.Z_OK:
+                break
+            if err != pyzlib.Z_BUF_ERROR or strm.avail_out != 0:
+                raise Exception("deflateParams() failed with error {}".format(err))
+        self.level[h] = level
+        self.strategy[h] = strategy
+        return b"".join(chunks)
+
+    def _take(self, h, strm):
+        n = len(self.obuf) - strm.avail_out
+        self.bytes_out[h] += n
+        return self.obuf[:n]
+
+    def deflate(self, h, data, flush=pyzlib.Z_NO_FLUSH):
+        self._check(h, MODE_DEFLATE)
+        strm = self.streams[h]
+        addr = self.address(h)
+        total_in = strm.total_in
+        strm.next_in = _buffer.addressof(data)
+        strm.avail_in = _buffer.nbytes(data)
+        chunks = []
+        while True:
+            strm.next_out = self.obuf_addr
+            strm.avail_out = len(self.obuf)
+            err = _zlib.deflate(addr, flush)
+            chunks.append(self._take(h, strm))
+            if err == pyzlib.Z_STREAM_END:
+                self.ended[h] = 1
+                break
+            if err not in (pyzlib.Z_OK, pyzlib.Z_BUF_ERROR):
+                raise Exception("deflate() failed with error {}".format(err))
+            if strm.avail_out != 0:
+                break
+        strm.next_in = None
+        self.bytes_in[h] += strm.total_in - total_in
+        self.active[h] = 1
+        if flush != pyzlib.Z_NO_FLUSH:
+            self.dirty[h] = 0
+        elif strm.total_in != total_in:
+            self.dirty[h] = 1
+        return b"".join(chunks)
+
+    def inflate(self, h, data):
+        self._check(h, MODE_INFLATE)
+        strm = self.streams[h]
+        addr = self.address(h)
+        total_in = strm.total_in
+        strm.next_in = _buffer.addressof(data)
+        strm.avail_in = _buffer.nbytes(data)
+        chunks = []
+        while True:
+            strm.next_out = self.obuf_addr
+            strm.avail_out = len(self.obuf)
+            err = _zlib.inflate(addr, pyzlib.Z_NO_FLUSH)
+            chunks.append(self._take(h, strm))
+            if err == pyzlib.Z_STREAM_END:
+                self.ended[h] = 1
+                break
+            if err == pyzlib.Z_BUF_ERROR:
+                break
+            if err != pyzlib.Z_OK:
+                raise Exception("inflate() failed with error {}".format(err))
+            if strm.avail_out != 0:
+                break
+        strm.next_in = None
+        self.bytes_in[h] += strm.total_in - total_in
+        self.active[h] = 1
+        return b"".join(chunks)
+
+    def flush_dirty(self, flush=pyzlib.Z_SYNC_FLUSH):
+        return {h: self.deflate(h, b"", flush) for h in self.handles(self.dirty)}
+
+    def reset_idle(self):
+        # Only finished streams are reset: resetting a flushed stream would
+        # discard its state, and the peer would fail to decode what follows
+        idle = []
+        for h in self.handles():
+            if self.active[h]:
+                self.active[h] = 0
+            elif self.ended[h]:
+                self.reset(h)
+                idle.append(h)
+        return idle
@@ -0,0 +1,175 @@
+import collections
+import threading
+
+import pyzlib
+from pyzlib import _buffer, stream
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Clones mostly compress short suffixes, so they do not need large buffers
+DEFAULT_BUFFER_SIZE = 16 * 1024
+
+
+def _window_bits(window_bits):
+    window_bits = abs(window_bits)
+    return window_bits - 16 if window_bits > 15 else window_bits
+
+
+class DeflateTemplate(object):
+    # A deflate stream that has consumed a shared prefix. Every clone
+    # continues from there, so only the suffix has to be compressed. The
+    # output of a clone must be appended to head.
+    def __init__(
+        self,
+        prefix,
+        level=pyzlib.Z_DEFAULT_COMPRESSION,
+        window_bits=stream.WB_ZLIB,
+        mem_level=pyzlib.DEF_MEM_LEVEL,
+        strategy=pyzlib.Z_DEFAULT_STRATEGY,
+        dictionary=None,
+        buffer_size=DEFAULT_BUFFER_SIZE,
+    ):
+        self.deflater = stream.Deflater(
+            level=level,
+            window_bits=window_bits,
+            mem_level=mem_level,
+            strategy=strategy,
+            dictionary=dictionary,
+            buffer_size=buffer_size,
+        )
+        self.prefix_size = _buffer.nbytes(prefix)
+        self.head = self.deflater.compress(prefix)
+        # See "Memory Footprint" in zlib's doc/algorithm.txt
+        self.memory = (
+            (1 << (_window_bits(window_bits) + 2))
+            + (1 << (mem_level + 9))
+            + buffer_size
+            + len(self.head)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.deflater.close()
+
+    def clone(self):
+        return self.deflater.copy()
+
+    def compress(self, suffix):
+        with self.clone() as deflater:
+            return self.head + deflater.compress(suffix, pyzlib.Z_FINISH)
+
+
+class InflateTemplate(object):
+    # An inflate stream that has consumed head, the compressed prefix that
+    # the streams produced by a DeflateTemplate start with.
+    def __init__(
+        self,
+        head,
+        window_bits=stream.WB_ZLIB,
+        dictionary=None,
+        buffer_size=DEFAULT_BUFFER_SIZE,
+    ):
+        self.window_bits = window_bits
+        self.dictionary = dictionary
+        self.buffer_size = buffer_size
+        self.head = bytes(head)
+        self.inflater = stream.Inflater(
+            window_bits=window_bits, dictionary=dictionary, buffer_size=buffer_size
+        )
+        self.plain = self.inflater.decompress(self.head)
+        if self.inflater.eof:
+            raise Exception("head contains a complete stream")
+        self.memory = (
+            (1 << _window_bits(window_bits))
+            + 7 * 1024
+            + buffer_size
+            + len(self.head)
+            + len(self.plain)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.inflater.close()
+
+    def clone(self):
+        return self.inflater.copy()
+
+    def decompress(self, data):
+        view = memoryview(data).cast("B")
+        n = len(self.head)
+        if view[:n] == self.head:
+            inflater = self.clone()
+            chunks = [self.plain]
+            view = view[n:]
+        else:
+            # Not produced from this template
+            inflater = stream.Inflater(
+                window_bits=self.window_bits,
+                dictionary=self.dictionary,
+                buffer_size=self.buffer_size,
+            )
+            chunks = []
+        with inflater:
+            inflater.decompress_to(chunks.append, view)
+            if not inflater.eof:
+                raise Exception("incomplete or truncated stream")
+        return b"".join(chunks)
+
+
+class TemplateCache(object):
+    # Least recently used templates are dropped once the estimated memory
+    # use exceeds max_bytes. Keys must identify both the prefix and the
+    # parameters. Dropped templates are not closed, because other threads
+    # may still be cloning them; they are freed when they are no longer
+    # referenced. Clones do not depend on their templates.
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self._templates = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._templates)
+
+    def _get(self, key, factory):
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+                return template
+            self.misses += 1
+        template = factory()
+        with self._lock:
+            existing = self._templates.get(key)
+            if existing is not None:
+                # Another thread has created it in the meantime
+                return existing
+            self._templates[key] = template
+            self.memory += template.memory
+            while self.memory > self.max_bytes and len(self._templates) > 1:
+                _, evicted = self._templates.popitem(last=False)
+                self.memory -= evicted.memory
+        return template
+
+    def deflate(self, key, prefix, **kwargs):
+        return self._get(("deflate", key), lambda: DeflateTemplate(prefix, **kwargs))
+
+    def inflate(self, key, head, **kwargs):
+        return self._get(("inflate", key), lambda: InflateTemplate(head, **kwargs))
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+            self.memory = 0
@@ -13,6 +13,7 @@ import zlib
 
 import parameterized
 import pyzlib
+from pyzlib import corpus
 
 
 def gen_hello(r):
@@ -34,12 +35,12 @@ def gen_nulls(r):
 
 def gen_zeros_ones(r):
     while True:
-        yield bytes(r.choice((0x30, 0x31)) for _ in range(4096))
+        yield corpus.zeros_ones(r, 4096)
 
 
 def gen_random(r):
     while True:
-        yield bytes(r.getrandbits(8) for _ in range(4096))
+        yield corpus.random_bytes(r, 4096)
 
 
 class Gen(object):
@@ -1213,6 +1214,99 @@ class TestCase(unittest.TestCase):
                 pyzlib.inflate(strm, pyzlib.Z_NO_FLUSH)
             pyzlib.inflate(strm, pyzlib.Z_NO_FLUSH)
 
+    def test_gz_header(self):
+        extra = bytearray(b"AB\x03\x00xyz")
+        name = bytearray(b"name\x00")
+        comment = bytearray(b"comment\x00")
+        head = pyzlib.gz_header(
+            text=1,
+            time=1234567890,
+            os=3,
+            extra=self._addressof_bytearray(extra),
+            extra_len=len(extra),
+            name=self._addressof_bytearray(name),
+            comment=self._addressof_bytearray(comment),
+            hcrc=1,
+        )
+        plain = bytearray(b"hello")
+        dest = bytearray(128)
+        with self._make_deflate_stream(window_bits=WB_GZIP) as strm:
+            self.assertEqual(pyzlib.Z_OK, pyzlib.deflateSetHeader(strm, head))
+            strm.next_in = self._addressof_bytearray(plain)
+            strm.avail_in = len(plain)
+            strm.next_out = self._addressof_bytearray(dest)
+            strm.avail_out = len(dest)
+            self._assert_deflate_stream_end(strm)
+            dest_len = len(dest) - strm.avail_out
+        self.assertEqual(plain, zlib.decompress(dest[:dest_len], WB_GZIP))
+
+        extra2 = bytearray(4)
+        name2 = bytearray(16)
+        comment2 = bytearray(16)
+        head2 = pyzlib.gz_header(
+            extra=self._addressof_bytearray(extra2),
+            extra_max=len(extra2),
+            name=self._addressof_bytearray(name2),
+            name_max=len(name2),
+            comment=self._addressof_bytearray(comment2),
+            comm_max=len(comment2),
+        )
+        plain2 = bytearray(len(plain))
+        with self._make_inflate_stream(window_bits=WB_GZIP) as strm:
+            self.assertEqual(pyzlib.Z_OK, pyzlib.inflateGetHeader(strm, head2))
+            strm.next_in = self._addressof_bytearray(dest)
+            strm.avail_in = dest_len
+            strm.next_out = self._addressof_bytearray(plain2)
+            strm.avail_out = len(plain2)
+            self.assertEqual(pyzlib.Z_STREAM_END, pyzlib.inflate(strm, pyzlib.Z_FINISH))
+        self.assertEqual(plain, plain2)
+        self.assertEqual(1, head2.done)
+        self.assertEqual(
+            (1, 1234567890, 3, 1), (head2.text, head2.time, head2.os, head2.hcrc)
+        )
+        # Extra fields that do not fit are truncated
+        self.assertEqual(len(extra), head2.extra_len)
+        self.assertEqual(extra[:4], extra2)
+        self.assertEqual(name, name2[: len(name)])
+        self.assertEqual(comment, comment2[: len(comment)])
+
+    def test_inflate_validate(self):
+        plain = Gen(gen_seq(random.Random(1)))(4096)
+        source = bytearray(zlib.compress(plain))
+        # Corrupt the Adler-32
+        source[-1] ^= 1
+        for check, expected in ((1, pyzlib.Z_DATA_ERROR), (0, pyzlib.Z_STREAM_END)):
+            dest = bytearray(len(plain))
+            with self._make_inflate_stream() as strm:
+                self.assertEqual(pyzlib.Z_OK, pyzlib.inflateValidate(strm, check))
+                strm.next_in = self._addressof_bytearray(source)
+                strm.avail_in = len(source)
+                strm.next_out = self._addressof_bytearray(dest)
+                strm.avail_out = len(dest)
+                self.assertEqual(expected, pyzlib.inflate(strm, pyzlib.Z_FINISH))
+                self.assertLess(0, pyzlib.inflateCodesUsed(strm))
+            self.assertEqual(plain, dest)
+
+    def test_inflate_get_dictionary(self):
+        plain = Gen(gen_random(random.Random(2)))(65536)
+        source = bytearray(zlib.compress(plain))
+        dest = bytearray(len(plain))
+        window = bytearray(1 << pyzlib.MAX_WBITS)
+        with self._make_inflate_stream() as strm:
+            strm.next_in = self._addressof_bytearray(source)
+            strm.avail_in = len(source)
+            strm.next_out = self._addressof_bytearray(dest)
+            # Stop in the middle; once the stream ends, zlib is not obliged
+            # to maintain the window
+            strm.avail_out = 40000
+            self.assertEqual(pyzlib.Z_OK, pyzlib.inflate(strm, pyzlib.Z_NO_FLUSH))
+            err, dict_length = pyzlib.inflateGetDictionary(
+                strm, self._addressof_bytearray(window)
+            )
+        self.assertEqual(pyzlib.Z_OK, err)
+        self.assertEqual(len(window), dict_length)
+        self.assertEqual(plain[40000 - len(window) : 40000], window)
+
 
 if __name__ == "__main__":
     unittest.main()
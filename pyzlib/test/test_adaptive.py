@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+import unittest
+
+from parameterized import parameterized
+
+import pyzlib
+from pyzlib import adaptive, corpus, stream
+
+
+class TestCase(unittest.TestCase):
+    @parameterized.expand(
+        [
+            ("random", adaptive.STORED),
+            ("zero_runs", adaptive.RLE),
+            ("zeros_ones", adaptive.HUFFMAN_ONLY),
+            ("log", adaptive.FILTERED),
+            ("text", adaptive.DEFAULT),
+            ("numeric", adaptive.DEFAULT),
+        ]
+    )
+    def test_choose(self, kind, choice):
+        data = corpus.generate(kind, adaptive.DEFAULT_CHUNK_SIZE, 1)
+        with adaptive.AdaptiveDeflater() as deflater:
+            self.assertEqual(choice, deflater.choose(memoryview(data)))
+
+    def test_estimates(self):
+        self.assertEqual(0.0, adaptive.entropy(bytes(100)))
+        self.assertEqual(8.0, adaptive.entropy(bytes(range(256))))
+        self.assertEqual(1.0, adaptive.run_fraction(bytes(100)))
+        self.assertEqual(0.0, adaptive.run_fraction(bytes(range(256))))
+
+    @parameterized.expand([(wb,) for wb in (stream.WB_RAW, stream.WB_ZLIB)])
+    def test_round_trip(self, window_bits):
+        data = corpus.generate("mix", 1024 * 1024, 0)
+        with adaptive.AdaptiveDeflater(window_bits=window_bits) as deflater:
+            zdata = deflater.compress(data[:12345])
+            zdata += deflater.compress(memoryview(data)[12345:])
+            zdata += deflater.flush()
+            report = deflater.report()
+        self.assertEqual(data, stream.decompress(zdata, window_bits))
+        self.assertEqual(len(data), sum(report["bytes"].values()))
+        self.assertLess(1, len([n for n in report["chunks"].values() if n]))
+        self.assertLess(0, report["switches"])
+
+    def test_ratio(self):
+        data = corpus.generate("mix", 1024 * 1024, 0)
+        fixed = stream.compress(data)
+        with adaptive.AdaptiveDeflater() as deflater:
+            zdata = deflater.compress(data, pyzlib.Z_FINISH)
+        self.assertLess(len(zdata), len(fixed) * 1.02)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+import asyncio
+import gzip
+import socket
+import unittest
+import zlib
+
+from parameterized import parameterized
+
+from pyzlib import aio, corpus, stream
+
+DATA = corpus.generate("mix", 1000000, 0)
+
+
+async def _connect():
+    # Returns the reader of one end and the writer of the other; the unused
+    # writer keeps its end open
+    a, b = socket.socketpair()
+    reader, reader_writer = await asyncio.open_connection(sock=a)
+    _, writer = await asyncio.open_connection(sock=b)
+    return reader, writer, reader_writer
+
+
+def _reader(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+class TestCase(unittest.TestCase):
+    @parameterized.expand(
+        [
+            ("inline", 1 << 30, 10000),
+            ("offload", 1000, 10000),
+            ("mixed", 50000, 100000),
+        ]
+    )
+    def test_round_trip(self, _, inline_size, chunk_size):
+        async def run():
+            reader, writer, _ = await _connect()
+
+            async def produce():
+                async with aio.CompressingWriter(
+                    writer, 1, stream.WB_GZIP, inline_size=inline_size
+                ) as compressing:
+                    for i in range(0, len(DATA), chunk_size):
+                        await compressing.write(DATA[i : i + chunk_size])
+
+            async def consume():
+                chunks = []
+                async with aio.DecompressingReader(
+                    reader, inline_size=inline_size
+                ) as decompressing:
+                    async for chunk in decompressing:
+                        chunks.append(chunk)
+                return b"".join(chunks)
+
+            _, result = await asyncio.gather(produce(), consume())
+            return result
+
+        self.assertEqual(DATA, asyncio.run(run()))
+
+    def test_drain(self):
+        # Everything written before drain() can be decompressed by the peer
+        # while the stream is still open
+        async def run():
+            reader, writer, _ = await _connect()
+            compressing = aio.CompressingWriter(writer, inline_size=1000)
+            decompressing = aio.DecompressingReader(reader)
+            await compressing.write(DATA[:100000])
+            await compressing.write(b"end of message")
+            await compressing.drain()
+            received = b""
+            while len(received) < 100014:
+                received += await decompressing.read_chunk()
+            await compressing.close()
+            rest = await decompressing.read()
+            decompressing.close()
+            return received, rest
+
+        received, rest = asyncio.run(run())
+        self.assertEqual(DATA[:100000] + b"end of message", received)
+        self.assertEqual(b"", rest)
+
+    def test_read(self):
+        async def run():
+            zdata = gzip.compress(DATA[:1000]) + gzip.compress(DATA[1000:])
+            async with aio.DecompressingReader(_reader(zdata), read_size=777) as r:
+                head = await r.read(10)
+                rest = await r.read()
+                return head, rest, await r.read(10)
+
+        head, rest, end = asyncio.run(run())
+        self.assertEqual(DATA, head + rest)
+        self.assertEqual(b"", end)
+
+    def test_bounded_output(self):
+        # 16 MiB of zeros are inflated in bounded steps, and only
+        # the first one runs on the event loop
+        zeros = bytes(16 * 1024 * 1024)
+        zdata = zlib.compress(zeros)
+
+        async def run():
+            async with aio.DecompressingReader(
+                _reader(zdata), inline_size=1000, chunk_size=100000
+            ) as r:
+                sizes = [len(await r.read_chunk())]
+                inline = r.offloaded is None
+                async for chunk in r:
+                    sizes.append(len(chunk))
+                return sizes, inline
+
+        sizes, inline = asyncio.run(run())
+        self.assertEqual(1000, sizes[0])
+        self.assertTrue(inline)
+        self.assertLessEqual(max(sizes), 100000)
+        self.assertEqual(len(zeros), sum(sizes))
+
+        async def read():
+            async with aio.DecompressingReader(_reader(zdata)) as r:
+                result = bytearray()
+                while True:
+                    chunk = await r.read(4096)
+                    if not chunk:
+                        return result
+                    self.assertLessEqual(len(chunk), 4096)
+                    result += chunk
+
+        self.assertEqual(zeros, asyncio.run(read()))
+
+    def test_unused_data(self):
+        async def run():
+            async with aio.DecompressingReader(
+                _reader(zlib.compress(DATA) + b"trailer"), stream.WB_ZLIB
+            ) as r:
+                return await r.read(), r.unused_data
+
+        self.assertEqual((DATA, b"trailer"), asyncio.run(run()))
+
+    def test_truncated(self):
+        async def run():
+            async with aio.DecompressingReader(
+                _reader(zlib.compress(DATA)[:-100]), inline_size=0
+            ) as r:
+                await r.read()
+
+        with self.assertRaisesRegex(Exception, "truncated"):
+            asyncio.run(run())
+
+    def test_abort(self):
+        async def run():
+            reader, writer, _ = await _connect()
+            with self.assertRaises(ValueError):
+                async with aio.CompressingWriter(writer) as compressing:
+                    await compressing.write(DATA)
+                    raise ValueError()
+            self.assertIsNone(compressing.deflater)
+            self.assertTrue(writer.is_closing())
+            await compressing.close()
+
+        asyncio.run(run())
+
+    def test_cancel(self):
+        # A write that is cancelled while the executor compresses does not
+        # free the stream under it
+        async def run():
+            reader, writer, _ = await _connect()
+            compressing = aio.CompressingWriter(writer, 9, inline_size=0)
+            task = asyncio.ensure_future(compressing.write(DATA * 4))
+            while compressing.offloaded is None:
+                await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            deflater = compressing.deflater
+            compressing.abort()
+            self.assertIsNotNone(deflater.strm)
+            await compressing.offloaded
+            await asyncio.sleep(0)
+            self.assertIsNone(deflater.strm)
+
+        asyncio.run(run())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+import ctypes
+import threading
+import unittest
+
+import pyzlib
+from pyzlib import bufferpool, corpus, stream
+
+
+class TestCase(unittest.TestCase):
+    def test_size_class(self):
+        self.assertEqual(bufferpool.MIN_SIZE, bufferpool.size_class(1))
+        self.assertEqual(8192, bufferpool.size_class(4097))
+        self.assertEqual(8192, bufferpool.size_class(8192))
+
+    def test_recycle(self):
+        pool = bufferpool.BufferPool()
+        with pool.buffer(5000) as buf:
+            self.assertIsInstance(buf, ctypes.Array)
+            self.assertEqual(8192, len(buf))
+        with pool.buffer(6000) as buf2:
+            self.assertIs(buf, buf2)
+        with pool.buffer(6000, bufferpool.BYTEARRAY) as buf3:
+            self.assertIsInstance(buf3, bytearray)
+        self.assertEqual({"hits": 1, "misses": 2, "free": 2}, pool.stats())
+        pool.put(bytearray(100))
+        self.assertEqual(2, pool.stats()["free"])
+
+    def test_max_free(self):
+        pool = bufferpool.BufferPool(max_free=2)
+        buffers = [pool.get(100) for _ in range(3)]
+        for buf in buffers:
+            pool.put(buf)
+        self.assertEqual(2, pool.stats()["free"])
+
+    def test_mmap(self):
+        pool = bufferpool.BufferPool(mmap_threshold=1 << 20)
+        with pool.buffer(1 << 20) as buf:
+            buf[0] = b"x"
+            buf[len(buf) - 1] = b"y"
+            self.assertEqual(b"x", buf[0])
+            self.assertEqual(1 << 20, len(buf))
+
+    def test_bounds(self):
+        pool = bufferpool.BufferPool()
+        data = corpus.generate("random", 100000, 0)
+        with pool.compress_buffer(len(data)) as buf:
+            self.assertLessEqual(pyzlib.compressBound(len(data)), len(buf))
+        with stream.Deflater() as deflater:
+            with pool.deflate_buffer(deflater.strm, len(data)) as buf:
+                self.assertLessEqual(deflater.bound(len(data)), len(buf))
+
+    def test_compress(self):
+        data = corpus.generate("text", 100000, 0)
+        zdata = bufferpool.compress(bytearray(data))
+        self.assertEqual(data, stream.decompress(zdata))
+        self.assertEqual(data, bufferpool.uncompress(zdata, len(data)))
+
+    def test_stream(self):
+        pool = bufferpool.BufferPool()
+        data = corpus.generate("log", 100000, 0)
+        for _ in range(3):
+            with stream.Deflater(pool=pool) as deflater:
+                zdata = deflater.compress(data, pyzlib.Z_FINISH)
+            with stream.Inflater(pool=pool) as inflater:
+                self.assertEqual(data, inflater.decompress(zdata))
+        self.assertEqual(5, pool.stats()["hits"])
+        self.assertEqual(1, pool.stats()["free"])
+
+    def test_threads(self):
+        pool = bufferpool.BufferPool()
+        data = corpus.generate("mix", 20000, 0)
+        errors = []
+
+        def work():
+            for _ in range(50):
+                zdata = bufferpool.compress(data, pool=pool)
+                if bufferpool.uncompress(zdata, len(data), pool=pool) != data:
+                    errors.append(zdata)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        stats = pool.stats()
+        self.assertEqual(400, stats["hits"] + stats["misses"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import zlib
+
+from parameterized import parameterized
+
+from pyzlib import checkpoint, corpus, stream
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmpdir.name, "src")
+        self.dst = os.path.join(self.tmpdir.name, "dst")
+        self.data = corpus.generate("log", 1000000, 0)
+        with open(self.src, "wb") as fp:
+            fp.write(self.data)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_dst(self):
+        with open(self.dst, "rb") as fp:
+            return fp.read()
+
+    @parameterized.expand(
+        [(wb,) for wb in (stream.WB_RAW, stream.WB_ZLIB, stream.WB_GZIP)]
+    )
+    def test_resume(self, window_bits):
+        with checkpoint.CheckpointDeflater(
+            self.dst, window_bits=window_bits, interval=100000
+        ) as deflater:
+            for i in range(0, 550000, 50000):
+                deflater.write(self.data[i : i + 50000])
+            # Pretend that the process dies here
+            self.assertEqual(500000, deflater.last_checkpoint)
+        self.assertEqual(
+            500000,
+            checkpoint.compress_file(
+                self.src, self.dst, window_bits=window_bits, interval=100000
+            ),
+        )
+        self.assertFalse(os.path.exists(checkpoint.checkpoint_path(self.dst)))
+        zdata = self.read_dst()
+        self.assertEqual(self.data, stream.decompress(zdata, window_bits))
+        # A single stream with nothing after it
+        d = zlib.decompressobj(window_bits)
+        self.assertEqual(self.data, d.decompress(zdata))
+        self.assertTrue(d.eof)
+        self.assertEqual(b"", d.unused_data)
+
+    def test_crash(self):
+        code = """if True:
+            import os, sys
+            from pyzlib import checkpoint
+            with checkpoint.CheckpointDeflater(sys.argv[2], interval=65536) as d:
+                with open(sys.argv[1], "rb") as fp:
+                    while d.in_offset < 300000:
+                        d.write(fp.read(10000))
+            os._exit(1)
+        """
+        env = dict(os.environ, PYTHONPATH=os.getcwd())
+        subprocess.call([sys.executable, "-c", code, self.src, self.dst], env=env)
+        start = checkpoint.compress_file(self.src, self.dst, interval=65536)
+        self.assertEqual(280000, start)
+        self.assertEqual(self.data, stream.decompress(self.read_dst(), stream.WB_GZIP))
+
+    def test_torn_checkpoint(self):
+        with checkpoint.CheckpointDeflater(self.dst, interval=100000) as deflater:
+            deflater.write(self.data[:200000])
+        path = checkpoint.checkpoint_path(self.dst)
+        self.assertIsNotNone(checkpoint.read_checkpoint(self.dst))
+        with open(path, "r+b") as fp:
+            fp.truncate(os.path.getsize(path) - 1)
+        self.assertIsNone(checkpoint.read_checkpoint(self.dst))
+        self.assertEqual(0, checkpoint.compress_file(self.src, self.dst))
+        self.assertEqual(self.data, stream.decompress(self.read_dst(), stream.WB_GZIP))
+
+    def test_parameters(self):
+        with checkpoint.CheckpointDeflater(self.dst, level=1, interval=1000) as d:
+            d.write(self.data[:2000])
+        with self.assertRaises(Exception):
+            checkpoint.CheckpointDeflater(self.dst, level=9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import unittest
+
+from parameterized import parameterized
+
+from pyzlib import chunkarray
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "array.pzca")
+        rng = numpy.random.default_rng(0)
+        self.array = numpy.cumsum(rng.integers(-8, 8, (10000, 3, 2)), axis=0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @parameterized.expand([(1,), (7,), (1000,), (10000,), (20000,)])
+    def test_round_trip(self, chunk_rows):
+        chunkarray.save(self.path, self.array, chunk_rows, workers=2)
+        with chunkarray.ChunkedArray(self.path, workers=2) as chunked:
+            self.assertEqual(self.array.shape, chunked.shape)
+            self.assertEqual(self.array.dtype, chunked.dtype)
+            self.assertEqual(-(-10000 // chunk_rows), chunked.nchunks)
+            numpy.testing.assert_array_equal(self.array, chunked.read())
+
+    @parameterized.expand(
+        [
+            (start, stop)
+            for start, stop in (
+                (0, 1),
+                (999, 1001),
+                (1000, 2000),
+                (500, 3500),
+                (9999, 10000),
+                (5000, 5000),
+                (-10, None),
+            )
+        ]
+    )
+    def test_slices(self, start, stop):
+        chunkarray.save(self.path, self.array, 1000)
+        with chunkarray.ChunkedArray(self.path) as chunked:
+            numpy.testing.assert_array_equal(
+                self.array[start:stop], chunked[start:stop]
+            )
+
+    def test_partial_read_inflates_overlapping_chunks(self):
+        chunkarray.save(self.path, self.array, 1000)
+        with chunkarray.ChunkedArray(self.path) as chunked:
+            inflated = []
+            inflate_chunk = chunked._inflate_chunk
+
+            def record(i, out):
+                inflated.append(i)
+                inflate_chunk(i, out)
+
+            chunked._inflate_chunk = record
+            chunked.read(1500, 3200)
+            self.assertEqual([1, 2, 3], sorted(inflated))
+
+    def test_indexing(self):
+        chunkarray.save(self.path, self.array, 1000)
+        with chunkarray.ChunkedArray(self.path) as chunked:
+            numpy.testing.assert_array_equal(self.array[1234], chunked[1234])
+            numpy.testing.assert_array_equal(self.array[-1], chunked[-1])
+            numpy.testing.assert_array_equal(
+                self.array[10:20, 1, :], chunked[10:20, 1, :]
+            )
+            numpy.testing.assert_array_equal(self.array[::7], chunked[::7])
+            with self.assertRaises(IndexError):
+                chunked[10000]
+
+    def test_out(self):
+        chunkarray.save(self.path, self.array, 1000)
+        out = numpy.zeros((2000, 3, 2), self.array.dtype)
+        with chunkarray.ChunkedArray(self.path) as chunked:
+            self.assertIs(out, chunked.read(2000, 4000, out=out))
+            with self.assertRaises(ValueError):
+                chunked.read(0, 10, out=out)
+        numpy.testing.assert_array_equal(self.array[2000:4000], out)
+
+    @parameterized.expand(
+        [
+            (numpy.zeros(0, "<f4") if numpy is not None else None,),
+            (numpy.zeros((5, 0), "u1") if numpy is not None else None,),
+            (numpy.arange(100, dtype=">i2") if numpy is not None else None,),
+            (numpy.asfortranarray(numpy.ones((30, 4))) if numpy is not None else None,),
+        ]
+    )
+    def test_shapes(self, array):
+        chunkarray.save(self.path, array, 8)
+        result = chunkarray.load(self.path)
+        self.assertEqual(array.dtype, result.dtype)
+        numpy.testing.assert_array_equal(array, result)
+
+    def test_not_an_array(self):
+        with open(self.path, "wb") as fp:
+            fp.write(b"x" * 100)
+        with self.assertRaises(Exception):
+            chunkarray.ChunkedArray(self.path)
+        with self.assertRaises(ValueError):
+            chunkarray.save(self.path, numpy.array(1.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import os
+import random
+import struct
+import tempfile
+import unittest
+import zlib
+
+from pyzlib import corpus
+
+
+class TestCase(unittest.TestCase):
+    def test_sizes(self):
+        for kind in corpus.KINDS:
+            for size in (0, 1, 4095, 100000):
+                self.assertEqual(size, len(corpus.generate(kind, size)), kind)
+
+    def test_deterministic(self):
+        for kind in corpus.KINDS:
+            data = corpus.generate(kind, 100000, seed=42)
+            self.assertEqual(data, corpus.generate(kind, 100000, seed=42), kind)
+            self.assertNotEqual(data, corpus.generate(kind, 100000, seed=43), kind)
+
+    def test_byte_order(self):
+        # Integers are little-endian regardless of the machine
+        ints = corpus._ints(random.Random(5), "H", 4)
+        self.assertEqual(
+            list(struct.unpack("<4H", random.Random(5).randbytes(8))), list(ints)
+        )
+
+    def test_compressibility(self):
+        ratios = {
+            kind: len(zlib.compress(corpus.generate(kind, 1 << 20))) / (1 << 20)
+            for kind in corpus.KINDS
+        }
+        self.assertGreater(ratios["random"], 1)
+        for kind in ("zeros_ones", "zero_runs", "text", "log", "numeric", "mix"):
+            self.assertLess(ratios[kind], 0.5, kind)
+        # Like real prose, text must not consist of long repeated matches
+        self.assertGreater(ratios["text"], 0.3)
+
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            data = corpus.load("text", 50000, seed=7, cache_dir=cache_dir)
+            self.assertEqual(corpus.generate("text", 50000, seed=7), data)
+            (name,) = os.listdir(cache_dir)
+            path = os.path.join(cache_dir, name)
+            with open(path, "rb") as fp:
+                self.assertEqual(data, fp.read())
+            # The cached file is used as is
+            with open(path, "r+b") as fp:
+                fp.write(b"cached")
+            data = corpus.load("text", 50000, seed=7, cache_dir=cache_dir)
+            self.assertEqual(b"cached", data[:6])
+
+    def test_gen(self):
+        # The output does not depend on how it is requested
+        gen = corpus.Gen("random", seed=3, chunk_size=1000)
+        r = random.Random(0)
+        data = b"".join(gen(r.randint(0, 3000)) for _ in range(100))
+        expected = corpus.Gen("random", seed=3, chunk_size=1000)(len(data))
+        self.assertEqual(expected, data)
+
+
+if __name__ == "__main__":
+    unittest.main()
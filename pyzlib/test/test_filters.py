@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+import unittest
+import zlib
+
+from parameterized import parameterized
+
+from pyzlib import corpus, filters
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DATA = corpus.generate("numeric", 200000, 0)
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestCase(unittest.TestCase):
+    @parameterized.expand(
+        [
+            (name, itemsize, size)
+            for name in ("Shuffle", "BitShuffle", "Delta")
+            for itemsize in (1, 2, 4, 8)
+            for size in (0, 1, 7, 64, 1000, 131077)
+        ]
+    )
+    def test_inverse(self, name, itemsize, size):
+        f = getattr(filters, name)(itemsize)
+        a = numpy.frombuffer(DATA[:size], dtype=numpy.uint8)
+        self.assertEqual(DATA[:size], f.inverse(f.forward(a)).tobytes())
+
+    def test_shuffle_layout(self):
+        a = numpy.frombuffer(b"\x01\x02\x03\x04\x05\x06\x07", dtype=numpy.uint8)
+        self.assertEqual(
+            b"\x01\x03\x05\x02\x04\x06\x07", filters.Shuffle(2).forward(a).tobytes()
+        )
+
+    def test_bitshuffle_layout(self):
+        # Eight 16-bit items with only bit 1 of the first byte set in item 0
+        a = numpy.zeros(16, dtype=numpy.uint8)
+        a[0] = 2
+        out = filters.BitShuffle(2).forward(a)
+        self.assertEqual([0, 1] + [0] * 14, list(out))
+
+    def test_delta_wraps(self):
+        a = numpy.array([5, 3, 0xFFFF, 0], dtype="<u2").view(numpy.uint8)
+        f = filters.Delta(2)
+        out = f.forward(a)
+        self.assertEqual([5, 0xFFFE, 0xFFFC, 1], list(out.view("<u2")))
+        self.assertEqual(a.tobytes(), f.inverse(out).tobytes())
+
+    @parameterized.expand([(pipeline,) for pipeline in sorted(filters.PIPELINES)])
+    def test_round_trip(self, pipeline):
+        pipe = filters.PIPELINES[pipeline](8)
+        zdata = filters.compress(DATA, pipe)
+        self.assertEqual(DATA, filters.decompress(zdata))
+        self.assertEqual(DATA, filters.decompress(memoryview(zdata)))
+
+    def test_input_unchanged(self):
+        data = bytearray(DATA)
+        filters.compress(data, [filters.Delta(8), filters.Shuffle(8)])
+        self.assertEqual(DATA, data)
+
+    def test_delta_helps(self):
+        plain = len(filters.compress(DATA, []))
+        self.assertLess(len(filters.compress(DATA, [filters.Delta(8)])), plain)
+
+    def test_plain_zlib_payload(self):
+        zdata = filters.compress(DATA, [])
+        self.assertEqual(DATA, zlib.decompress(zdata[filters.HEADER.size + 8 :]))
+
+    def test_bad_header(self):
+        with self.assertRaises(Exception):
+            filters.decompress(b"garbage" * 10)
+        zdata = bytearray(filters.compress(DATA, [filters.Shuffle(8)]))
+        zdata[filters.HEADER.size] = 99
+        with self.assertRaisesRegex(Exception, "unknown filter"):
+            filters.decompress(zdata)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+import unittest
+import zlib
+
+from parameterized import parameterized
+
+import pyzlib
+from pyzlib import corpus, flushpolicy
+
+MESSAGES = corpus.generate("log", 200000, 0).splitlines(keepends=True)
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCase(unittest.TestCase):
+    def _deflater(self, policy):
+        self.clock = _Clock()
+        self.chunks = []
+        self.decompressor = zlib.decompressobj()
+        self.received = b""
+        return flushpolicy.FlushingDeflater(
+            self.chunks.append, policy, 1, clock=self.clock
+        )
+
+    def _receive(self):
+        # What the peer can decompress from the output so far
+        self.received += self.decompressor.decompress(b"".join(self.chunks))
+        self.chunks.clear()
+        return self.received
+
+    @parameterized.expand(
+        [(mode,) for mode in (pyzlib.Z_SYNC_FLUSH, pyzlib.Z_PARTIAL_FLUSH)]
+    )
+    def test_latency_first(self, mode):
+        with self._deflater(flushpolicy.latency_first(mode)) as deflater:
+            sent = b""
+            for message in MESSAGES[:100]:
+                self.assertTrue(deflater.write(message, flush=True))
+                sent += message
+                self.assertEqual(sent, self._receive())
+            self.assertEqual(100, deflater.stats.flushes)
+            self.assertEqual(0, deflater.stats.max_latency)
+
+    def test_ratio_first(self):
+        policy = flushpolicy.ratio_first(max_bytes=10000)
+        with self._deflater(policy) as deflater:
+            sent = 0
+            for message in MESSAGES:
+                flushed = deflater.write(message, flush=True)
+                sent += len(message)
+                self.assertEqual(sent >= 10000, flushed)
+                if flushed:
+                    break
+                # Nothing is due, however long the request waits
+                self.clock.now += 1
+                self.assertIsNone(deflater.poll())
+            self.assertEqual(sent, len(self._receive()))
+            self.assertEqual(1, deflater.stats.flushes)
+
+    def test_deadline(self):
+        policy = flushpolicy.deadline(max_delay=0.01, max_bytes=1 << 30)
+        with self._deflater(policy) as deflater:
+            # A request after a quiet period is served at once
+            self.clock.now += 1
+            self.assertTrue(deflater.write(MESSAGES[0], flush=True))
+            # Later ones wait for the deadline of the oldest one
+            self.clock.now += 0.001
+            self.assertFalse(deflater.write(MESSAGES[1], flush=True))
+            self.clock.now += 0.002
+            self.assertFalse(deflater.write(MESSAGES[2], flush=True))
+            due = deflater.poll()
+            self.assertAlmostEqual(self.clock.now + 0.008, due)
+            self.assertEqual(MESSAGES[0], self._receive())
+            self.clock.now = due
+            self.assertIsNone(deflater.poll())
+            self.assertEqual(b"".join(MESSAGES[:3]), self._receive())
+            self.assertEqual(2, deflater.stats.flushes)
+            self.assertAlmostEqual(0.01, deflater.stats.max_latency)
+
+    def test_deadline_bytes(self):
+        policy = flushpolicy.deadline(max_delay=1, max_bytes=1000)
+        with self._deflater(policy) as deflater:
+            self.assertFalse(deflater.write(b"x" * 998, flush=True))
+            self.clock.now += 0.1
+            self.assertFalse(deflater.write(b"y", flush=True))
+            self.clock.now += 0.1
+            # Reaching max_bytes serves the pending requests
+            self.assertTrue(deflater.write(b"z"))
+            self.assertEqual(b"x" * 998 + b"yz", self._receive())
+
+    def test_skipped_and_finish(self):
+        with self._deflater(flushpolicy.latency_first()) as deflater:
+            deflater.write(MESSAGES[0], flush=True)
+            deflater.request_flush()
+            self.assertEqual((1, 1), (deflater.stats.flushes, deflater.stats.skipped))
+        with self._deflater(flushpolicy.ratio_first()) as deflater:
+            deflater.write(MESSAGES[0], flush=True)
+            deflater.flush()
+            self.assertEqual(MESSAGES[0], self._receive())
+            deflater.write(MESSAGES[1], flush=True)
+            deflater.finish()
+            self.assertEqual(b"".join(MESSAGES[:2]), self._receive())
+            self.assertTrue(self.decompressor.eof)
+            stats = deflater.stats
+            # flush() and finish() serve the requests
+            self.assertEqual((2, 2), (stats.requests, stats.flushes))
+            self.assertEqual(len(MESSAGES[0]) + len(MESSAGES[1]), stats.bytes_in)
+            self.assertEqual(1.0, stats.requests_per_flush)
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            flushpolicy.FlushPolicy(mode=pyzlib.Z_FINISH)
+
+    def test_simulate(self):
+        results = {
+            name: flushpolicy.simulate(policy, MESSAGES, 20000)
+            for name, policy in (
+                ("latency", flushpolicy.latency_first()),
+                ("deadline", flushpolicy.deadline(0.005)),
+            )
+        }
+        latency_stats, latency_size, _ = results["latency"]
+        deadline_stats, deadline_size, _ = results["deadline"]
+        self.assertEqual(len(MESSAGES), latency_stats.flushes)
+        self.assertLess(deadline_size, latency_size)
+        self.assertLess(deadline_stats.flushes, latency_stats.flushes / 10)
+        self.assertLessEqual(deadline_stats.max_latency, 0.005 + 1e-9)
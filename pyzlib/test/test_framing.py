@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+import concurrent.futures
+import time
+import unittest
+import zlib
+
+from parameterized import parameterized
+
+import pyzlib
+from pyzlib import corpus, framing, stream
+
+DATA = corpus.generate("mix", 1000000, 0)
+
+
+class _Jittery(concurrent.futures.ThreadPoolExecutor):
+    # Starts tasks in order, but delays every other one, so that they finish
+    # out of order
+    def __init__(self):
+        super().__init__(4)
+        self.count = 0
+
+    def submit(self, fn, *args):
+        self.count += 1
+        return super().submit(self._run, 0.001 * (self.count % 2), fn, *args)
+
+    @staticmethod
+    def _run(delay, fn, *args):
+        time.sleep(delay)
+        return fn(*args)
+
+
+class TestCase(unittest.TestCase):
+    @parameterized.expand(
+        [
+            (level, wb)
+            for level in (-1, 1, 6, 9)
+            for wb in (stream.WB_RAW, stream.WB_ZLIB, stream.WB_GZIP)
+        ]
+    )
+    def test_same_as_inline(self, level, window_bits):
+        # The framing matches what deflate() writes itself
+        framed = framing.compress(DATA, level, window_bits, chunk_size=100000)
+        self.assertEqual(stream.compress(DATA, level, window_bits), framed)
+
+    @parameterized.expand(
+        [(wb,) for wb in (stream.WB_RAW, stream.WB_ZLIB, stream.WB_GZIP)]
+    )
+    def test_stored(self, window_bits):
+        # Stored block boundaries follow the input chunks, so only the
+        # content is the same
+        framed = framing.compress(DATA, 0, window_bits, chunk_size=100000)
+        self.assertEqual(DATA, stream.decompress(framed, window_bits))
+
+    def test_zlib_header(self):
+        for level in range(-1, 10):
+            self.assertEqual(zlib.compress(b"", level)[:2], framing.zlib_header(level))
+
+    def test_shared_checksums(self):
+        # One pass of checksums serves a gzip and a zlib encoding
+        checksums = framing.Checksums()
+        gz, zl = [], []
+        with framing.FramedWriter(
+            gz.append, stream.WB_GZIP, checksums=checksums
+        ) as gzip_writer, framing.FramedWriter(
+            zl.append, stream.WB_ZLIB, checksums=checksums
+        ) as zlib_writer:
+            for i in range(0, len(DATA), 65536):
+                chunk = DATA[i : i + 65536]
+                checksums.update(chunk)
+                gzip_writer.write(chunk)
+                zlib_writer.write(chunk)
+            gzip_writer.finish()
+            zlib_writer.finish()
+        self.assertEqual(DATA, stream.decompress(b"".join(gz), stream.WB_GZIP))
+        self.assertEqual(DATA, stream.decompress(b"".join(zl), stream.WB_ZLIB))
+        result = checksums.result()
+        self.assertEqual(len(DATA), result["size"])
+        self.assertEqual(pyzlib.crc32(0, DATA, len(DATA)), result[framing.CRC32])
+
+    def test_executor(self):
+        # Updates run in order on an executor with several workers
+        with _Jittery() as executor:
+            checksums = framing.Checksums(executor=executor)
+            for i in range(0, len(DATA), 4096):
+                checksums.update(DATA[i : i + 4096])
+            result = checksums.result()
+        self.assertEqual(zlib.crc32(DATA), result[framing.CRC32])
+        self.assertEqual(zlib.adler32(DATA), result[framing.ADLER32])
+        self.assertEqual(len(DATA), result["size"])
+
+    def test_mutable_input(self):
+        # The buffer is reused before the checksum thread gets to it
+        out = []
+        buf = bytearray(4096)
+        with framing.FramedWriter(out.append, stream.WB_GZIP) as writer:
+            for i in range(0, 409600, 4096):
+                buf[:] = DATA[i : i + 4096]
+                writer.write(buf)
+            writer.finish()
+        self.assertEqual(
+            DATA[:409600], stream.decompress(b"".join(out), stream.WB_GZIP)
+        )
+
+    def test_flush(self):
+        out = []
+        with framing.FramedWriter(out.append, stream.WB_ZLIB) as writer:
+            writer.write(DATA[:1000])
+            writer.flush()
+            partial = b"".join(out)
+            self.assertEqual(DATA[:1000], zlib.decompressobj().decompress(partial))
+            writer.write(DATA[1000:2000])
+            writer.finish()
+        self.assertEqual(DATA[:2000], stream.decompress(b"".join(out), stream.WB_ZLIB))
+
+
+if __name__ == "__main__":
+    unittest.main()
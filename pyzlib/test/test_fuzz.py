@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import ctypes.util
+import json
+import subprocess
+import sys
+import unittest
+
+import pyzlib
+from pyzlib import fuzz
+
+
+class TestCase(unittest.TestCase):
+    def test_fuzz(self):
+        done, failures = fuzz.fuzz(
+            cases=48, seed=3014405863, workers=2, max_size=65536, batch_size=4
+        )
+        self.assertEqual(48, done)
+        self.assertEqual([], failures)
+
+    def test_case_is_json(self):
+        case = fuzz.make_case(1)
+        self.assertEqual(case, json.loads(json.dumps(case)))
+        self.assertEqual(case, fuzz.make_case(1))
+
+    def test_backend(self):
+        backend = fuzz.Library(ctypes.util.find_library("z"))
+        self.assertEqual(pyzlib.zlibVersion(), backend.zlibVersion())
+        for seed in range(8):
+            self.assertIsNone(fuzz.run_case(fuzz.make_case(seed), backend))
+
+    def test_detects_corruption(self):
+        # Unlike raw deflate, the zlib format has a checksum
+        case = dict(fuzz.make_case(2), window_bits=15, inflate_window_bits=15)
+        data, dictionary = fuzz.case_data(case)
+        zdata = bytearray(fuzz.deflate(pyzlib, case, data, dictionary))
+        zdata[len(zdata) // 2] ^= 0xFF
+        with self.assertRaises(fuzz.Failure):
+            fuzz.inflate(pyzlib, case, zdata, dictionary)
+
+    def test_minimize(self):
+        def check(case):
+            data, _ = fuzz.case_data(case)
+            if len(data) >= 1000 and case["level"] != 0:
+                return "fake failure"
+            return None
+
+        for seed in range(16):
+            case = fuzz.make_case(seed)
+            if check(case) is None:
+                continue
+            minimized = fuzz.minimize(case, check)
+            self.assertEqual("fake failure", check(minimized))
+            self.assertLessEqual(len(minimized["ops"]), 2)
+            self.assertLess(len(fuzz.case_data(minimized)[0]), 2000)
+            self.assertEqual([65536], minimized["deflate_out"])
+
+    def test_replay(self):
+        output = subprocess.check_output(
+            [
+                sys.executable,
+                "-m",
+                "pyzlib.fuzz",
+                "--replay",
+                json.dumps(fuzz.make_case(5)),
+            ]
+        )
+        self.assertEqual(b"ok\n", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+import gzip
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import pyzlib
+from pyzlib import corpus, gzmember, stream
+
+
+class TestCase(unittest.TestCase):
+    def test_header_round_trip(self):
+        extra = bytearray(b"XY\x04\x00data")
+        head = gzmember.GzipHeader.for_deflate(
+            text=True,
+            mtime=1700000000,
+            os=3,
+            extra=extra,
+            name=b"file.txt\x00",
+            comment=bytearray(b"comment\x00"),
+            hcrc=True,
+        )
+        with stream.Deflater(window_bits=stream.WB_GZIP) as deflater:
+            deflater.set_header(head)
+            zdata = deflater.compress(b"payload", pyzlib.Z_FINISH)
+        self.assertEqual(b"payload", gzip.decompress(zdata))
+
+        extra2 = bytearray(64)
+        name2 = bytearray(64)
+        comment2 = bytearray(64)
+        head2 = gzmember.GzipHeader.for_inflate(extra2, name2, comment2)
+        with stream.Inflater(window_bits=stream.WB_GZIP) as inflater:
+            inflater.get_header(head2)
+            self.assertEqual(b"payload", inflater.decompress(zdata))
+        self.assertEqual(1, head2.done)
+        self.assertEqual((1, 1700000000, 3), (head2.text, head2.time, head2.os))
+        self.assertEqual(extra, head2.extra_view())
+        self.assertEqual(b"file.txt\x00", bytes(name2[:9]))
+        self.assertEqual(b"comment\x00", bytes(comment2[:8]))
+
+    def test_unterminated(self):
+        with self.assertRaises(ValueError):
+            gzmember.GzipHeader.for_deflate(name=b"name")
+
+    def test_walk(self):
+        chunks = [corpus.generate("text", 30000, i) for i in range(5)]
+        data = gzmember.compress_member(chunks[0], name=b"a", bgzf=True)
+        data += gzip.compress(chunks[1])
+        data += gzmember.compress_member(chunks[2], mtime=42, comment=b"c")
+        data += gzmember.compress_member(chunks[3], bgzf=True)
+        data += gzmember.compress_member(chunks[4], name=b"e", bgzf=True)
+        self.assertEqual(b"".join(chunks), gzip.decompress(data))
+        members = list(gzmember.walk(data))
+        self.assertEqual([True, False, False, True, True], [m.indexed for m in members])
+        self.assertEqual(len(data), sum(m.size for m in members))
+        self.assertEqual([b"a", None, None, None, b"e"], [m.name for m in members])
+        self.assertEqual(42, members[2].mtime)
+        self.assertEqual(b"c", members[2].comment)
+        for chunk, member in zip(chunks, members):
+            self.assertEqual(len(chunk), member.isize)
+            self.assertEqual(chunk, gzmember.read_member(data, member))
+
+    def test_walk_does_not_inflate_indexed(self):
+        data = gzmember.compress_member(b"x" * 1000, bgzf=True)
+        # Corrupt the payload; only the header and the trailer are read
+        data = bytearray(data)
+        data[20] ^= 0xFF
+        (member,) = gzmember.walk(data)
+        self.assertEqual(len(data), member.size)
+        self.assertEqual(1000, member.isize)
+        with self.assertRaises(Exception):
+            gzmember.read_member(data, member)
+
+    def test_errors(self):
+        data = gzmember.compress_member(b"hello", bgzf=True)
+        with self.assertRaises(Exception):
+            list(gzmember.walk(data[:-1]))
+        with self.assertRaises(Exception):
+            list(gzmember.walk(b"not gzip data"))
+        zdata = gzip.compress(corpus.generate("text", 30000))
+        for size in (len(zdata) // 2, len(zdata) - 8):
+            with self.assertRaisesRegex(Exception, "truncated"):
+                list(gzmember.walk(zdata[:size]))
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "data.gz")
+            with open(path, "wb") as fp:
+                fp.write(gzmember.compress_member(b"hello", name=b"h", bgzf=True))
+                fp.write(gzip.compress(b"world"))
+            output = subprocess.check_output(
+                [sys.executable, "-m", "pyzlib.gzmember", path],
+                env=dict(os.environ, PYTHONPATH=os.getcwd()),
+            )
+        lines = output.decode().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[0].endswith("indexed\th"))
+        self.assertIn("inflated", lines[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
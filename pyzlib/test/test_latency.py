@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import copy
+import json
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from pyzlib import latency
+
+
+class TestCase(unittest.TestCase):
+    def test_run(self):
+        report = latency.run(sizes=(200, 4096), iterations=50)
+        self.assertEqual(report, json.loads(json.dumps(report)))
+        self.assertEqual(
+            [(op, size) for size in (200, 4096) for op in latency.OPERATIONS],
+            [(result["op"], result["size"]) for result in report["results"]],
+        )
+        for result in report["results"]:
+            for variant in latency.VARIANTS:
+                stats = result[variant]
+                self.assertEqual(50, stats["n"])
+                self.assertLessEqual(0, stats["p50"])
+                self.assertLessEqual(stats["p50"], stats["p99"])
+                self.assertLessEqual(stats["p99"], stats["p999"])
+
+    def test_percentiles(self):
+        stats = latency.percentiles(list(range(1000, 0, -1)))
+        self.assertEqual(501, stats["p50"])
+        self.assertEqual(991, stats["p99"])
+        self.assertEqual(1000, stats["p999"])
+
+    def test_compare(self):
+        baseline = latency.run(sizes=(200,), iterations=20)
+        report = copy.deepcopy(baseline)
+        self.assertEqual([], latency.compare(baseline, report))
+        report["results"][1]["pyzlib"]["p99"] *= 2
+        ((key, old, new),) = latency.compare(baseline, report)
+        self.assertEqual("uncompress/200", key)
+        self.assertEqual(2 * old, new)
+
+    def test_cli(self):
+        with tempfile.NamedTemporaryFile("w+") as fp:
+            subprocess.check_call(
+                [
+                    sys.executable,
+                    "-m",
+                    "pyzlib.latency",
+                    "--sizes=300",
+                    "--iterations=20",
+                    "--output",
+                    fp.name,
+                ],
+                stderr=subprocess.DEVNULL,
+            )
+            report = json.load(fp)
+        self.assertEqual(len(latency.OPERATIONS), len(report["results"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
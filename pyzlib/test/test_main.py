@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+import gzip
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import zlib
+
+from parameterized import parameterized
+
+import pyzlib
+from pyzlib import __main__ as cli
+from pyzlib import corpus, gzmember, stream
+
+DATA = corpus.generate("mix", 1000000, 0)
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+DECOMPRESS = {
+    "gzip": gzip.decompress,
+    "zlib": zlib.decompress,
+    "raw": lambda data: zlib.decompress(data, -15),
+}
+
+
+def _output(buffer_size=stream.DEFAULT_BUFFER_SIZE):
+    chunks = []
+    return cli._Output(lambda view: chunks.append(bytes(view)), buffer_size), chunks
+
+
+def _run(*args, **kwargs):
+    return subprocess.run(
+        [sys.executable, "-m", "pyzlib"] + list(args),
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **kwargs
+    )
+
+
+class TestCase(unittest.TestCase):
+    @parameterized.expand(
+        [(format, jobs) for format in sorted(DECOMPRESS) for jobs in (1, 3)]
+    )
+    def test_round_trip(self, format, jobs):
+        out, chunks = _output(4096)
+        with cli._Input(DATA) as inp:
+            if jobs == 1:
+                cli.compress(inp, out, format, 1, pyzlib.Z_DEFAULT_STRATEGY, 15, 8)
+            else:
+                cli.compress_parallel(
+                    inp, out, format, 1, pyzlib.Z_DEFAULT_STRATEGY, 15, 8, jobs, 50000
+                )
+        zdata = b"".join(chunks)
+        self.assertEqual(len(zdata), out.size)
+        self.assertEqual(DATA, DECOMPRESS[format](zdata))
+        out, chunks = _output(4096)
+        with cli._Input(zdata) as inp:
+            cli.decompress(inp, out, format, 15, 1000)
+        self.assertEqual(DATA, b"".join(chunks))
+
+    @parameterized.expand([("gzip",), ("zlib",)])
+    def test_parallel_empty(self, format):
+        out, chunks = _output()
+        with cli._Input(b"") as inp:
+            cli.compress_parallel(
+                inp, out, format, 6, pyzlib.Z_DEFAULT_STRATEGY, 15, 8, 2
+            )
+        self.assertEqual(b"", DECOMPRESS[format](b"".join(chunks)))
+
+    def test_decompress_errors(self):
+        zdata = gzip.compress(DATA)
+        for data, format in (
+            (zdata[:-100], None),
+            (b"", None),
+            (zlib.compress(DATA) + b"x", "zlib"),
+            (DATA, None),
+        ):
+            with cli._Input(data) as inp, self.assertRaises(Exception):
+                cli.decompress(inp, _output()[0], format, 15, 65536)
+
+    def test_members(self):
+        members = gzip.compress(DATA[:1000]) + gzip.compress(DATA[1000:])
+        out, chunks = _output()
+        with cli._Input(members) as inp:
+            cli.decompress(inp, out, None, 15, 65536)
+        self.assertEqual(DATA, b"".join(chunks))
+
+    def test_bgzf(self):
+        bgzf = b"".join(
+            gzmember.compress_member(DATA[i : i + 60000], bgzf=True)
+            for i in range(0, len(DATA), 60000)
+        )
+        out, chunks = _output()
+        with cli._Input(bgzf) as inp:
+            self.assertIsNotNone(cli._bgzf_members(inp.data))
+            cli.decompress_parallel(inp, out, "gzip", 15, 65536, 3)
+        self.assertEqual(DATA, b"".join(chunks))
+        corrupt = bytearray(bgzf)
+        # The CRC-32 of the last member
+        corrupt[-8] ^= 1
+        with cli._Input(corrupt) as inp, self.assertRaisesRegex(Exception, "crc"):
+            cli.decompress_parallel(inp, _output()[0], "gzip", 15, 65536, 3)
+
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "data")
+            with open(path, "wb") as fp:
+                fp.write(DATA)
+            # A mapped file and a pipe
+            zfile = _run("compress", "-p", "2", "--block-size", "65536", path).stdout
+            zpipe = _run("compress", "-p", "2", "--block-size", "65536", input=DATA)
+            self.assertEqual(zfile, zpipe.stdout)
+            self.assertEqual(DATA, gzip.decompress(zfile))
+            zpath = os.path.join(tmp, "data.gz")
+            _run("compress", "-l", "9", "-s", "filtered", "-o", zpath, path)
+            self.assertEqual(DATA, gzip.decompress(open(zpath, "rb").read()))
+            self.assertEqual(DATA, _run("decompress", zpath).stdout)
+            self.assertEqual(DATA, _run("decompress", input=zfile).stdout)
+            self.assertEqual(0, _run("test", zpath).returncode)
+            result = _run("test", zpath, path)
+            self.assertEqual(1, result.returncode)
+            self.assertIn(path.encode(), result.stderr)
+            listing = _run("list", zpath).stdout.decode().splitlines()
+            self.assertEqual(
+                [str(os.path.getsize(zpath)), str(len(DATA))], listing[1].split()[:2]
+            )
+            result = _run("decompress", input=zfile[:-100])
+            self.assertEqual(1, result.returncode)
+            self.assertIn(b"truncated", result.stderr)
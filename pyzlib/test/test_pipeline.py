@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+import gzip
+import io
+import unittest
+import zlib
+
+from parameterized import parameterized
+
+from pyzlib import corpus, pipeline, stream
+
+DATA = corpus.generate("mix", 1000000, 0)
+
+
+class _Failing(io.RawIOBase):
+    # Fails after size bytes
+    def __init__(self, size):
+        self.size = size
+
+    def writable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.size <= 0:
+            raise OSError("read failed")
+        n = min(len(b), self.size)
+        b[:n] = DATA[:n]
+        self.size -= n
+        return n
+
+    def write(self, b):
+        if self.size <= 0:
+            raise OSError("write failed")
+        # Short writes
+        n = min(len(b), self.size, 1000)
+        self.size -= n
+        return n
+
+
+class TestCase(unittest.TestCase):
+    @parameterized.expand(
+        [
+            ("zlib", stream.WB_ZLIB, zlib.decompress),
+            ("gzip", stream.WB_GZIP, gzip.decompress),
+            ("raw", stream.WB_RAW, lambda data: zlib.decompress(data, -15)),
+        ]
+    )
+    def test_round_trip(self, _, window_bits, decompress):
+        for buffer_size, depth in ((1000, 1), (65536, 3)):
+            dst = io.BytesIO()
+            stats = pipeline.compress(
+                io.BytesIO(DATA),
+                dst,
+                1,
+                window_bits=window_bits,
+                buffer_size=buffer_size,
+                readahead=depth,
+                write_behind=depth,
+            )
+            zdata = dst.getvalue()
+            self.assertEqual(DATA, decompress(zdata))
+            self.assertEqual(len(DATA), stats["read"].bytes)
+            self.assertEqual(len(zdata), stats["deflate"].bytes)
+            self.assertEqual(len(zdata), stats["write"].bytes)
+            dst = io.BytesIO()
+            stats = pipeline.decompress(
+                io.BytesIO(zdata),
+                dst,
+                window_bits,
+                buffer_size=buffer_size,
+                readahead=depth,
+                write_behind=depth,
+            )
+            self.assertEqual(DATA, dst.getvalue())
+            self.assertEqual(len(DATA), stats["inflate"].bytes)
+            for stage in stats.values():
+                self.assertGreaterEqual(stage.busy, 0)
+                self.assertGreaterEqual(stage.idle, 0)
+                self.assertLessEqual(stage.utilization, 1)
+
+    def test_empty(self):
+        dst = io.BytesIO()
+        pipeline.compress(io.BytesIO(), dst)
+        self.assertEqual(b"", zlib.decompress(dst.getvalue()))
+
+    def test_members(self):
+        members = gzip.compress(DATA[:1000]) + gzip.compress(DATA[1000:])
+        dst = io.BytesIO()
+        pipeline.decompress(io.BytesIO(members), dst, stream.WB_AUTO, buffer_size=4096)
+        self.assertEqual(DATA, dst.getvalue())
+
+    def test_decompress_errors(self):
+        zdata = zlib.compress(DATA)
+        for data, message in (
+            (zdata[:-100], "truncated"),
+            (zdata + b"x", "trailing garbage"),
+            (DATA, "error"),
+        ):
+            with self.assertRaisesRegex(Exception, message):
+                pipeline.decompress(io.BytesIO(data), io.BytesIO(), buffer_size=4096)
+
+    def test_io_errors(self):
+        # Failing stages stop the pipeline instead of blocking it
+        with self.assertRaisesRegex(OSError, "read failed"):
+            pipeline.compress(_Failing(100000), io.BytesIO(), buffer_size=4096)
+        dst = _Failing(100000)
+        with self.assertRaisesRegex(OSError, "write failed"):
+            pipeline.compress(io.BytesIO(DATA), dst, 0, buffer_size=4096)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            pipeline.Pipeline(io.BytesIO(), io.BytesIO(), "crc32")
+        with self.assertRaises(ValueError):
+            pipeline.Pipeline(io.BytesIO(), io.BytesIO(), readahead=0)
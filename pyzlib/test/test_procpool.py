@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+import gzip
+import threading
+import unittest
+import zlib
+
+from parameterized import parameterized
+
+from pyzlib import corpus, procpool, stream
+
+DATA = corpus.generate("mix", 300000, 0)
+
+
+class TestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = procpool.CompressionPool(2, slot_size=1024 * 1024)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    @parameterized.expand(
+        [
+            ("zlib", stream.WB_ZLIB, zlib.decompress),
+            ("gzip", stream.WB_GZIP, gzip.decompress),
+        ]
+    )
+    def test_round_trip(self, _, window_bits, decompress):
+        zdata = self.pool.compress(DATA, level=1, window_bits=window_bits)
+        self.assertEqual(DATA, decompress(zdata))
+        self.assertEqual(DATA, self.pool.decompress(zdata, window_bits=window_bits))
+
+    def test_batch(self):
+        items = [DATA[i : i + 50000] for i in range(0, len(DATA), 50000)] + [b""]
+        with self.pool.submit_batch(procpool.DEFLATE, items).result() as result:
+            self.assertEqual(len(items), len(result.views))
+            zitems = [bytes(view) for view in result.views]
+        self.assertEqual(items, [zlib.decompress(zitem) for zitem in zitems])
+        result = self.pool.submit_batch(procpool.INFLATE, zitems).result()
+        self.assertEqual(items, result.tobytes())
+        self.assertEqual([], result.views)
+
+    def test_errors(self):
+        zdata = zlib.compress(DATA)
+        for data in (zdata[:-10], zdata + b"garbage", b"\x00" * 100):
+            with self.assertRaises(Exception):
+                self.pool.decompress(data)
+        with self.assertRaises(ValueError):
+            self.pool.compress(bytes(1024 * 1024 + 1))
+        with self.assertRaises(ValueError):
+            self.pool.submit("crc32", DATA)
+        # Failed jobs give their slots back
+        for _ in range(2 * len(self.pool.inputs)):
+            self.assertEqual(DATA, zlib.decompress(self.pool.compress(DATA, level=1)))
+
+    def test_large_output(self):
+        # Inflated data does not have to fit into the slot
+        log = corpus.generate("log", 4 * 1024 * 1024, 0)
+        self.assertEqual(log, self.pool.decompress(zlib.compress(log, 9)))
+        items = [DATA[:1000], bytes(2 * 1024 * 1024), DATA]
+        zitems = [zlib.compress(item) for item in items]
+        result = self.pool.submit_batch(procpool.INFLATE, zitems).result()
+        self.assertEqual(items, result.tobytes())
+
+    def test_concurrent_submitters(self):
+        errors = []
+
+        def run(i):
+            try:
+                data = DATA[i * 1000 :]
+                zdata = self.pool.compress(data, tenant=i, level=1)
+                if zlib.decompress(zdata) != data:
+                    raise Exception("tenant {} does not round-trip".format(i))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+
+    def test_fairness(self):
+        order = []
+        lock = threading.Lock()
+
+        def done(tenant):
+            def callback(future):
+                with lock:
+                    order.append(tenant)
+                future.result().release()
+
+            return callback
+
+        with procpool.CompressionPool(1, slots=1, slot_size=len(DATA)) as pool:
+            futures = []
+            for tenant in ["a"] * 20 + ["b"] * 2:
+                future = pool.submit(procpool.DEFLATE, DATA, tenant, level=1)
+                future.add_done_callback(done(tenant))
+                futures.append(future)
+            for future in futures:
+                future.result()
+        self.assertEqual(22, len(order))
+        # b does not wait for the backlog of a
+        self.assertLess(order.index("b") + 1, 6)
+        self.assertEqual(["a"] * 20, [tenant for tenant in order if tenant == "a"])
+
+    def test_backpressure(self):
+        with procpool.CompressionPool(
+            1, slots=1, slot_size=len(DATA), max_pending=2
+        ) as pool:
+            held = pool.submit(procpool.DEFLATE, DATA).result()
+            # The only slot is taken, so two batches fill the queue
+            queued = [pool.submit(procpool.DEFLATE, DATA) for _ in range(2)]
+            submitted = threading.Event()
+
+            def submit():
+                queued.append(pool.submit(procpool.DEFLATE, DATA))
+                submitted.set()
+
+            thread = threading.Thread(target=submit)
+            thread.start()
+            self.assertFalse(submitted.wait(0.5))
+            held.release()
+            for i in range(3):
+                if i == 2:
+                    thread.join()
+                queued[i].result().release()
+            self.assertTrue(submitted.is_set())
+
+    def test_close(self):
+        pool = procpool.CompressionPool(1, slot_size=len(DATA))
+        futures = [pool.submit(procpool.DEFLATE, DATA) for _ in range(2)]
+        futures[0].add_done_callback(lambda future: future.result().release())
+        futures[1].add_done_callback(lambda future: future.result().release())
+        pool.close()
+        for future in futures:
+            self.assertTrue(future.done())
+        pool.close()
+        with self.assertRaises(Exception):
+            pool.submit(procpool.DEFLATE, DATA)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+import concurrent.futures
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from pyzlib.recordlog import RecordLogReader, RecordLogWriter, index_path
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "log")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @staticmethod
+    def _records(n, seed=2618240717):
+        r = random.Random(seed)
+        return [
+            (("record %d " % i) * r.randint(0, 50)).encode() + r.randbytes(8)
+            for i in range(n)
+        ]
+
+    def _write(self, records, batch_size=16):
+        with RecordLogWriter(self.path, batch_size=batch_size) as writer:
+            for record in records:
+                writer.append(record)
+
+    def test_round_trip(self):
+        records = self._records(1000)
+        self._write(records[:500])
+        # Reopening appends to the same stream and index
+        self._write(records[500:], batch_size=1)
+        with RecordLogReader(self.path) as reader:
+            self.assertEqual(16, reader.batch_size)
+            self.assertEqual(len(records), len(reader))
+            self.assertEqual(records, list(reader))
+            for i in (0, 15, 16, 499, 500, 999, -1):
+                self.assertEqual(records[i], reader[i])
+            with self.assertRaises(IndexError):
+                reader[len(records)]
+
+    def test_parallel_readers(self):
+        records = self._records(1000)
+        self._write(records)
+        with RecordLogReader(self.path) as reader:
+            with concurrent.futures.ThreadPoolExecutor(4) as executor:
+                batches = list(executor.map(reader.read_batch, range(reader.batches)))
+        self.assertEqual(records, [record for batch in batches for record in batch])
+
+    def _corrupt(self, offset):
+        with open(self.path, "r+b") as fp:
+            fp.seek(offset)
+            b = fp.read(1)
+            fp.seek(offset)
+            fp.write(bytes([b[0] ^ 0x55]))
+
+    def test_recover(self):
+        records = self._records(1000)
+        self._write(records)
+        with RecordLogReader(self.path) as reader:
+            start, end = reader.batch_extent(10)
+        self._corrupt((start + end) // 2)
+        with RecordLogReader(self.path) as reader:
+            with self.assertRaises(Exception):
+                reader.read_batch(10)
+            recovered = list(reader.recover())
+        self.assertLess(len(recovered), len(records))
+        self.assertEqual(records[:160], recovered[:160])
+        self.assertEqual(records[176:], recovered[-len(records[176:]) :])
+
+    def test_recover_without_index(self):
+        records = self._records(1000)
+        self._write(records)
+        with RecordLogReader(self.path) as reader:
+            start, end = reader.batch_extent(10)
+        self._corrupt(start + 1)
+        with open(index_path(self.path), "r+b") as fp:
+            fp.truncate(16)
+        with RecordLogReader(self.path) as reader:
+            recovered = list(reader.recover())
+        self.assertTrue(set(records[176:]).issubset(recovered))
+        self.assertTrue(set(recovered).issubset(records))
+        self.assertEqual(len(set(recovered)), len(recovered))
+
+    def test_reopen_after_crash(self):
+        records = self._records(1000)
+        self._write(records[:300], batch_size=1000)
+        # Die in the middle of a batch, after BufferedWriter has written
+        # some of the deflate output
+        subprocess.check_call(
+            [
+                sys.executable,
+                "-c",
+                "import os, sys\n"
+                "from pyzlib.recordlog import RecordLogWriter\n"
+                "writer = RecordLogWriter(sys.argv[1])\n"
+                "for i in range(100):\n"
+                "    writer.append(os.urandom(600) + bytes(400))\n"
+                "writer.fp.flush()\n"
+                "writer.index.flush()\n"
+                "os._exit(0)\n",
+                self.path,
+            ]
+        )
+        with RecordLogReader(self.path) as reader:
+            n = len(reader)
+            self.assertLess(reader.end, reader.size)
+            self.assertGreaterEqual(n, 300)
+            self.assertLess(n, 400)
+            self.assertEqual(records[:300], list(reader)[:300])
+        self._write(records[300:])
+        with RecordLogReader(self.path) as reader:
+            self.assertEqual(n + 700, len(reader))
+            recovered = list(reader)
+        self.assertEqual(records[:300], recovered[:300])
+        self.assertEqual(records[300:], recovered[n:])
+
+    def test_recover_inside_batch(self):
+        records = self._records(1000)
+        with RecordLogWriter(self.path, batch_size=500) as writer:
+            for i, record in enumerate(records):
+                writer.append(record)
+                if i % 10 == 9:
+                    writer.flush()
+        with RecordLogReader(self.path) as reader:
+            start, end = reader.batch_extent(0)
+        self._corrupt((start + end) // 2)
+        with RecordLogReader(self.path) as reader:
+            recovered = list(reader.recover())
+        # Only the records between two flushes are lost
+        self.assertGreaterEqual(len(recovered), len(records) - 20)
+        self.assertTrue(set(recovered).issubset(records))
+
+
+if __name__ == "__main__":
+    unittest.main()
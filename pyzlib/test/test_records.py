@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import io
+import json
+import random
+import struct
+import unittest
+
+from parameterized import parameterized
+
+from pyzlib import corpus, records, stream
+
+LOG = corpus.generate("log", 500000, 0)
+
+
+def _framed(payloads):
+    return b"".join(struct.pack("<I", len(p)) + p for p in payloads)
+
+
+class TestCase(unittest.TestCase):
+    @parameterized.expand(
+        [
+            (buffer_size, nbuffers, as_file)
+            for buffer_size in (16, 1000, 65536, 1 << 20)
+            for nbuffers in (1, 4)
+            for as_file in (False, True)
+        ]
+    )
+    def test_lines(self, buffer_size, nbuffers, as_file):
+        zdata = stream.compress(LOG, window_bits=stream.WB_GZIP)
+        source = io.BytesIO(zdata) if as_file else zdata
+        with records.RecordReader(
+            source, buffer_size=buffer_size, nbuffers=nbuffers, read_size=777
+        ) as reader:
+            lines = [bytes(line) for line in reader]
+        self.assertEqual(LOG.splitlines(keepends=True), lines)
+
+    def test_zero_copy(self):
+        zdata = stream.compress(b"a\nbb\n" * 1000 + b"last")
+        with records.RecordReader(zdata, buffer_size=4096) as reader:
+            lines = list(reader.lines())
+        self.assertEqual([b"a", b"bb"] * 1000 + [b"last"], [bytes(x) for x in lines])
+        # Only lines that span two buffers are copies
+        copies = [i for i, line in enumerate(lines) if not isinstance(line, memoryview)]
+        self.assertLessEqual(len(copies), 3)
+
+    def test_ring(self):
+        # Views stay valid until their buffer comes round again
+        zdata = stream.compress(LOG)
+        with records.RecordReader(zdata, buffer_size=4096, nbuffers=4) as reader:
+            first = reader.readline()
+            expected = bytes(first)
+            for _ in range(3 * 4096 // 80):
+                reader.readline()
+            self.assertEqual(expected, first)
+
+    def test_readinto_read(self):
+        zdata = stream.compress(LOG)
+        with records.RecordReader(zdata, buffer_size=1000) as reader:
+            self.assertEqual(LOG.split(b"\n")[0] + b"\n", bytes(reader.readline()))
+            pos = LOG.index(b"\n") + 1
+            buf = bytearray(300000)
+            self.assertEqual(300000, reader.readinto(buf))
+            self.assertEqual(LOG[pos : pos + 300000], buf)
+            pos += 300000
+            self.assertEqual(LOG[pos : pos + 10], reader.read(10))
+            self.assertEqual(LOG[pos + 10 :], reader.read())
+            self.assertEqual(0, reader.readinto(bytearray(10)))
+            self.assertEqual(b"", reader.readline())
+
+    @parameterized.expand([(16,), (1000,), (1 << 20,)])
+    def test_records(self, buffer_size):
+        r = random.Random(0)
+        payloads = [r.randbytes(r.choice((0, 1, 10, 500, 5000))) for _ in range(500)]
+        zdata = stream.compress(_framed(payloads), window_bits=stream.WB_RAW)
+        with records.RecordReader(
+            zdata, window_bits=stream.WB_RAW, buffer_size=buffer_size
+        ) as reader:
+            self.assertEqual(payloads, [bytes(p) for p in reader.records()])
+            self.assertIsNone(reader.read_record())
+
+    def test_records_prefix(self):
+        prefix = struct.Struct(">H")
+        data = b"".join(prefix.pack(len(p)) + p for p in (b"one", b"two"))
+        with records.RecordReader(stream.compress(data)) as reader:
+            self.assertEqual([b"one", b"two"], list(map(bytes, reader.records(prefix))))
+
+    def test_truncated_record(self):
+        data = _framed([b"x" * 100])[:-1]
+        with records.RecordReader(stream.compress(data), buffer_size=16) as reader:
+            with self.assertRaisesRegex(Exception, "truncated record"):
+                list(reader.records())
+
+    def test_truncated_stream(self):
+        zdata = stream.compress(LOG)[:-100]
+        with records.RecordReader(io.BytesIO(zdata)) as reader:
+            with self.assertRaisesRegex(Exception, "truncated"):
+                list(reader)
+
+    @parameterized.expand([(64,), (4096,), (1 << 20,)])
+    def test_ndjson(self, buffer_size):
+        objects = [
+            {"n": i, "s": "ü" * (i % 7), "l": [i] * (i % 50)} for i in range(3000)
+        ]
+        data = b"".join(json.dumps(o).encode() + b"\n" for o in objects)
+        data += b"\n" + json.dumps({"last": True}).encode()
+        with records.RecordReader(
+            stream.compress(data), buffer_size=buffer_size
+        ) as reader:
+            self.assertEqual(objects + [{"last": True}], list(reader.ndjson()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+import os
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import unittest
+import zlib
+
+from pyzlib import salvage
+
+
+class TestCase(unittest.TestCase):
+    @staticmethod
+    def _blocks(n=64, seed=1744264961):
+        r = random.Random(seed)
+        return [
+            b"".join(
+                b"block %d line %d\n" % (i, r.randint(0, 1000)) for _ in range(500)
+            )
+            for i in range(n)
+        ]
+
+    @staticmethod
+    def _compress(blocks, wbits=31, flush=zlib.Z_FULL_FLUSH, level=6):
+        c = zlib.compressobj(level, zlib.DEFLATED, wbits)
+        zdata = bytearray()
+        for block in blocks:
+            zdata += c.compress(block)
+            zdata += c.flush(flush)
+        zdata += c.flush()
+        return zdata
+
+    def _salvage(self, zdata, **kwargs):
+        out = bytearray()
+        ranges = salvage.salvage(zdata, out.extend, **kwargs)
+        return bytes(out), ranges
+
+    def test_intact(self):
+        blocks = self._blocks()
+        out, ranges = self._salvage(self._compress(blocks))
+        self.assertEqual(b"".join(blocks), out)
+        self.assertEqual(1, len(ranges))
+        self.assertEqual(len(out), ranges[0].out_end)
+        self.assertFalse(ranges[0].damaged)
+
+    def test_flipped_bit(self):
+        blocks = self._blocks()
+        zdata = self._compress(blocks)
+        zdata[len(zdata) // 2] ^= 0x10
+        out, ranges = self._salvage(zdata)
+        self.assertGreater(len(ranges), 1)
+        self.assertTrue(out.startswith(b"".join(blocks[:16])))
+        self.assertTrue(out.endswith(b"".join(blocks[-16:])))
+        with self.assertRaises(zlib.error):
+            zlib.decompress(bytes(zdata), 31)
+
+    def test_truncated(self):
+        blocks = self._blocks()
+        zdata = self._compress(blocks)
+        out, ranges = self._salvage(zdata[: len(zdata) // 2])
+        self.assertEqual(1, len(ranges))
+        self.assertTrue(b"".join(blocks).startswith(out))
+        self.assertGreater(len(out), len(b"".join(blocks)) // 3)
+
+    def test_members(self):
+        blocks = self._blocks(8)
+        members = [self._compress([block], flush=zlib.Z_NO_FLUSH) for block in blocks]
+        members[3][30:40] = bytes(10)
+        out, ranges = self._salvage(b"".join(members))
+        self.assertTrue(out.startswith(b"".join(blocks[:3])))
+        self.assertTrue(out.endswith(b"".join(blocks[4:])))
+
+    def test_fake_member(self):
+        blocks = self._blocks(8)
+        members = [self._compress([block], flush=zlib.Z_NO_FLUSH) for block in blocks]
+        garbage = b"GARBAGE" * 50
+        # A gzip header followed by a non-final stored block
+        fake = (
+            b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff\x00"
+            + struct.pack("<HH", len(garbage), len(garbage) ^ 0xFFFF)
+            + garbage
+        )
+        members[3][100 : 100 + len(fake)] = fake
+        out, ranges = self._salvage(b"".join(members))
+        self.assertNotIn(b"GARBAGE", out)
+        self.assertTrue(out.startswith(b"".join(blocks[:3])))
+        self.assertTrue(out.endswith(b"".join(blocks[4:])))
+        for r1, r2 in zip(ranges, ranges[1:]):
+            self.assertLessEqual(r1.in_end, r2.in_start)
+            self.assertEqual(r1.out_end, r2.out_start)
+
+    def test_brute_force(self):
+        blocks = self._blocks()
+        zdata = self._compress(blocks, wbits=-15, flush=zlib.Z_NO_FLUSH)
+        zdata[len(zdata) // 2 :] = self._compress(
+            blocks[32:], wbits=-15, flush=zlib.Z_NO_FLUSH
+        )
+        zdata[len(zdata) // 2 - 100] ^= 0xFF
+        out, _ = self._salvage(zdata)
+        self.assertFalse(out.endswith(b"".join(blocks[-1:])))
+        out, _ = self._salvage(zdata, brute_force=True)
+        self.assertTrue(out.endswith(b"".join(blocks[-1:])))
+
+    def test_parallel(self):
+        blocks = self._blocks(256)
+        zdata = self._compress(blocks)
+        zdata[len(zdata) // 3] ^= 0x10
+        expected, expected_ranges = self._salvage(zdata)
+        min_region_size = salvage.MIN_REGION_SIZE
+        salvage.MIN_REGION_SIZE = 1024
+        try:
+            actual, actual_ranges = self._salvage(zdata, workers=4)
+        finally:
+            salvage.MIN_REGION_SIZE = min_region_size
+        self.assertEqual(expected, actual)
+        self.assertEqual(
+            [(r.out_start, r.out_end) for r in expected_ranges],
+            [(r.out_start, r.out_end) for r in actual_ranges],
+        )
+
+    def test_bad_check(self):
+        blocks = self._blocks(256)
+        for wbits in (31, 15):
+            # A flipped bit inside a literal run still decodes, only the
+            # trailer reveals it
+            zdata = self._compress(blocks, wbits, level=0)
+            zdata[zdata.index(b"block 100 line")] ^= 1
+            with self.assertRaises(zlib.error):
+                zlib.decompress(bytes(zdata), wbits)
+            min_region_size = salvage.MIN_REGION_SIZE
+            salvage.MIN_REGION_SIZE = 1024
+            try:
+                for workers in (1, 4):
+                    out, ranges = self._salvage(zdata, workers=workers)
+                    self.assertEqual(len(b"".join(blocks)), len(out))
+                    self.assertEqual(1, len(ranges))
+                    self.assertTrue(ranges[0].damaged)
+                    intact, ranges = self._salvage(
+                        self._compress(blocks, wbits, level=0), workers=workers
+                    )
+                    self.assertEqual(b"".join(blocks), intact)
+                    self.assertFalse(any(r.damaged for r in ranges))
+            finally:
+                salvage.MIN_REGION_SIZE = min_region_size
+
+    def test_cli(self):
+        blocks = self._blocks()
+        zdata = self._compress(blocks)
+        zdata[100] ^= 0x10
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ipath = os.path.join(tmpdir, "in.gz")
+            opath = os.path.join(tmpdir, "out")
+            with open(ipath, "wb") as fp:
+                fp.write(zdata)
+            output = subprocess.check_output(
+                [sys.executable, "-m", "pyzlib.salvage", ipath, "-o", opath],
+                stderr=subprocess.DEVNULL,
+            )
+            with open(opath, "rb") as fp:
+                self.assertTrue(fp.read().endswith(b"".join(blocks[1:])))
+        self.assertIn(b"-> output [", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
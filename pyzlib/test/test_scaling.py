@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+import unittest
+
+from parameterized import parameterized
+
+from pyzlib import corpus, scaling
+
+DATA = corpus.generate("log", 100000, 0)
+
+
+class TestCase(unittest.TestCase):
+    @parameterized.expand([(op,) for op in scaling.OPERATIONS])
+    def test_measure(self, operation):
+        for threads in (1, 3):
+            self.assertGreater(
+                scaling.measure(threads, operation, DATA, iterations=2), 0
+            )
+
+    def test_gil_enabled(self):
+        self.assertIsInstance(scaling.gil_enabled(), bool)
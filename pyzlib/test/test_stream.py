@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+import mmap
+import random
+import tempfile
+import threading
+import unittest
+import zlib
+
+import parameterized
+import pyzlib
+from pyzlib.stream import (
+    WB_GZIP,
+    WB_RAW,
+    WB_ZLIB,
+    Deflater,
+    Inflater,
+    compress,
+    decompress,
+    decompress_into,
+)
+
+
+class TestCase(unittest.TestCase):
+    @staticmethod
+    def _plain(n=300000):
+        r = random.Random(3290557441)
+        return b"".join(
+            r.choice((b"hello\n", b"world\n", r.randbytes(6))) for _ in range(n // 6)
+        )
+
+    @parameterized.parameterized.expand(
+        ((window_bits,) for window_bits in (WB_RAW, WB_ZLIB, WB_GZIP))
+    )
+    def test_round_trip(self, window_bits):
+        plain = self._plain()
+        zdata = compress(plain, window_bits=window_bits)
+        self.assertEqual(plain, zlib.decompress(zdata, window_bits))
+        self.assertEqual(plain, decompress(zdata, window_bits=window_bits))
+
+    def test_chunks(self):
+        plain = self._plain()
+        with Deflater(buffer_size=1000) as deflater:
+            zdata = bytearray()
+            for i in range(0, len(plain), 7777):
+                zdata += deflater.compress(plain[i : i + 7777])
+            zdata += deflater.flush()
+            self.assertTrue(deflater.finished)
+        with Inflater(buffer_size=333) as inflater:
+            result = bytearray()
+            for i in range(0, len(zdata), 555):
+                result += inflater.decompress(zdata[i : i + 555])
+            result += inflater.decompress(b"trailing")
+            self.assertTrue(inflater.eof)
+            self.assertEqual(b"trailing", inflater.unused_data)
+        self.assertEqual(plain, result)
+
+    def test_dictionary(self):
+        dictionary = b"hello world\n" * 100
+        plain = b"hello world\n" * 10
+        with Deflater(dictionary=dictionary) as deflater:
+            zdata = deflater.compress(plain, pyzlib.Z_FINISH)
+        with Inflater(dictionary=dictionary) as inflater:
+            self.assertEqual(plain, inflater.decompress(zdata))
+        self.assertEqual(plain, zlib.decompressobj(zdict=dictionary).decompress(zdata))
+
+    def test_copy_params(self):
+        with Deflater() as deflater:
+            head = deflater.compress(b"prefix " * 100)
+            with deflater.copy() as copy:
+                tail1 = copy.params(pyzlib.Z_BEST_SPEED, pyzlib.Z_RLE)
+                tail1 += copy.compress(b"one", pyzlib.Z_FINISH)
+            tail2 = deflater.compress(b"two", pyzlib.Z_FINISH)
+        self.assertEqual(b"prefix " * 100 + b"one", zlib.decompress(head + tail1))
+        self.assertEqual(b"prefix " * 100 + b"two", zlib.decompress(head + tail2))
+
+    def test_params_keeps_strategy(self):
+        with Deflater(strategy=pyzlib.Z_RLE) as deflater:
+            zdata = deflater.compress(b"abc" * 1000)
+            zdata += deflater.params(pyzlib.Z_BEST_SPEED)
+            self.assertEqual(pyzlib.Z_BEST_SPEED, deflater.level)
+            self.assertEqual(pyzlib.Z_RLE, deflater.strategy)
+            zdata += deflater.params(9, pyzlib.Z_FILTERED)
+            self.assertEqual(pyzlib.Z_FILTERED, deflater.strategy)
+            zdata += deflater.compress(b"def" * 1000, pyzlib.Z_FINISH)
+        self.assertEqual(b"abc" * 1000 + b"def" * 1000, zlib.decompress(zdata))
+
+    def test_data_error(self):
+        with Inflater() as inflater:
+            with self.assertRaises(Exception):
+                inflater.decompress(b"garbage" * 10)
+
+    def test_read_only_buffers(self):
+        plain = self._plain(100000)
+        with tempfile.TemporaryFile() as fp:
+            fp.write(compress(plain))
+            fp.flush()
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                self.assertEqual(plain, decompress(mm))
+            finally:
+                mm.close()
+        self.assertEqual(plain[1:], decompress(compress(memoryview(plain)[1:])))
+        with self.assertRaises(BufferError):
+            compress(memoryview(plain)[::2])
+
+    def test_concurrent_use(self):
+        # A second thread must not use a stream while its owner is inside
+        # compress_to()
+        entered = threading.Event()
+        release = threading.Event()
+        errors = []
+
+        def write(chunk):
+            entered.set()
+            release.wait()
+
+        with Deflater(buffer_size=1024) as deflater:
+            owner = threading.Thread(
+                target=deflater.compress_to,
+                args=(write, self._plain(100000), pyzlib.Z_FINISH),
+            )
+            owner.start()
+            entered.wait()
+            intruder = threading.Thread(
+                target=lambda: errors.append(self._raises(deflater.compress, b"x"))
+            )
+            intruder.start()
+            intruder.join()
+            release.set()
+            owner.join()
+            # The owner may use it again, and so may others once it is done
+            self.assertTrue(deflater.finished)
+            deflater.reset()
+            self.assertEqual(b"x", decompress(deflater.compress(b"x", pyzlib.Z_FINISH)))
+        self.assertEqual(["in use by another thread"], errors)
+
+    def test_concurrent_copies(self):
+        plain = self._plain(100000)
+        with Deflater() as template:
+            head = template.compress(plain[:50000])
+            results = [None] * 4
+
+            def clone(i):
+                with template.copy() as deflater:
+                    results[i] = head + deflater.compress(
+                        plain[50000:], pyzlib.Z_FINISH
+                    )
+
+            threads = [threading.Thread(target=clone, args=(i,)) for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual([plain] * 4, [decompress(r) for r in results])
+
+    @staticmethod
+    def _raises(func, *args):
+        try:
+            func(*args)
+        except Exception as e:
+            return str(e).split("Deflater is ")[-1]
+        return None
+
+    @parameterized.parameterized.expand([(WB_RAW,), (WB_ZLIB,), (WB_GZIP,)])
+    def test_decompress_into(self, window_bits):
+        plain = self._plain(100000)
+        buf = bytearray(len(plain))
+        zdata = compress(plain, window_bits=window_bits)
+        self.assertEqual(5, decompress_into(zdata + b"extra", buf, window_bits))
+        self.assertEqual(plain, buf)
+        with self.assertRaises(Exception):
+            decompress_into(zdata, bytearray(len(plain) + 1), window_bits)
+        with self.assertRaises(Exception):
+            decompress_into(zdata, bytearray(len(plain) - 1), window_bits)
+
+
+if __name__ == "__main__":
+    unittest.main()
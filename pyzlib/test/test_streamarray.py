@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+import unittest
+import zlib
+
+import pyzlib
+from pyzlib.streamarray import StreamArray
+
+
+class TestCase(unittest.TestCase):
+    def test_round_trip(self):
+        n = 64
+        with StreamArray(2 * n) as sa:
+            dhs = [sa.open_deflate(level=1 + h % 9) for h in range(n)]
+            ihs = [sa.open_inflate() for _ in range(n)]
+            self.assertEqual(2 * n, len(sa))
+            plain = [("stream %d\n" % h).encode() * (h + 1) for h in range(n)]
+            for dh, ih, data in zip(dhs, ihs, plain):
+                zdata = sa.deflate(dh, data)
+                zdata += sa.deflate(dh, b"", pyzlib.Z_FINISH)
+                self.assertEqual(data, zlib.decompress(zdata))
+                self.assertEqual(data, sa.inflate(ih, zdata))
+                self.assertEqual(len(data), sa.bytes_in[dh])
+                self.assertEqual(len(zdata), sa.bytes_out[dh])
+                self.assertEqual(len(zdata), sa.bytes_in[ih])
+        self.assertEqual(0, len(sa))
+
+    def test_flush_dirty(self):
+        with StreamArray(8) as sa:
+            hs = [sa.open_deflate() for _ in range(8)]
+            zdata = {h: bytearray() for h in hs}
+            for h in hs[::2]:
+                zdata[h] += sa.deflate(h, b"hello" * (h + 1))
+            self.assertEqual(hs[::2], sa.handles(sa.dirty))
+            flushed = sa.flush_dirty()
+            self.assertEqual(set(hs[::2]), set(flushed))
+            self.assertEqual([], sa.handles(sa.dirty))
+            for h, chunk in flushed.items():
+                zdata[h] += chunk
+                self.assertEqual(
+                    b"hello" * (h + 1), zlib.decompressobj().decompress(zdata[h])
+                )
+
+    def test_reset_idle(self):
+        with StreamArray(4) as sa:
+            hs = [sa.open_deflate() for _ in range(3)] + [sa.open_inflate()]
+            sa.deflate(hs[0], b"busy")
+            # A flushed stream is still in the middle of its output
+            zdata = sa.deflate(hs[1], b"part one ", pyzlib.Z_SYNC_FLUSH)
+            finished = sa.deflate(hs[2], b"finished", pyzlib.Z_FINISH)
+            plain = sa.inflate(hs[3], finished[:5])
+            self.assertEqual([], sa.reset_idle())
+            self.assertEqual([hs[2]], sa.reset_idle())
+            self.assertEqual([], sa.reset_idle())
+            zdata += sa.deflate(hs[1], b"part two", pyzlib.Z_FINISH)
+            self.assertEqual(b"part one part two", zlib.decompress(zdata))
+            plain += sa.inflate(hs[3], finished[5:])
+            self.assertEqual(b"finished", plain)
+            zdata = sa.deflate(hs[2], b"fresh", pyzlib.Z_FINISH)
+            self.assertEqual(b"fresh", zlib.decompress(zdata))
+
+    def test_close_reuses_handle(self):
+        with StreamArray(1) as sa:
+            h = sa.open_inflate()
+            with self.assertRaises(Exception):
+                sa.open_deflate()
+            with self.assertRaises(Exception):
+                sa.deflate(h, b"")
+            sa.close(h)
+            self.assertEqual(h, sa.open_deflate())
+
+    def test_set_level(self):
+        with StreamArray(1) as sa:
+            h = sa.open_deflate(level=6, strategy=pyzlib.Z_RLE)
+            zdata = sa.deflate(h, b"abc" * 1000)
+            # The strategy is kept unless it is specified
+            zdata += sa.set_level(h, 1)
+            self.assertEqual(1, sa.level[h])
+            self.assertEqual(pyzlib.Z_RLE, sa.strategy[h])
+            zdata += sa.deflate(h, b"def" * 1000)
+            zdata += sa.set_level(h, 9, pyzlib.Z_FILTERED)
+            self.assertEqual(9, sa.level[h])
+            self.assertEqual(pyzlib.Z_FILTERED, sa.strategy[h])
+            zdata += sa.deflate(h, b"ghi" * 1000, pyzlib.Z_FINISH)
+            self.assertEqual(
+                b"abc" * 1000 + b"def" * 1000 + b"ghi" * 1000, zlib.decompress(zdata)
+            )
+
+    def test_read_only_buffer(self):
+        with StreamArray(1) as sa:
+            h = sa.open_deflate()
+            data = b"skip this, hello" * 100
+            zdata = sa.deflate(h, memoryview(data)[10:], pyzlib.Z_FINISH)
+            self.assertEqual(data[10:], zlib.decompress(zdata))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+import time
+import unittest
+
+from parameterized import parameterized
+
+import pyzlib
+from pyzlib import corpus, stream, template
+
+PREFIX = corpus.generate("text", 200000, 0)
+
+
+class TestCase(unittest.TestCase):
+    @parameterized.expand(
+        [(wb,) for wb in (stream.WB_RAW, stream.WB_ZLIB, stream.WB_GZIP)]
+    )
+    def test_round_trip(self, window_bits):
+        with template.DeflateTemplate(PREFIX, window_bits=window_bits) as deflate:
+            with template.InflateTemplate(deflate.head, window_bits) as inflate:
+                for i in range(3):
+                    suffix = corpus.generate("log", 1000, i)
+                    zdata = deflate.compress(suffix)
+                    self.assertTrue(zdata.startswith(deflate.head))
+                    self.assertEqual(
+                        PREFIX + suffix, stream.decompress(zdata, window_bits)
+                    )
+                    self.assertEqual(PREFIX + suffix, inflate.decompress(zdata))
+                # Streams that do not start with the template head
+                zdata = stream.compress(b"unrelated", window_bits=window_bits)
+                self.assertEqual(b"unrelated", inflate.decompress(zdata))
+                with self.assertRaises(Exception):
+                    inflate.decompress(deflate.compress(b"")[:-4])
+
+    def test_clone(self):
+        suffix = b"suffix"
+        with template.DeflateTemplate(PREFIX) as deflate:
+            with deflate.clone() as deflater:
+                zdata = deflate.head
+                zdata += deflater.compress(suffix[:3])
+                zdata += deflater.compress(suffix[3:], pyzlib.Z_FINISH)
+        self.assertEqual(PREFIX + suffix, stream.decompress(zdata))
+
+    def test_faster(self):
+        suffix = b"x" * 100
+        with template.DeflateTemplate(PREFIX) as deflate:
+            t0 = time.perf_counter()
+            for _ in range(10):
+                deflate.compress(suffix)
+            t1 = time.perf_counter()
+            for _ in range(10):
+                stream.compress(PREFIX + suffix)
+            t2 = time.perf_counter()
+        self.assertLess((t1 - t0) * 5, t2 - t1)
+
+    def test_cache(self):
+        prefixes = [corpus.generate("text", 1000, i) for i in range(4)]
+        memory = template.DeflateTemplate(prefixes[0]).memory
+        cache = template.TemplateCache(max_bytes=memory * 2)
+        first = cache.deflate(0, prefixes[0])
+        self.assertIs(first, cache.deflate(0, prefixes[0]))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        cache.deflate(1, prefixes[1])
+        # 0 is more recently used than 1, so 1 gets evicted
+        cache.deflate(0, prefixes[0])
+        cache.deflate(2, prefixes[2])
+        self.assertEqual(2, len(cache))
+        self.assertIs(first, cache.deflate(0, prefixes[0]))
+        self.assertLessEqual(cache.memory, cache.max_bytes)
+        zdata = cache.deflate(2, prefixes[2]).compress(b"!")
+        inflate = cache.inflate(2, cache.deflate(2, prefixes[2]).head)
+        self.assertEqual(prefixes[2] + b"!", inflate.decompress(zdata))
+        cache.clear()
+        self.assertEqual((0, 0), (len(cache), cache.memory))
+
+
+if __name__ == "__main__":
+    unittest.main()
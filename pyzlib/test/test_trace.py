@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+import ctypes
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import pyzlib
+from pyzlib import corpus, stream, trace
+
+
+class TestCase(unittest.TestCase):
+    def test_disabled(self):
+        deflate = pyzlib.deflate
+        compress_to = stream.Deflater.compress_to
+        with trace.Tracer():
+            self.assertIsNot(deflate, pyzlib.deflate)
+            self.assertIsNot(compress_to, stream.Deflater.compress_to)
+        self.assertIs(deflate, pyzlib.deflate)
+        self.assertIs(compress_to, stream.Deflater.compress_to)
+
+    def test_spans(self):
+        data = corpus.generate("log", 100000, 0)
+        with trace.Tracer() as tracer:
+            chunks = []
+            with stream.Deflater() as deflater:
+                deflater.compress_to(chunks.append, data)
+                deflater.compress_to(chunks.append, b"", pyzlib.Z_FINISH)
+            compressed = b"".join(chunks)
+            self.assertEqual(data, stream.decompress(compressed))
+        names = [event["name"] for event in tracer.events()]
+        for name in ("deflateInit2", "deflate", "deflateEnd", "inflate", "write"):
+            self.assertIn(name, names)
+        self.assertIn("Deflater.compress_to", names)
+        self.assertIn("Inflater.decompress_to", names)
+        deflates = [event for event in tracer.events() if event["name"] == "deflate"]
+        self.assertEqual(len(data), sum(event["bytes_in"] for event in deflates))
+        self.assertEqual(len(compressed), sum(event["bytes_out"] for event in deflates))
+        self.assertEqual(pyzlib.Z_STREAM_END, deflates[-1]["ret"])
+        for event in tracer.events():
+            self.assertEqual(threading.get_native_id(), event["tid"])
+            self.assertLessEqual(event["start"], event["end"])
+
+    def test_one_shot(self):
+        data = corpus.generate("text", 10000, 0)
+        with trace.Tracer() as tracer:
+            compressed = stream.compress(data)
+            dest = ctypes.create_string_buffer(len(data))
+            src = ctypes.create_string_buffer(compressed, len(compressed))
+            self.assertEqual(
+                (pyzlib.Z_OK, len(data), len(compressed)),
+                pyzlib.uncompress2(dest, len(data), src, len(compressed)),
+            )
+        (event,) = [e for e in tracer.events() if e["name"] == "uncompress2"]
+        self.assertEqual(
+            (len(compressed), len(data), pyzlib.Z_OK),
+            (event["bytes_in"], event["bytes_out"], event["ret"]),
+        )
+
+    def test_ring(self):
+        tracer = trace.Tracer(capacity=4)
+        for i in range(10):
+            tracer.record("span", i, i + 1, i)
+        self.assertEqual([6, 7, 8, 9], [event["start"] for event in tracer.events()])
+        tracer.clear()
+        self.assertEqual([], tracer.events())
+
+    def test_threads(self):
+        data = corpus.generate("mix", 50000, 0)
+
+        def work():
+            stream.compress(data)
+
+        with trace.Tracer() as tracer:
+            threads = [threading.Thread(target=work) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        tids = {e["tid"] for e in tracer.events() if e["name"] == "deflate"}
+        self.assertEqual({thread.native_id for thread in threads}, tids)
+
+    def test_export(self):
+        with trace.Tracer() as tracer:
+            stream.compress(b"hello" * 1000)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "trace.json")
+            tracer.export_chrome(path)
+            with open(path) as fp:
+                events = json.load(fp)["traceEvents"]
+            self.assertEqual(len(tracer.events()), len(events))
+            for event in events:
+                self.assertEqual("X", event["ph"])
+                self.assertEqual(os.getpid(), event["pid"])
+                self.assertIn("ret", event["args"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+import concurrent.futures
+import time
+import unittest
+
+from parameterized import parameterized
+
+import pyzlib
+from pyzlib import corpus, stream, verify
+
+DATA = corpus.generate("log", 1000000, 0)
+
+
+class _Jittery(concurrent.futures.ThreadPoolExecutor):
+    # Starts tasks in order, but delays every other one, so that they finish
+    # out of order
+    def __init__(self):
+        super().__init__(4)
+        self.count = 0
+
+    def submit(self, fn, *args):
+        self.count += 1
+        return super().submit(self._run, 0.001 * (self.count % 2), fn, *args)
+
+    @staticmethod
+    def _run(delay, fn, *args):
+        time.sleep(delay)
+        return fn(*args)
+
+
+class TestCase(unittest.TestCase):
+    @parameterized.expand(
+        [
+            (mode, wb, zwb)
+            for mode in verify.MODES
+            for wb, zwb in (
+                (stream.WB_RAW, stream.WB_RAW),
+                (stream.WB_ZLIB, stream.WB_ZLIB),
+                (stream.WB_GZIP, stream.WB_GZIP),
+                (stream.WB_AUTO, stream.WB_ZLIB),
+                (stream.WB_AUTO, stream.WB_GZIP),
+            )
+        ]
+    )
+    def test_round_trip(self, mode, window_bits, zwindow_bits):
+        zdata = stream.compress(DATA, window_bits=zwindow_bits)
+        self.assertEqual(DATA, verify.decompress(zdata, window_bits, mode))
+        with verify.DeferredInflater(window_bits, buffer_size=4096) as inflater:
+            result = b""
+            for i in range(0, len(zdata), 1000):
+                result += inflater.decompress(zdata[i : i + 1000])
+            inflater.verify()
+            inflater.reset()
+            self.assertEqual(
+                b"", inflater.decompress(stream.compress(b"", 6, zwindow_bits))
+            )
+            inflater.verify()
+        self.assertEqual(DATA, result)
+
+    @parameterized.expand(
+        [(wb, pos) for wb in (stream.WB_ZLIB, stream.WB_GZIP) for pos in (-1, 5000)]
+    )
+    def test_corruption(self, window_bits, pos):
+        # Stored blocks, so that flipped data bytes go undetected by inflate()
+        zdata = bytearray(stream.compress(DATA[:100000], 0, window_bits))
+        if pos == -1 and window_bits == stream.WB_GZIP:
+            # CRC-32 rather than ISIZE
+            pos = -8
+        zdata[pos] ^= 1
+        with self.assertRaises(Exception):
+            verify.decompress(zdata, window_bits, verify.INLINE)
+        with self.assertRaises(Exception):
+            verify.decompress(zdata, window_bits, verify.DEFERRED)
+        result = verify.decompress(zdata, window_bits, verify.NONE)
+        self.assertEqual(len(DATA[:100000]), len(result))
+
+    def test_executor(self):
+        # Updates run in order on an executor with several workers
+        zdata = stream.compress(DATA, 1, stream.WB_GZIP)
+        with _Jittery() as executor:
+            with verify.DeferredInflater(
+                stream.WB_GZIP, buffer_size=4096, executor=executor
+            ) as inflater:
+                self.assertEqual(DATA, inflater.decompress(zdata))
+                inflater.verify()
+
+    def test_truncated(self):
+        zdata = stream.compress(DATA)
+        with verify.DeferredInflater() as inflater:
+            inflater.decompress(zdata[:-1])
+            with self.assertRaises(Exception):
+                inflater.verify()
+
+    def test_validate(self):
+        zdata = bytearray(stream.compress(b"hello"))
+        zdata[-1] ^= 1
+        with self.assertRaises(Exception):
+            stream.decompress(zdata)
+        with stream.Inflater(validate=False) as inflater:
+            self.assertEqual(b"hello", inflater.decompress(zdata))
+            self.assertTrue(inflater.eof)
+            inflater.reset()
+            self.assertEqual(b"hello", inflater.decompress(zdata))
+            inflater.reset()
+            inflater.set_validate(True)
+            with self.assertRaises(Exception):
+                inflater.decompress(zdata)
+
+
+if __name__ == "__main__":
+    unittest.main()
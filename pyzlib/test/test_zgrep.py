@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import gzip
+import io
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import unittest
+import zlib
+
+from parameterized import parameterized
+
+from pyzlib import corpus, zgrep
+
+LOG = corpus.generate("log", 2000000, 0)
+
+
+def _expected(data, pattern, flags=0):
+    regex = re.compile(pattern, flags | re.MULTILINE)
+    result = []
+    offset = 0
+    for line in data.split(b"\n"):
+        if regex.search(line):
+            result.append((offset, line))
+        offset += len(line) + 1
+    if data.endswith(b"\n") and result and result[-1][0] == len(data):
+        result.pop()
+    return result
+
+
+def _scan(data, pattern, **kwargs):
+    return [
+        (offset, bytes(line))
+        for offset, line in zgrep.scan(io.BytesIO(data), pattern, **kwargs)
+    ]
+
+
+class TestCase(unittest.TestCase):
+    @parameterized.expand(
+        [
+            (window_size, read_size)
+            for window_size in (64, 4096, 1 << 20)
+            for read_size in (1, 1000, 1 << 20)
+            if window_size * read_size >= 4096
+        ]
+    )
+    def test_windows(self, window_size, read_size):
+        # Small windows make many lines span window edges
+        data = LOG[:200000]
+        self.assertEqual(
+            _expected(data, b"ERROR"),
+            _scan(
+                gzip.compress(data),
+                b"ERROR",
+                fixed=True,
+                window_size=window_size,
+                read_size=read_size,
+            ),
+        )
+
+    @parameterized.expand(
+        [
+            (b"error", {"fixed": True, "ignore_case": True}, re.IGNORECASE),
+            (rb"^\S+ \S+ WARN", {}, 0),
+            (rb"latency_ms=1\d\d$", {}, 0),
+            (b"a.c", {"fixed": True}, None),
+        ]
+    )
+    def test_patterns(self, pattern, kwargs, flags):
+        expected_pattern = re.escape(pattern) if flags is None else pattern
+        self.assertEqual(
+            _expected(LOG, expected_pattern, flags or 0),
+            _scan(gzip.compress(LOG), pattern, **kwargs),
+        )
+
+    def test_members_and_formats(self):
+        # Concatenated members, a last line without a newline, and zlib
+        data = b"one match\nno\n" + b"two match\nlast match"
+        members = gzip.compress(data[:13]) + gzip.compress(data[13:])
+        expected = [(0, b"one match"), (13, b"two match"), (23, b"last match")]
+        self.assertEqual(expected, _scan(members, b"match", fixed=True))
+        self.assertEqual(expected, _scan(zlib.compress(data), b"match"))
+        self.assertEqual([], _scan(gzip.compress(b""), b"match"))
+
+    def test_member_boundary(self):
+        # Members split lines at arbitrary bytes
+        data = b"alpha line\nthe needle is here\nomega\n"
+        cut = data.index(b"needle") + 3
+        members = gzip.compress(data[:cut]) + gzip.compress(data[cut:])
+        self.assertEqual(data, gzip.decompress(members))
+        expected = [(11, b"the needle is here")]
+        self.assertEqual(expected, _scan(members, b"needle", fixed=True))
+        self.assertEqual(expected, _scan(members, b"ne+dle", read_size=5))
+
+    def test_long_line(self):
+        data = b"x" * 100000 + b"needle" + b"y" * 100000 + b"\nshort needle\n"
+        self.assertEqual(
+            [(0, data[:200006]), (200007, b"short needle")],
+            _scan(gzip.compress(data), b"needle", window_size=1024),
+        )
+
+    def test_truncated(self):
+        with self.assertRaisesRegex(Exception, "truncated"):
+            _scan(gzip.compress(LOG)[:-100], b"ERROR")
+        with self.assertRaises(Exception):
+            _scan(gzip.compress(LOG) + b"garbage", b"ERROR")
+
+    def test_scan_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for i in range(4):
+                path = os.path.join(tmp, "{}.gz".format(i))
+                with open(path, "wb") as fp:
+                    fp.write(gzip.compress(LOG[i * 100000 : (i + 1) * 100000]))
+                paths.append(path)
+            result = list(zgrep.scan_files(paths, b"WARN", fixed=True, workers=2))
+            expected = [
+                (path, offset, line)
+                for i, path in enumerate(paths)
+                for offset, line in _expected(
+                    LOG[i * 100000 : (i + 1) * 100000], b"WARN"
+                )
+            ]
+            self.assertEqual(expected, result)
+            self.assertEqual(
+                len(expected[: len(_expected(LOG[:100000], b"WARN"))]),
+                zgrep.count(paths[0], b"WARN", fixed=True),
+            )
+            out = subprocess.check_output(
+                [sys.executable, "-m", "pyzlib.zgrep", "-c", "WARN", paths[0]],
+                cwd=os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+            )
+            self.assertEqual(b"%d\n" % zgrep.count(paths[0], b"WARN"), out)
+
+
+if __name__ == "__main__":
+    unittest.main()
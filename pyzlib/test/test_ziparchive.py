@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+
+from parameterized import parameterized
+
+import pyzlib
+from pyzlib import corpus, ziparchive
+
+MEMBERS = {
+    "log.txt": corpus.generate("log", 300000, 0),
+    "dir/random.bin": corpus.generate("random", 100000, 1),
+    "dir/empty": b"",
+    "dir/sub/numeric.bin": corpus.generate("numeric", 200000, 2),
+    "ünicode.txt": b"hello\n" * 1000,
+}
+
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "test.zip")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, zip64=False, **kwargs):
+        with ziparchive.ZipWriter(self.path, zip64=zip64, **kwargs) as writer:
+            for name, data in MEMBERS.items():
+                writer.add(name, data)
+
+    @parameterized.expand([(False,), (True,)])
+    def test_stdlib_reads(self, zip64):
+        self._write(zip64=zip64, workers=2)
+        with zipfile.ZipFile(self.path) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(list(MEMBERS), zf.namelist())
+            for name, data in MEMBERS.items():
+                self.assertEqual(data, zf.read(name))
+            # Incompressible data is stored
+            self.assertEqual(
+                zipfile.ZIP_STORED, zf.getinfo("dir/random.bin").compress_type
+            )
+            self.assertEqual(zipfile.ZIP_DEFLATED, zf.getinfo("log.txt").compress_type)
+
+    @parameterized.expand([(False,), (True,)])
+    def test_round_trip(self, zip64):
+        self._write(zip64=zip64)
+        with ziparchive.ZipReader(self.path) as reader:
+            self.assertEqual(len(MEMBERS), len(reader))
+            self.assertEqual(list(MEMBERS), reader.namelist())
+            for name, data in MEMBERS.items():
+                self.assertIn(name, reader)
+                self.assertEqual(data, reader.read(name))
+            self.assertEqual(list(MEMBERS.values()), reader.read_many(list(MEMBERS)))
+
+    @parameterized.expand([(zipfile.ZIP_STORED,), (zipfile.ZIP_DEFLATED,)])
+    def test_read_stdlib(self, compression):
+        with zipfile.ZipFile(self.path, "w", compression) as zf:
+            for name, data in MEMBERS.items():
+                zf.writestr(name, data)
+            zf.writestr("comment-free", b"x")
+            zf.comment = b"archive comment"
+        with ziparchive.ZipReader(self.path) as reader:
+            for name, data in MEMBERS.items():
+                self.assertEqual(data, reader.read(name))
+
+    def test_readinto(self):
+        self._write()
+        with ziparchive.ZipReader(self.path) as reader:
+            info = reader.getinfo("log.txt")
+            self.assertEqual(len(MEMBERS["log.txt"]), info.file_size)
+            self.assertLess(info.compress_size, info.file_size)
+            buf = bytearray(info.file_size)
+            self.assertEqual(info.file_size, reader.readinto("log.txt", buf))
+            self.assertEqual(MEMBERS["log.txt"], buf)
+            with self.assertRaises(ValueError):
+                reader.readinto("log.txt", bytearray(info.file_size - 1))
+
+    def test_extractall(self):
+        self._write(workers=3)
+        with ziparchive.ZipWriter(self.path + "2") as writer:
+            writer.mkdir("dir")
+            for name, data in MEMBERS.items():
+                writer.add(name, data, mode=0o600)
+        out = os.path.join(self.tmp.name, "out")
+        with ziparchive.ZipReader(self.path + "2") as reader:
+            reader.extractall(out)
+        for name, data in MEMBERS.items():
+            path = os.path.join(out, *name.split("/"))
+            with open(path, "rb") as fp:
+                self.assertEqual(data, fp.read())
+            self.assertEqual(0o600, os.stat(path).st_mode & 0o777)
+
+    def test_many_members(self):
+        # More than 65535 members need the ZIP64 end of central directory
+        count = 70000
+        with ziparchive.ZipWriter(self.path, level=0) as writer:
+            for i in range(count):
+                writer.add("{}".format(i), b"%d" % i)
+        with ziparchive.ZipReader(self.path) as reader:
+            self.assertEqual(count, len(reader))
+            self.assertEqual(b"69999", reader.read("69999"))
+        with zipfile.ZipFile(self.path) as zf:
+            self.assertEqual(count, len(zf.infolist()))
+
+    def test_corrupt(self):
+        self._write()
+        with ziparchive.ZipReader(self.path) as reader:
+            info = reader.getinfo("dir/random.bin")
+        with open(self.path, "r+b") as fp:
+            fp.seek(info.header_offset + 30 + len("dir/random.bin") + 1000)
+            fp.write(b"\x00" * 8)
+        with ziparchive.ZipReader(self.path) as reader:
+            with self.assertRaisesRegex(Exception, "crc mismatch"):
+                reader.read("dir/random.bin")
+            self.assertEqual(MEMBERS["log.txt"], reader.read("log.txt"))
+
+    def test_not_a_zip(self):
+        with open(self.path, "wb") as fp:
+            fp.write(b"not a zip file" * 100)
+        with self.assertRaisesRegex(Exception, "not a zip file"):
+            ziparchive.ZipReader(self.path)
+
+    def test_file_object(self):
+        fp = io.BytesIO()
+        with ziparchive.ZipWriter(fp) as writer:
+            writer.add("a", b"a" * 10000)
+            with self.assertRaises(ValueError):
+                writer.add("a", b"b")
+        with zipfile.ZipFile(io.BytesIO(fp.getvalue())) as zf:
+            self.assertEqual(b"a" * 10000, zf.read("a"))
+            crc = pyzlib.crc32(0, b"a" * 10000, 10000)
+            self.assertEqual(crc, zf.getinfo("a").CRC)
+
+    def test_unsafe_names(self):
+        with ziparchive.ZipWriter(self.path) as writer:
+            writer.add("../evil", b"x")
+        with ziparchive.ZipReader(self.path) as reader:
+            with self.assertRaisesRegex(Exception, "refusing"):
+                reader.extractall(os.path.join(self.tmp.name, "out"))
+
+
+if __name__ == "__main__":
+    unittest.main()
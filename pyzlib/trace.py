@@ -0,0 +1,273 @@
+import array
+import contextlib
+import json
+import os
+import threading
+import time
+
+import pyzlib
+from pyzlib import _buffer, stream
+
+DEFAULT_CAPACITY = 65536
+
+# Functions that take a z_stream first; their spans record how much input
+# was consumed and how much output was produced
+STREAM_FUNCTIONS = (
+    "deflateInit",
+    "deflateInit2",
+    "deflate",
+    "deflateEnd",
+    "deflateParams",
+    "deflateReset",
+    "deflateSetDictionary",
+    "inflateInit",
+    "inflateInit2",
+    "inflate",
+    "inflateEnd",
+    "inflateReset",
+    "inflateReset2",
+    "inflateSetDictionary",
+    "inflateSync",
+)
+# Functions that take (dest, destLen, source, sourceLen, ...) and return
+# (err, destLen, ...)
+ONE_SHOT_FUNCTIONS = ("compress", "compress2", "uncompress", "uncompress2")
+_TRACED_FUNCTIONS = frozenset(STREAM_FUNCTIONS + ONE_SHOT_FUNCTIONS)
+# Foreign functions that back the traced wrappers
+_FOREIGN_NAMES = {
+    "deflateInit": "deflateInit_",
+    "deflateInit2": "deflateInit2_",
+    "inflateInit": "inflateInit_",
+    "inflateInit2": "inflateInit2_",
+}
+
+
+class _Ring(object):
+    # Spans of a single thread. Only the owning thread writes to it, so no
+    # locking is needed; when it is full, the oldest spans are overwritten.
+    __slots__ = (
+        "tid",
+        "capacity",
+        "count",
+        "name",
+        "start",
+        "end",
+        "bytes_in",
+        "bytes_out",
+        "ret",
+    )
+
+    def __init__(self, capacity):
+        self.tid = threading.get_native_id()
+        self.capacity = capacity
+        self.count = 0
+        self.name = array.array("H", bytes(2 * capacity))
+        self.start = array.array("q", bytes(8 * capacity))
+        self.end = array.array("q", bytes(8 * capacity))
+        self.bytes_in = array.array("q", bytes(8 * capacity))
+        self.bytes_out = array.array("q", bytes(8 * capacity))
+        self.ret = array.array("i", bytes(4 * capacity))
+
+    def record(self, name, start, end, bytes_in, bytes_out, ret):
+        i = self.count % self.capacity
+        self.name[i] = name
+        self.start[i] = start
+        self.end[i] = end
+        self.bytes_in[i] = bytes_in
+        self.bytes_out[i] = bytes_out
+        self.ret[i] = ret
+        self.count += 1
+
+    def indices(self):
+        first = max(0, self.count - self.capacity)
+        return [i % self.capacity for i in range(first, self.count)]
+
+
+class Tracer(object):
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.names = []
+        self._name_ids = {}
+        self._local = threading.local()
+        self._rings = []
+        self._lock = threading.Lock()
+        self._saved = None
+        self.clock = time.perf_counter_ns
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disable()
+
+    def _name_id(self, name):
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            with self._lock:
+                name_id = self._name_ids.setdefault(name, len(self.names))
+                if name_id == len(self.names):
+                    self.names.append(name)
+        return name_id
+
+    def _ring(self):
+        try:
+            return self._local.ring
+        except AttributeError:
+            ring = _Ring(self.capacity)
+            self._local.ring = ring
+            with self._lock:
+                self._rings.append(ring)
+            return ring
+
+    def record(self, name, start, end, bytes_in=0, bytes_out=0, ret=0):
+        self._ring().record(self._name_id(name), start, end, bytes_in, bytes_out, ret)
+
+    @contextlib.contextmanager
+    def span(self, name, bytes_in=0, bytes_out=0):
+        # For I/O and other work around compression
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.record(name, start, self.clock(), bytes_in, bytes_out)
+
+    def _wrap_stream_function(self, name, func):
+        name_id = self._name_id(name)
+        clock = self.clock
+        ring = self._ring
+
+        def wrapper(strm, *args, **kwargs):
+            avail_in = strm.avail_in
+            avail_out = strm.avail_out
+            start = clock()
+            ret = func(strm, *args, **kwargs)
+            end = clock()
+            ring().record(
+                name_id,
+                start,
+                end,
+                avail_in - strm.avail_in,
+                avail_out - strm.avail_out,
+                ret,
+            )
+            return ret
+
+        return wrapper
+
+    def _wrap_one_shot_function(self, name, func):
+        name_id = self._name_id(name)
+        clock = self.clock
+        ring = self._ring
+
+        def wrapper(dest, destLen, source, sourceLen, *args):
+            start = clock()
+            ret = func(dest, destLen, source, sourceLen, *args)
+            end = clock()
+            # uncompress2() also returns how much input it consumed
+            bytes_in = ret[2] if len(ret) > 2 else sourceLen
+            ring().record(name_id, start, end, bytes_in, ret[1], ret[0])
+            return ret
+
+        return wrapper
+
+    def _wrap_method(self, name, method):
+        tracer = self
+
+        def wrapper(obj, write, data, *args, **kwargs):
+            def traced_write(chunk):
+                with tracer.span("write", bytes_out=len(chunk)):
+                    write(chunk)
+
+            with tracer.span(name, bytes_in=_buffer.nbytes(data)):
+                return method(obj, traced_write, data, *args, **kwargs)
+
+        return wrapper
+
+    def enable(self):
+        if self._saved is not None:
+            return
+        saved = {}
+        for name in STREAM_FUNCTIONS:
+            saved[(pyzlib, name)] = getattr(pyzlib, name)
+            setattr(
+                pyzlib, name, self._wrap_stream_function(name, saved[(pyzlib, name)])
+            )
+        for name in ONE_SHOT_FUNCTIONS:
+            saved[(pyzlib, name)] = getattr(pyzlib, name)
+            setattr(
+                pyzlib, name, self._wrap_one_shot_function(name, saved[(pyzlib, name)])
+            )
+        for cls, name in (
+            (stream.Deflater, "compress_to"),
+            (stream.Inflater, "decompress_to"),
+        ):
+            saved[(cls, name)] = getattr(cls, name)
+            setattr(
+                cls,
+                name,
+                self._wrap_method(cls.__name__ + "." + name, saved[(cls, name)]),
+            )
+        self._saved = saved
+
+    def disable(self):
+        if self._saved is None:
+            return
+        for (obj, name), value in self._saved.items():
+            setattr(obj, name, value)
+        self._saved = None
+
+    def clear(self):
+        with self._lock:
+            for ring in self._rings:
+                ring.count = 0
+
+    def events(self):
+        # Returns the recorded spans as dicts sorted by start time
+        with self._lock:
+            rings = list(self._rings)
+        events = []
+        for ring in rings:
+            for i in ring.indices():
+                events.append(
+                    {
+                        "name": self.names[ring.name[i]],
+                        "tid": ring.tid,
+                        "start": ring.start[i],
+                        "end": ring.end[i],
+                        "bytes_in": ring.bytes_in[i],
+                        "bytes_out": ring.bytes_out[i],
+                        "ret": ring.ret[i],
+                    }
+                )
+        events.sort(key=lambda event: event["start"])
+        return events
+
+    def chrome_trace(self):
+        # Complete ("X") events with microsecond timestamps, as understood by
+        # chrome://tracing and Perfetto
+        pid = os.getpid()
+        return {
+            "traceEvents": [
+                {
+                    "name": event["name"],
+                    "cat": "zlib" if event["name"] in _TRACED_FUNCTIONS else "io",
+                    "ph": "X",
+                    "ts": event["start"] / 1000.0,
+                    "dur": (event["end"] - event["start"]) / 1000.0,
+                    "pid": pid,
+                    "tid": event["tid"],
+                    "args": {
+                        "bytes_in": event["bytes_in"],
+                        "bytes_out": event["bytes_out"],
+                        "ret": event["ret"],
+                    },
+                }
+                for event in self.events()
+            ],
+            "displayTimeUnit": "ns",
+        }
+
+    def export_chrome(self, path):
+        with open(path, "w") as fp:
+            json.dump(self.chrome_trace(), fp)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+import time
+
+import pyzlib
+from pyzlib import corpus, framing, stream
+
+# How the check value at the end of a zlib or gzip stream is verified:
+# - INLINE: by inflate() itself, as usual.
+# - DEFERRED: inflate() skips it, and a background thread computes it over
+#   the output while inflate() carries on; verify() waits for the result.
+# - NONE: not at all, for trusted sources.
+INLINE = "inline"
+DEFERRED = "deferred"
+NONE = "none"
+MODES = (INLINE, DEFERRED, NONE)
+
+
+class DeferredInflater(stream.Inflater):
+    def __init__(
+        self,
+        window_bits=stream.WB_ZLIB,
+        dictionary=None,
+        buffer_size=stream.DEFAULT_BUFFER_SIZE,
+        verify=DEFERRED,
+        executor=None,
+    ):
+        if verify not in MODES:
+            raise ValueError("unknown verification mode {}".format(verify))
+        super().__init__(
+            window_bits=window_bits,
+            dictionary=dictionary,
+            buffer_size=buffer_size,
+            validate=verify == INLINE,
+        )
+        self.verify_mode = verify
+        self.executor = executor
+        if verify == DEFERRED and executor is None:
+            self.executor = framing.checksum_executor()
+        self._start_check()
+
+    def _start_check(self):
+        # The first two bytes tell gzip from zlib with WB_AUTO, and the last
+        # eight bytes consumed contain the trailer
+        self.head = b""
+        self.tail = b""
+        self.gzip = None
+        self.check = None
+        self.isize = 0
+        self.future = None
+
+    @stream.exclusive
+    def reset(self, window_bits=None):
+        super().reset(window_bits)
+        self._start_check()
+
+    def _update(self, chunk):
+        # Runs on the executor
+        if self.gzip:
+            self.check = pyzlib.crc32(self.check, chunk, len(chunk))
+            self.isize += len(chunk)
+        else:
+            self.check = pyzlib.adler32(self.check, chunk, len(chunk))
+
+    def _init_check(self):
+        if self.window_bits > 31:
+            self.gzip = self.head[:2] == b"\x1f\x8b"
+        else:
+            self.gzip = self.window_bits > 15
+        self.check = pyzlib.crc32(0, None, 0)
+        if not self.gzip:
+            self.check = pyzlib.adler32(0, None, 0)
+
+    def _deferred_write(self, write):
+        if self.window_bits < 0:
+            # Raw streams have no check value
+            return write
+        if self.gzip is None:
+            self._init_check()
+        submit = self.executor.submit
+        update = self._update
+
+        def deferred_write(chunk):
+            self.future = submit(framing._after, self.future, update, chunk)
+            write(chunk)
+
+        return deferred_write
+
+    @stream.exclusive
+    def decompress_to(self, write, data):
+        if self.eof or self.verify_mode != DEFERRED:
+            return super().decompress_to(write, data)
+        view = memoryview(data).cast("B")
+        if len(self.head) < 2:
+            self.head += bytes(view[: 2 - len(self.head)])
+        left = super().decompress_to(self._deferred_write(write), view)
+        consumed = len(view) - left
+        self.tail = (self.tail + bytes(view[max(0, consumed - 8) : consumed]))[-8:]
+        return left
+
+    def verify(self):
+        # Raises if the output does not match the check value of the stream
+        if self.verify_mode != DEFERRED or self.window_bits < 0:
+            return
+        if not self.eof:
+            raise Exception("incomplete or truncated stream")
+        if self.future is not None:
+            self.future.result()
+        if self.gzip is None:
+            self._init_check()
+        if self.gzip:
+            crc, isize = framing.GZIP_TRAILER.unpack(self.tail)
+            ok = crc == self.check and isize == self.isize & 0xFFFFFFFF
+        else:
+            ok = framing.ZLIB_TRAILER.unpack(self.tail[-4:])[0] == self.check
+        if not ok:
+            raise Exception("incorrect data check")
+
+
+def decompress(data, window_bits=stream.WB_ZLIB, verify=DEFERRED):
+    with DeferredInflater(window_bits=window_bits, verify=verify) as inflater:
+        result = inflater.decompress(data)
+        if not inflater.eof:
+            raise Exception("incomplete or truncated stream")
+        inflater.verify()
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare decompression throughput of verification modes"
+    )
+    parser.add_argument("-k", "--kind", choices=sorted(corpus.KINDS), default="log")
+    parser.add_argument("-s", "--size", type=int, default=64 * 1024 * 1024)
+    parser.add_argument("-f", "--format", choices=("zlib", "gzip"), default="gzip")
+    args = parser.parse_args()
+    window_bits = stream.WB_GZIP if args.format == "gzip" else stream.WB_ZLIB
+    data = corpus.generate(args.kind, args.size)
+    zdata = stream.compress(data, window_bits=window_bits)
+    for mode in MODES:
+        t0 = time.perf_counter()
+        result = decompress(zdata, window_bits, mode)
+        elapsed = time.perf_counter() - t0
+        if result != data:
+            raise Exception("{} produced wrong output".format(mode))
+        print("{:<9}{:8.1f} MB/s".format(mode, len(data) / elapsed / 1e6))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+import argparse
+import concurrent.futures
+import os
+import re
+import sys
+import time
+
+import pyzlib
+from pyzlib import _buffer, stream
+
+DEFAULT_WINDOW_SIZE = 4 * 1024 * 1024
+DEFAULT_READ_SIZE = 1024 * 1024
+
+
+class _Matcher(object):
+    # Finds the next line that contains pattern in buf[start:end], which
+    # consists of whole lines
+    def __init__(self, pattern, fixed=False, ignore_case=False):
+        if isinstance(pattern, str):
+            pattern = pattern.encode()
+        if fixed and not ignore_case:
+            self.find = lambda buf, start, end: buf.find(pattern, start, end)
+        else:
+            if fixed:
+                pattern = re.escape(pattern)
+            flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+            search = re.compile(pattern, flags).search
+
+            def find(buf, start, end):
+                m = search(buf, start, end)
+                return -1 if m is None else m.start()
+
+            self.find = find
+
+    def lines(self, buf, start, end):
+        # Yields (start, end) of matching lines, without the newline
+        find = self.find
+        while start < end:
+            pos = find(buf, start, end)
+            if pos == -1:
+                return
+            line_start = buf.rfind(b"\n", start, pos) + 1 or start
+            line_end = buf.find(b"\n", pos, end)
+            if line_end == -1:
+                line_end = end
+            yield line_start, line_end
+            start = line_end + 1
+
+
+def _open(file):
+    if isinstance(file, (str, bytes, os.PathLike)):
+        return open(file, "rb"), True
+    return file, False
+
+
+def scan(
+    file,
+    pattern,
+    fixed=False,
+    ignore_case=False,
+    window_bits=stream.WB_AUTO,
+    window_size=DEFAULT_WINDOW_SIZE,
+    read_size=DEFAULT_READ_SIZE,
+):
+    # Yields (offset, line) for every line of the decompressed file that
+    # contains pattern. offset is the position of the line in the
+    # decompressed data, and line is a memoryview of the window without the
+    # newline, valid only until the next iteration. Concatenated gzip
+    # members are scanned as one file.
+    matcher = (
+        pattern
+        if isinstance(pattern, _Matcher)
+        else _Matcher(pattern, fixed, ignore_case)
+    )
+    fp, own = _open(file)
+    strm = pyzlib.z_stream(
+        next_in=pyzlib.Z_NULL,
+        avail_in=0,
+        zalloc=pyzlib.Z_NULL,
+        free=pyzlib.Z_NULL,
+        opaque=pyzlib.Z_NULL,
+    )
+    err = pyzlib.inflateInit2(strm, window_bits)
+    if err != pyzlib.Z_OK:
+        if own:
+            fp.close()
+        raise Exception("inflateInit2() failed with error {}".format(err))
+    try:
+        ibuf = bytearray(read_size)
+        addr_ibuf = _buffer.addressof(ibuf)
+        window = bytearray(window_size)
+        # window[:filled] is output that has not been searched yet; it
+        # starts at offset in the decompressed data
+        filled = 0
+        offset = 0
+        pos_in = avail_in = 0
+        in_stream = False
+        while True:
+            if avail_in == 0:
+                pos_in, avail_in = 0, fp.readinto(ibuf)
+                if avail_in == 0:
+                    if in_stream:
+                        raise Exception("incomplete or truncated stream")
+                    break
+            if filled == len(window):
+                # A line longer than the window. Lines yielded earlier may
+                # still refer to the old window, so it is not resized.
+                window = window + bytes(len(window))
+            strm.next_in = addr_ibuf + pos_in
+            strm.avail_in = avail_in
+            strm.next_out = _buffer.addressof(window, filled)
+            strm.avail_out = len(window) - filled
+            err = pyzlib.inflate(strm, pyzlib.Z_NO_FLUSH)
+            in_stream = True
+            if err == pyzlib.Z_STREAM_END:
+                # The next gzip member, if any, starts a new stream
+                pyzlib.inflateReset(strm)
+                in_stream = False
+            elif err not in (pyzlib.Z_OK, pyzlib.Z_BUF_ERROR):
+                raise Exception("inflate() failed with error {}".format(err))
+            pos_in += avail_in - strm.avail_in
+            avail_in = strm.avail_in
+            filled = len(window) - strm.avail_out
+            # Members may end in the middle of a line, so only the end of
+            # the file ends the last line
+            end = window.rfind(b"\n", 0, filled) + 1
+            if end == 0:
+                continue
+            view = memoryview(window)
+            for start, stop in matcher.lines(window, 0, end):
+                yield offset + start, view[start:stop]
+            # Keep the incomplete last line
+            window[: filled - end] = window[end:filled]
+            offset += end
+            filled -= end
+        view = memoryview(window)
+        for start, stop in matcher.lines(window, 0, filled):
+            yield offset + start, view[start:stop]
+    finally:
+        strm.next_in = None
+        strm.next_out = None
+        pyzlib.inflateEnd(strm)
+        if own:
+            fp.close()
+
+
+def _collect(path, matcher, **kwargs):
+    # Runs on the pool; lines are copied, since the window is reused
+    return [(offset, bytes(line)) for offset, line in scan(path, matcher, **kwargs)]
+
+
+def scan_files(paths, pattern, fixed=False, ignore_case=False, workers=None, **kwargs):
+    # Yields (path, offset, line) for the matching lines of many files, which
+    # are scanned concurrently. Files are reported in the order of paths.
+    matcher = _Matcher(pattern, fixed, ignore_case)
+    with concurrent.futures.ThreadPoolExecutor(
+        workers or os.cpu_count() or 1
+    ) as executor:
+        futures = [executor.submit(_collect, path, matcher, **kwargs) for path in paths]
+        for path, future in zip(paths, futures):
+            for offset, line in future.result():
+                yield path, offset, line
+
+
+def count(file, pattern, fixed=False, ignore_case=False, **kwargs):
+    n = 0
+    for _ in scan(file, pattern, fixed, ignore_case, **kwargs):
+        n += 1
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Search compressed files for lines matching a pattern"
+    )
+    parser.add_argument("pattern")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("-F", "--fixed-strings", action="store_true")
+    parser.add_argument("-i", "--ignore-case", action="store_true")
+    parser.add_argument("-c", "--count", action="store_true")
+    parser.add_argument(
+        "-b", "--byte-offset", action="store_true", help="print decompressed offsets"
+    )
+    parser.add_argument("-j", "--jobs", type=int)
+    parser.add_argument("--stats", action="store_true")
+    args = parser.parse_args()
+    out = sys.stdout.buffer
+    counts = dict.fromkeys(args.files, 0)
+    t0 = time.perf_counter()
+    for path, offset, line in scan_files(
+        args.files, args.pattern, args.fixed_strings, args.ignore_case, args.jobs
+    ):
+        counts[path] += 1
+        if args.count:
+            continue
+        if len(args.files) > 1:
+            out.write(os.fsencode(path) + b":")
+        if args.byte_offset:
+            out.write(b"%d:" % offset)
+        out.write(line + b"\n")
+    if args.count:
+        for path in args.files:
+            if len(args.files) > 1:
+                out.write(os.fsencode(path) + b":")
+            out.write(b"%d\n" % counts[path])
+    out.flush()
+    if args.stats:
+        size = sum(os.path.getsize(path) for path in args.files)
+        elapsed = time.perf_counter() - t0
+        print("{:.1f} MB/s compressed".format(size / elapsed / 1e6), file=sys.stderr)
+    return 0 if any(counts.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,569 @@
+#!/usr/bin/env python3
+import argparse
+import collections
+import concurrent.futures
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+import pyzlib
+from pyzlib import _buffer, stream
+
+STORED = 0
+DEFLATED = 8
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+LOCAL_HEADER_SIGNATURE = 0x04034B50
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+CENTRAL_HEADER_SIGNATURE = 0x02014B50
+END_RECORD = struct.Struct("<IHHHHIIH")
+END_RECORD_SIGNATURE = 0x06054B50
+ZIP64_END_RECORD = struct.Struct("<IQHHIIQQQQ")
+ZIP64_END_RECORD_SIGNATURE = 0x06064B50
+ZIP64_LOCATOR = struct.Struct("<IIQI")
+ZIP64_LOCATOR_SIGNATURE = 0x07064B50
+EXTRA_HEADER = struct.Struct("<HH")
+ZIP64_EXTRA_ID = 0x0001
+# The end record is followed by a comment of up to 64K
+_MAX_END_SEARCH = END_RECORD.size + 0xFFFF
+
+FLAG_UTF8 = 0x800
+VERSION_DEFAULT = 20
+VERSION_ZIP64 = 45
+# Unix, so that the external attributes carry the file mode
+_CREATOR_UNIX = 3 << 8
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP64_COUNT_LIMIT = 0xFFFF
+_MAX_AVAIL = 1 << 30
+
+ZipInfo = collections.namedtuple(
+    "ZipInfo",
+    (
+        "name",
+        "method",
+        "flags",
+        "date_time",
+        "crc",
+        "compress_size",
+        "file_size",
+        "header_offset",
+        "external_attr",
+    ),
+)
+
+
+def _crc32(addr, size):
+    # crc32() takes an unsigned int length
+    crc = pyzlib.crc32(0, None, 0)
+    while size > 0:
+        n = min(size, _MAX_AVAIL)
+        crc = pyzlib.crc32(crc, addr, n)
+        addr += n
+        size -= n
+    return crc
+
+
+def _dos_date_time(timestamp):
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def _date_time(dos_time, dos_date):
+    return (
+        (dos_date >> 9) + 1980,
+        (dos_date >> 5) & 0xF,
+        dos_date & 0x1F,
+        dos_time >> 11,
+        (dos_time >> 5) & 0x3F,
+        (dos_time & 0x1F) * 2,
+    )
+
+
+def _compress(data, level):
+    # Runs on the pool; zlib releases the GIL, so members compress in
+    # parallel
+    size = _buffer.nbytes(data)
+    crc = _crc32(_buffer.addressof(data), size)
+    if level == 0 or size == 0:
+        return STORED, crc, size, data
+    compressed = stream.compress(data, level, stream.WB_RAW)
+    if len(compressed) >= size:
+        return STORED, crc, size, data
+    return DEFLATED, crc, size, compressed
+
+
+class ZipWriter(object):
+    # Members are compressed on a thread pool and written in the order in
+    # which they were added. At most max_pending compressed members are
+    # held in memory.
+    def __init__(
+        self,
+        file,
+        level=pyzlib.Z_DEFAULT_COMPRESSION,
+        workers=None,
+        max_pending=None,
+        zip64=False,
+    ):
+        if isinstance(file, (str, bytes, os.PathLike)):
+            self.fp = open(file, "wb")
+            self.own_fp = True
+        else:
+            self.fp = file
+            self.own_fp = False
+        self.level = level
+        self.zip64 = zip64
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            workers, thread_name_prefix="pyzlib-zip"
+        )
+        self.max_pending = max_pending or 2 * workers
+        self.pending = collections.deque()
+        self.entries = []
+        self.names = set()
+        self.offset = self.fp.tell()
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add(self, name, data, date_time=None, mode=0o644):
+        # data must not change until the member is written, so mutable
+        # buffers are copied
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        self._add(name, data, date_time, mode, self.level)
+
+    def add_file(self, path, name=None):
+        st = os.stat(path)
+        if name is None:
+            name = os.path.relpath(path).replace(os.sep, "/")
+        with open(path, "rb") as fp:
+            data = fp.read()
+        self._add(name, data, st.st_mtime, st.st_mode & 0o7777, self.level)
+
+    def mkdir(self, name, date_time=None, mode=0o755):
+        if not name.endswith("/"):
+            name += "/"
+        self._add(name, b"", date_time, mode | 0o40000, 0)
+
+    def _add(self, name, data, date_time, mode, level):
+        with self.lock:
+            if name in self.names:
+                raise ValueError("duplicate member {}".format(name))
+            self.names.add(name)
+            if date_time is None:
+                date_time = time.time()
+            future = self.executor.submit(_compress, data, level)
+            self.pending.append((name, date_time, mode, future))
+            while len(self.pending) > self.max_pending:
+                self._write_member(*self.pending.popleft())
+
+    def _write_member(self, name, date_time, mode, future):
+        method, crc, size, payload = future.result()
+        compress_size = _buffer.nbytes(payload)
+        encoded = name.encode()
+        dos_time, dos_date = _dos_date_time(date_time)
+        zip64 = self.zip64 or max(size, compress_size) >= _ZIP64_LIMIT
+        extra = b""
+        if zip64:
+            extra = EXTRA_HEADER.pack(ZIP64_EXTRA_ID, 16) + struct.pack(
+                "<QQ", size, compress_size
+            )
+        self.fp.write(
+            LOCAL_HEADER.pack(
+                LOCAL_HEADER_SIGNATURE,
+                VERSION_ZIP64 if zip64 else VERSION_DEFAULT,
+                FLAG_UTF8,
+                method,
+                dos_time,
+                dos_date,
+                crc,
+                _ZIP64_LIMIT if zip64 else compress_size,
+                _ZIP64_LIMIT if zip64 else size,
+                len(encoded),
+                len(extra),
+            )
+        )
+        self.fp.write(encoded)
+        self.fp.write(extra)
+        self.fp.write(payload)
+        self.entries.append(
+            (
+                encoded,
+                method,
+                dos_time,
+                dos_date,
+                crc,
+                compress_size,
+                size,
+                self.offset,
+                mode,
+            )
+        )
+        self.offset += LOCAL_HEADER.size + len(encoded) + len(extra) + compress_size
+
+    def _write_central_directory(self):
+        start = self.offset
+        for (
+            encoded,
+            method,
+            dos_time,
+            dos_date,
+            crc,
+            compress_size,
+            size,
+            offset,
+            mode,
+        ) in self.entries:
+            # The ZIP64 extra holds only the fields that do not fit
+            values = []
+            if self.zip64 or size >= _ZIP64_LIMIT:
+                values.append(size)
+                size = _ZIP64_LIMIT
+            if self.zip64 or compress_size >= _ZIP64_LIMIT:
+                values.append(compress_size)
+                compress_size = _ZIP64_LIMIT
+            if self.zip64 or offset >= _ZIP64_LIMIT:
+                values.append(offset)
+                offset = _ZIP64_LIMIT
+            extra = b""
+            if values:
+                extra = EXTRA_HEADER.pack(
+                    ZIP64_EXTRA_ID, 8 * len(values)
+                ) + struct.pack("<{}Q".format(len(values)), *values)
+            version = VERSION_ZIP64 if values else VERSION_DEFAULT
+            self.fp.write(
+                CENTRAL_HEADER.pack(
+                    CENTRAL_HEADER_SIGNATURE,
+                    _CREATOR_UNIX | version,
+                    version,
+                    FLAG_UTF8,
+                    method,
+                    dos_time,
+                    dos_date,
+                    crc,
+                    compress_size,
+                    size,
+                    len(encoded),
+                    len(extra),
+                    0,
+                    0,
+                    0,
+                    (mode << 16) | (0x10 if encoded.endswith(b"/") else 0),
+                    offset,
+                )
+            )
+            self.fp.write(encoded)
+            self.fp.write(extra)
+            self.offset += CENTRAL_HEADER.size + len(encoded) + len(extra)
+        size = self.offset - start
+        count = len(self.entries)
+        if (
+            self.zip64
+            or count >= _ZIP64_COUNT_LIMIT
+            or size >= _ZIP64_LIMIT
+            or start >= _ZIP64_LIMIT
+        ):
+            self.fp.write(
+                ZIP64_END_RECORD.pack(
+                    ZIP64_END_RECORD_SIGNATURE,
+                    ZIP64_END_RECORD.size - 12,
+                    _CREATOR_UNIX | VERSION_ZIP64,
+                    VERSION_ZIP64,
+                    0,
+                    0,
+                    count,
+                    count,
+                    size,
+                    start,
+                )
+            )
+            self.fp.write(
+                ZIP64_LOCATOR.pack(ZIP64_LOCATOR_SIGNATURE, 0, self.offset, 1)
+            )
+            count = min(count, _ZIP64_COUNT_LIMIT)
+            size = min(size, _ZIP64_LIMIT)
+            start = min(start, _ZIP64_LIMIT)
+        self.fp.write(
+            END_RECORD.pack(END_RECORD_SIGNATURE, 0, 0, count, count, size, start, 0)
+        )
+
+    def close(self):
+        if self.executor is None:
+            return
+        try:
+            while self.pending:
+                self._write_member(*self.pending.popleft())
+            self._write_central_directory()
+        finally:
+            self._shutdown()
+
+    def abort(self):
+        self.pending.clear()
+        self._shutdown()
+
+    def _shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+        self.executor = None
+        if self.own_fp:
+            self.fp.close()
+
+
+class ZipReader(object):
+    # The archive is mmapped. Opening it builds a dict from member names to
+    # the offsets of their central directory entries; the entries
+    # themselves are parsed on demand.
+    def __init__(self, path, workers=None):
+        self.fp = open(path, "rb")
+        self.mm = None
+        self.workers = workers or os.cpu_count() or 1
+        try:
+            self.mm = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.fp.close()
+            raise Exception("{} is not a zip file".format(path))
+        try:
+            self.index = self._read_central_directory()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+    def _find_end_record(self):
+        mm = self.mm
+        start = max(0, len(mm) - _MAX_END_SEARCH)
+        signature = struct.pack("<I", END_RECORD_SIGNATURE)
+        pos = mm.rfind(signature, start)
+        while pos != -1:
+            if pos + END_RECORD.size <= len(mm):
+                fields = END_RECORD.unpack_from(mm, pos)
+                if pos + END_RECORD.size + fields[7] == len(mm):
+                    return pos, fields
+            pos = mm.rfind(signature, start, pos)
+        raise Exception("not a zip file")
+
+    def _read_central_directory(self):
+        mm = self.mm
+        pos, fields = self._find_end_record()
+        count, size, start = fields[4], fields[5], fields[6]
+        locator = pos - ZIP64_LOCATOR.size
+        if locator >= 0 and ZIP64_LOCATOR.unpack_from(mm, locator)[0] == (
+            ZIP64_LOCATOR_SIGNATURE
+        ):
+            _, _, record, _ = ZIP64_LOCATOR.unpack_from(mm, locator)
+            fields = ZIP64_END_RECORD.unpack_from(mm, record)
+            if fields[0] != ZIP64_END_RECORD_SIGNATURE:
+                raise Exception("bad zip64 end of central directory record")
+            count, size, start = fields[7], fields[8], fields[9]
+        if start + size > len(mm):
+            raise Exception("truncated central directory")
+        index = {}
+        offset = start
+        for _ in range(count):
+            header = CENTRAL_HEADER.unpack_from(mm, offset)
+            if header[0] != CENTRAL_HEADER_SIGNATURE:
+                raise Exception("bad central directory entry at {}".format(offset))
+            name_size, extra_size, comment_size = header[10:13]
+            name = mm[
+                offset + CENTRAL_HEADER.size : offset + CENTRAL_HEADER.size + name_size
+            ]
+            index[name.decode("utf-8" if header[3] & FLAG_UTF8 else "cp437")] = offset
+            offset += CENTRAL_HEADER.size + name_size + extra_size + comment_size
+        return index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def namelist(self):
+        return list(self.index)
+
+    def infolist(self):
+        return [self.getinfo(name) for name in self.index]
+
+    def getinfo(self, name):
+        offset = self.index[name]
+        (
+            _,
+            _,
+            _,
+            flags,
+            method,
+            dos_time,
+            dos_date,
+            crc,
+            compress_size,
+            file_size,
+            name_size,
+            extra_size,
+            _,
+            _,
+            _,
+            external_attr,
+            header_offset,
+        ) = CENTRAL_HEADER.unpack_from(self.mm, offset)
+        pos = offset + CENTRAL_HEADER.size + name_size
+        end = pos + extra_size
+        while pos + EXTRA_HEADER.size <= end:
+            tag, size = EXTRA_HEADER.unpack_from(self.mm, pos)
+            pos += EXTRA_HEADER.size
+            if tag == ZIP64_EXTRA_ID:
+                values = list(
+                    struct.unpack_from("<{}Q".format(size // 8), self.mm, pos)
+                )
+                if file_size == _ZIP64_LIMIT:
+                    file_size = values.pop(0)
+                if compress_size == _ZIP64_LIMIT:
+                    compress_size = values.pop(0)
+                if header_offset == _ZIP64_LIMIT:
+                    header_offset = values.pop(0)
+            pos += size
+        return ZipInfo(
+            name=name,
+            method=method,
+            flags=flags,
+            date_time=_date_time(dos_time, dos_date),
+            crc=crc,
+            compress_size=compress_size,
+            file_size=file_size,
+            header_offset=header_offset,
+            external_attr=external_attr,
+        )
+
+    def _data_offset(self, info):
+        header = LOCAL_HEADER.unpack_from(self.mm, info.header_offset)
+        if header[0] != LOCAL_HEADER_SIGNATURE:
+            raise Exception("bad local header for {}".format(info.name))
+        start = info.header_offset + LOCAL_HEADER.size + header[9] + header[10]
+        if start + info.compress_size > len(self.mm):
+            raise Exception("truncated member {}".format(info.name))
+        return start
+
+    def readinto(self, name, buf):
+        # buf must hold exactly getinfo(name).file_size bytes
+        info = self.getinfo(name)
+        if _buffer.nbytes(buf) != info.file_size:
+            raise ValueError(
+                "{} needs a buffer of {} bytes".format(name, info.file_size)
+            )
+        start = self._data_offset(info)
+        src = memoryview(self.mm)[start : start + info.compress_size]
+        try:
+            if info.method == STORED:
+                if info.compress_size != info.file_size:
+                    raise Exception("bad stored member {}".format(name))
+                memoryview(buf).cast("B")[:] = src
+            elif info.method == DEFLATED:
+                stream.decompress_into(src, buf, stream.WB_RAW)
+            else:
+                raise Exception(
+                    "{} uses unsupported method {}".format(name, info.method)
+                )
+        finally:
+            src.release()
+        if _crc32(_buffer.addressof(buf), info.file_size) != info.crc:
+            raise Exception("crc mismatch in {}".format(name))
+        return info.file_size
+
+    def read(self, name):
+        buf = bytearray(self.getinfo(name).file_size)
+        self.readinto(name, buf)
+        return bytes(buf)
+
+    def read_many(self, names):
+        # Members are inflated on a thread pool; results keep the order of
+        # names
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            return list(executor.map(self.read, names))
+
+    def _extract(self, info, path):
+        if info.name.endswith("/"):
+            os.makedirs(path, exist_ok=True)
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w+b") as fp:
+            if info.file_size != 0:
+                # The output file is the preallocated buffer
+                fp.truncate(info.file_size)
+                with mmap.mmap(fp.fileno(), info.file_size) as mm:
+                    self.readinto(info.name, mm)
+        mode = info.external_attr >> 16
+        if mode & 0o777:
+            os.chmod(path, mode & 0o777)
+
+    def extractall(self, path=".", names=None):
+        if names is None:
+            names = self.namelist()
+        jobs = []
+        for name in names:
+            parts = name.split("/")
+            if name.startswith("/") or ".." in parts:
+                raise Exception("refusing to extract {}".format(name))
+            jobs.append((self.getinfo(name), os.path.join(path, *parts)))
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            for _ in executor.map(lambda job: self._extract(*job), jobs):
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create, list or extract zip files")
+    parser.add_argument("archive")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-c", "--create", nargs="+", metavar="FILE")
+    group.add_argument("-l", "--list", action="store_true")
+    group.add_argument("-x", "--extract", metavar="DIR")
+    parser.add_argument("-L", "--level", type=int, default=-1)
+    parser.add_argument("-j", "--jobs", type=int)
+    args = parser.parse_args()
+    if args.create:
+        with ZipWriter(args.archive, args.level, args.jobs) as writer:
+            for top in args.create:
+                if not os.path.isdir(top):
+                    writer.add_file(top)
+                    continue
+                for root, dirs, files in os.walk(top):
+                    dirs.sort()
+                    for name in sorted(files):
+                        writer.add_file(os.path.join(root, name))
+        return
+    with ZipReader(args.archive, args.jobs) as reader:
+        if args.list:
+            for info in reader.infolist():
+                print(
+                    "{}\t{}\t{}".format(info.file_size, info.compress_size, info.name)
+                )
+        else:
+            reader.extractall(args.extract)
+
+
+if __name__ == "__main__":
+    sys.exit(main())